@@ -0,0 +1,150 @@
+"""Load test: an alarm storm through ``alarm_mail`` into a local SMTP sink.
+
+Fires ``--events`` alarm events for ``--users`` users (each with
+``--recipients`` saved addresses) within one digest window, feeds them to
+``alarm_mail.queue_handler`` in stream-sized batches, then runs
+``alarm_mail.schedule_handler`` once the window has closed. Reports how
+many mails and SMTP connections that took against the number of events.
+Needs DynamoDB Local (see ``localdb``); the SMTP server is
+``localsmtp.LocalSMTPServer``. Usage::
+
+    python aws/bench/bench_alarm_mail.py --events 5000 --users 20 --recipients 3
+"""
+
+import argparse
+import json
+import os
+import time
+
+import localdb
+from localsmtp import LocalSMTPServer
+
+TABLES = {
+    "bench-alarm-outbox": ("pk", "eventId"),
+    "bench-alarm-emails": ("userId", "email"),
+}
+# As in template.yaml: the dispatcher queries this index instead of scanning.
+INDEXES = {
+    "bench-alarm-outbox": [{
+        "IndexName": "due",
+        "KeySchema": [
+            {"AttributeName": "dueShard", "KeyType": "HASH"},
+            {"AttributeName": "dueAt", "KeyType": "RANGE"},
+        ],
+        "Projection": {"ProjectionType": "ALL"},
+    }],
+}
+
+
+def _create_tables():
+    ddb = localdb.client()
+    for name, (hash_key, range_key) in TABLES.items():
+        try:
+            ddb.delete_table(TableName=name)
+            ddb.get_waiter("table_not_exists").wait(TableName=name)
+        except ddb.exceptions.ResourceNotFoundException:
+            pass
+        attributes = [
+            {"AttributeName": hash_key, "AttributeType": "S"},
+            {"AttributeName": range_key, "AttributeType": "S"},
+        ]
+        indexes = {"GlobalSecondaryIndexes": INDEXES[name]} if name in INDEXES else {}
+        if indexes:
+            attributes += [
+                {"AttributeName": "dueShard", "AttributeType": "N"},
+                {"AttributeName": "dueAt", "AttributeType": "N"},
+            ]
+        ddb.create_table(
+            TableName=name,
+            AttributeDefinitions=attributes,
+            KeySchema=[
+                {"AttributeName": hash_key, "KeyType": "HASH"},
+                {"AttributeName": range_key, "KeyType": "RANGE"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+            **indexes,
+        )
+
+
+def _record(event):
+    from boto3.dynamodb.types import TypeSerializer
+
+    serialize = TypeSerializer().serialize
+    image = {key: serialize(value) for key, value in event.items()}
+    return {"eventName": "INSERT", "dynamodb": {"NewImage": image}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--recipients", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    localdb.setup_env(args.endpoint)
+    _create_tables()
+    with LocalSMTPServer() as smtp:
+        os.environ.update(
+            ALARM_OUTBOX_TABLE="bench-alarm-outbox",
+            ALARM_EMAILS_TABLE="bench-alarm-emails",
+            SMTP_HOST=smtp.host,
+            SMTP_PORT=str(smtp.port),
+            SMTP_STARTTLS="0",
+            MAIL_RATE="1000",
+            MAIL_BURST="1000",
+        )
+        import alarm_mail
+        import dynamo
+
+        dynamo.batch_write("bench-alarm-emails", [
+            {"PutRequest": {"Item": {
+                "userId": f"user-{u}", "email": f"ops{r}@user{u}.test", "interval": 30,
+            }}}
+            for u in range(args.users)
+            for r in range(args.recipients)
+        ])
+
+        window = 30 * 60_000
+        start = int(time.time() * 1000) // window * window - 2 * window
+        records = [
+            _record({
+                "userId": f"user-{i % args.users}",
+                "eventId": f"{start + i:013d}#alarm-{i % 50}",
+                "alarmId": f"alarm-{i % 50}",
+                "alarmName": f"Alarma {i % 50}",
+                "deviceName": "Equipo",
+                "variable": "temp",
+                "condition": ">",
+                "value": 60,
+                "valorActual": 70 + i % 10,
+                "fecha": "",
+            })
+            for i in range(args.events)
+        ]
+
+        began = time.perf_counter()
+        queue_calls = 0
+        for i in range(0, len(records), args.batch):
+            alarm_mail.queue_handler({"Records": records[i:i + args.batch]}, None)
+            queue_calls += 1
+        queued_s = time.perf_counter() - began
+        counts = alarm_mail.schedule_handler({}, None)
+        dispatch_s = time.perf_counter() - began - queued_s
+
+    print(json.dumps({
+        "events": args.events,
+        "queueInvocations": queue_calls,
+        "dispatchInvocations": 1,
+        "mails": len(smtp.messages),
+        "smtpConnections": smtp.connections,
+        "maxMails": args.users * args.recipients,
+        "dispatch": counts,
+        "queueSeconds": round(queued_s, 2),
+        "dispatchSeconds": round(dispatch_s, 2),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Benchmark ``alarm_engine.evaluate`` for many rules on one variable.
+
+Builds ``--rules`` alarms on the same topic and variable (operators,
+thresholds, hysteresis and debounce drawn at random) and times evaluating
+stream batches of ``--samples`` messages against all of them, carrying the
+state from batch to batch as ``alarms.process`` does. No DynamoDB is
+involved; this measures the engine alone. Usage::
+
+    python aws/bench/bench_alarms.py --rules 1000 5000 --samples 100 1000
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import localdb
+
+
+def _rules(count, rng):
+    import alarm_engine
+
+    return [
+        {
+            "userId": "bench",
+            "alarmId": f"a{i}",
+            "topic": "device/sensor",
+            "variable": "temp",
+            "condition": alarm_engine.OPERATORS[i % len(alarm_engine.OPERATORS)],
+            "value": float(rng.integers(20, 80)),
+            "hysteresis": float(rng.integers(0, 5)),
+            "waitTime": float(rng.integers(0, 60)),
+        }
+        for i in range(count)
+    ]
+
+
+def run(rules, samples, batches, rng):
+    import numpy as np
+
+    import alarm_engine
+
+    group = alarm_engine.RuleIndex(rules).group("bench#device#sensor", "temp")
+    state = alarm_engine.initial_state(len(group))
+    timings, fired = [], 0
+    start = 1_700_000_000_000
+    for batch in range(batches):
+        ts = start + (batch * samples + np.arange(samples, dtype=np.int64)) * 1000
+        values = 50 + 30 * np.sin(ts / 60_000) + rng.normal(0, 5, samples)
+        began = time.perf_counter()
+        state, events, _ = alarm_engine.evaluate(group, ts, values, state)
+        timings.append((time.perf_counter() - began) * 1000)
+        fired += len(events)
+    return {
+        "rules": len(rules),
+        "samples": samples,
+        "p50_ms": round(statistics.median(timings), 3),
+        "max_ms": round(max(timings), 3),
+        "fired": fired,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rules", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--samples", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--batches", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    localdb.setup_env()
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    results = [
+        run(_rules(count, rng), samples, args.batches, rng)
+        for count in args.rules
+        for samples in args.samples
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
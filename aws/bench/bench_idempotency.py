@@ -0,0 +1,113 @@
+"""Load test: concurrent duplicate ``POST /tickets`` with ``Idempotency-Key``.
+
+Fires ``--duplicates`` copies of each of ``--keys`` requests at once from a
+pool of worker processes (each one a separate "container" with its own
+DynamoDB connections) against DynamoDB Local, then checks that every key
+produced exactly one ticket and that every response carried the same
+ticketId. Exits non-zero if any key was duplicated. Usage::
+
+    python aws/bench/bench_idempotency.py --keys 200 --duplicates 8 --workers 16
+"""
+
+import argparse
+import json
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import localdb
+
+TABLE = "bench-tickets-idempotency"
+
+
+def _init_worker(endpoint):
+    import os
+
+    localdb.setup_env(endpoint)
+    os.environ["TICKETS_TABLE"] = TABLE
+    os.environ["TICKETS_CACHE_TTL"] = "0"
+
+
+def _post(args):
+    import tickets
+
+    user_id, key = args
+    event = localdb.api_event(
+        "POST",
+        "/tickets",
+        headers={"Idempotency-Key": key},
+        body={
+            "userId": user_id,
+            "asunto": f"Duplicado {key}",
+            "tipo": "soporte",
+            "descripcion": "Reintento desde una conexion inestable",
+            "prioridad": "media",
+        },
+    )
+    result = tickets.lambda_handler(event, None)
+    body = json.loads(result["body"])
+    return key, result["statusCode"], body.get("ticketId")
+
+
+def _count_for_user(table, user_id):
+    count, kwargs = 0, {
+        "IndexName": "UserIdIndex",
+        "KeyConditionExpression": "userId = :u",
+        "ExpressionAttributeValues": {":u": user_id},
+        "Select": "COUNT",
+    }
+    while True:
+        page = table.query(**kwargs)
+        count += page["Count"]
+        if "LastEvaluatedKey" not in page:
+            return count
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--duplicates", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    endpoint = localdb.setup_env(args.endpoint)
+    localdb.create_tickets_table(TABLE, recreate=True)
+
+    user_id = f"bench-{uuid.uuid4().hex[:8]}"
+    keys = [str(uuid.uuid4()) for _ in range(args.keys)]
+    # Interleave duplicates so copies of the same key race each other.
+    jobs = [(user_id, key) for _ in range(args.duplicates) for key in keys]
+
+    started = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(endpoint,)) as pool:
+        results = list(pool.map(_post, jobs, chunksize=1))
+    elapsed = time.perf_counter() - started
+
+    ids_per_key, errors = {}, 0
+    for key, status, ticket_id in results:
+        if status != 201:
+            errors += 1
+        ids_per_key.setdefault(key, set()).add(ticket_id)
+
+    import dynamo
+
+    created = _count_for_user(dynamo.table(TABLE), user_id)
+    inconsistent = [key for key, ids in ids_per_key.items() if len(ids) != 1]
+    report = {
+        "requests": len(jobs),
+        "keys": len(keys),
+        "items_created": created,
+        "non_201_responses": errors,
+        "keys_with_divergent_ids": len(inconsistent),
+        "seconds": round(elapsed, 2),
+    }
+    print(json.dumps(report, indent=2))
+    if created != len(keys) or inconsistent or errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark: MQTT messages through ``ingest.Ingestor`` into DynamoDB Local.
+
+Starts ``localbroker.LocalBroker``, subscribes the worker to ``--users``
+wildcard filters over ``--connections`` connections, and has a separate
+process publish ``--messages`` device messages (``--devices`` x
+``--subtopics`` topics per user, ``--rate`` messages/s or as fast as the
+pipeline takes them) into it. Reports the sustained rate from the first
+message received to the last item written, and the write amplification:
+``BatchWriteItem`` calls and items written per message, against one
+``PutItem`` per message. With ``--qos 1`` messages are published and
+subscribed at QoS 1 and the broker counts the worker's acknowledgements.
+Needs DynamoDB Local (see ``localdb``)::
+
+    python aws/bench/bench_ingest.py --messages 50000 --users 10 --devices 20
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+
+import localdb
+from localbroker import LocalBroker
+
+TABLE = "bench-telemetry"
+
+
+def _topics(args):
+    return [
+        f"sait/user-{u}/device-{d}/sub-{s}"
+        for u in range(args.users)
+        for d in range(args.devices)
+        for s in range(args.subtopics)
+    ]
+
+
+def _publish(url, topics, messages, rate, publishers, qos=0):
+    """Publisher process: ``messages`` messages round-robin over ``topics``."""
+    localdb.setup_env()
+    from mqtt import MQTTClient
+
+    async def publisher(index, count):
+        async with MQTTClient(url, f"bench-pub-{index}", keepalive=0) as client:
+            interval = publishers / rate if rate else 0
+            started = time.perf_counter()
+            for i in range(count):
+                topic = topics[(i * publishers + index) % len(topics)]
+                body = {"payload": {"temp": 20 + i % 15 + 0.5, "hum": 40 + i % 30, "ok": True}}
+                await client.publish(topic, json.dumps(body).encode(), qos)
+                if interval:
+                    delay = started + (i + 1) * interval - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+
+    async def run():
+        share, extra = divmod(messages, publishers)
+        await asyncio.gather(*(publisher(i, share + (i < extra)) for i in range(publishers)))
+
+    asyncio.run(run())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--devices", type=int, default=20)
+    parser.add_argument("--subtopics", type=int, default=2)
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--publishers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="messages/s; 0 = unthrottled")
+    parser.add_argument("--queue", type=int, default=20_000)
+    parser.add_argument("--inflight", type=int, default=16)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--qos", type=int, choices=(0, 1), default=0)
+    parser.add_argument("--endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    localdb.setup_env(args.endpoint)
+    localdb.create_telemetry_table(TABLE, recreate=True)
+    import dynamo
+    from ingest import Ingestor
+
+    calls = {"BatchWriteItem": 0}
+
+    def count_call(**kwargs):
+        calls["BatchWriteItem"] += 1
+
+    dynamo.client.meta.events.register("after-call.dynamodb.BatchWriteItem", count_call)
+
+    subscriptions = [(f"user-{u}", f"sait/user-{u}/#") for u in range(args.users)]
+    with LocalBroker() as broker:
+        url = f"mqtt://{broker.host}:{broker.port}"
+        ingestor = Ingestor(
+            subscriptions, url=url, connections=args.connections, queue_size=args.queue,
+            flush_interval=args.flush_interval, max_inflight=args.inflight, table=TABLE,
+            qos=args.qos,
+        )
+        first = {}
+
+        async def done():
+            while ingestor.stats["connects"] < ingestor.connections:
+                await asyncio.sleep(0.05)
+            publisher = multiprocessing.get_context("spawn").Process(
+                target=_publish,
+                args=(url, _topics(args), args.messages, args.rate, args.publishers, args.qos),
+            )
+            publisher.start()
+            while not ingestor.stats["received"]:
+                await asyncio.sleep(0.001)
+            first["at"] = time.perf_counter()
+            seen, idle = 0, 0
+            while ingestor.stats["received"] < args.messages and idle < 40:
+                await asyncio.sleep(0.05)
+                stalled = not publisher.is_alive() and ingestor.stats["received"] == seen
+                idle = idle + 1 if stalled else 0
+                seen = ingestor.stats["received"]
+            publisher.join()
+
+        stats = asyncio.run(ingestor.run(until=done()))
+        elapsed = time.perf_counter() - first["at"]
+        acked = broker.acked
+
+    received = stats["received"]
+    print(json.dumps({
+        "messages": args.messages,
+        "received": received,
+        "written": stats["written"],
+        "retried": stats["retried"],
+        "rejected": stats["rejected"],
+        "acked": acked,
+        "invalid": stats["invalid"] + stats["unrouted"],
+        "seconds": round(elapsed, 2),
+        "sustainedMessagesPerSecond": round(stats["written"] / elapsed, 1),
+        "batchWriteItemCalls": calls["BatchWriteItem"],
+        "itemsPerCall": round(stats["written"] / max(1, calls["BatchWriteItem"]), 2),
+        "callsPerMessage": round(calls["BatchWriteItem"] / max(1, received), 4),
+        "writeAmplification": round(stats["written"] / max(1, received), 4),
+        "putItemCallsWithoutBatching": received,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compare ``GET /tickets`` via ``UserIdIndex`` with a Scan-and-filter listing.
+
+For each table size the benchmark seeds DynamoDB Local with tickets spread
+over ``--users`` users, then times, for a sample of users:
+
+* ``gsi``: one ``tickets.lambda_handler`` page (Query on ``UserIdIndex``),
+* ``scan``: the previous approach, a full-table Scan filtered on ``userId``.
+
+Seeding 1M items into DynamoDB Local takes a while; tables are reused
+between runs unless ``--reseed`` is given. Usage::
+
+    python aws/bench/bench_list.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+import localdb
+
+
+def seed(table_name, size, users):
+    import dynamo
+
+    table = dynamo.table(table_name)
+    with table.batch_writer() as batch:
+        for i in range(size):
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(1_700_000_000 + i * 60))
+            batch.put_item(
+                Item={
+                    "ticketId": f"t{i:08d}",
+                    "userId": f"user-{i % users}",
+                    "createdAt": created,
+                    "updatedAt": created,
+                    "status": "abierto",
+                    "asunto": f"Ticket {i}",
+                    "tipo": "soporte",
+                    "prioridad": "media",
+                    "descripcion": "x" * 200,
+                }
+            )
+
+
+def scan_and_filter(table, user_id):
+    kwargs = {"FilterExpression": "userId = :u", "ExpressionAttributeValues": {":u": user_id}}
+    items, scanned = [], 0
+    while True:
+        page = table.scan(**kwargs)
+        items.extend(page.get("Items", []))
+        scanned += page.get("ScannedCount", 0)
+        if "LastEvaluatedKey" not in page:
+            return items, scanned
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def _ms(samples):
+    return {"p50": round(statistics.median(samples), 2), "max": round(max(samples), 2)}
+
+
+def run(size, users, samples, limit, reseed):
+    import dynamo
+    import tickets
+
+    table_name = f"bench-tickets-{size}"
+    existed = table_name in localdb.client().list_tables()["TableNames"]
+    localdb.create_tickets_table(table_name, recreate=reseed)
+    if reseed or not existed:
+        seed(table_name, size, users)
+
+    tickets.table = table = dynamo.table(table_name)
+    gsi, scan, scanned = [], [], []
+    for n in range(samples):
+        user_id = f"user-{n % users}"
+        event = localdb.api_event("GET", "/tickets", query={"userId": user_id, "limit": str(limit)})
+        t0 = time.perf_counter()
+        tickets.lambda_handler(event, None)
+        gsi.append((time.perf_counter() - t0) * 1000)
+
+        t0 = time.perf_counter()
+        _, count = scan_and_filter(table, user_id)
+        scan.append((time.perf_counter() - t0) * 1000)
+        scanned.append(count)
+
+    return {
+        "size": size,
+        "gsi_page_ms": _ms(gsi),
+        "scan_filter_ms": _ms(scan),
+        "scan_items_read": int(statistics.mean(scanned)),
+        "gsi_items_read": limit,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=25)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    localdb.setup_env(args.endpoint)
+    results = [run(size, args.users, args.samples, args.limit, args.reseed) for size in args.sizes]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
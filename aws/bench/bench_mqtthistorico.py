@@ -0,0 +1,119 @@
+"""Benchmark: ``POST /mqtthistorico`` rows against ``format=columns``.
+
+Seeds ``--topics`` series of ``--history`` samples (``--variables``
+numeric fields each) in DynamoDB Local, then asks ``historical.get_latest``
+for the last ``--points`` samples of every topic in both shapes. For each
+it reports the handler time, the body size (raw and gzipped) and the time
+to turn the body into the ``{time, values}`` arrays the live widgets use:
+``json.loads`` plus the sort-and-rebuild loop of ``Dashboard.jsx`` for
+rows, ``json.loads`` alone for columns. Usage::
+
+    python aws/bench/bench_mqtthistorico.py --topics 20 --points 500
+"""
+
+import argparse
+import gzip
+import json
+import os
+import statistics
+import time
+from datetime import datetime
+
+import localdb
+
+TABLE = "bench-telemetry-latest"
+
+
+def _seed(args):
+    import dynamo
+
+    now = int(time.time() * 1000)
+    requests = []
+    for t in range(args.topics):
+        for i in range(args.history):
+            payload = {f"var{v}": (i * 7 + v * 13) % 1000 / 10 for v in range(args.variables)}
+            requests.append({"PutRequest": {"Item": {
+                "pk": {"S": f"bench-user#device-{t}#sub"},
+                "ts": {"N": str(now - (args.history - i) * 1000)},
+                "payload": {"M": {k: {"N": repr(v)} for k, v in payload.items()}},
+            }}})
+    failed = dynamo.batch_write(TABLE, requests, typed=True)
+    if failed:
+        raise SystemExit(f"{len(failed)} seed writes failed")
+
+
+def _structure_rows(raw):
+    """What ``Dashboard.jsx`` does with the row shape, line for line."""
+    structured = {}
+    for key, rows in json.loads(raw).items():
+        rows.sort(key=lambda row: datetime.fromisoformat(row["timestamp"].replace("Z", "+00:00")))
+        times, values = [], {}
+        for row in rows:
+            times.append(row["timestamp"])
+            for name, value in row["value"].items():
+                values.setdefault(name, []).append(value)
+        structured[key] = {"time": times, "values": values}
+    return structured
+
+
+def _structure_columns(raw):
+    return json.loads(raw)
+
+
+def _measure(historical, body, structure, repeat):
+    event = localdb.api_event("POST", "/mqtthistorico", body=body)
+    handler, parse = [], []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        result = historical.get_latest(event)
+        handler.append(time.perf_counter() - began)
+        raw = result["body"]
+        began = time.perf_counter()
+        structure(raw)
+        parse.append(time.perf_counter() - began)
+    encoded = raw.encode("utf-8")
+    return {
+        "handlerMs": round(statistics.median(handler) * 1000, 2),
+        "bytes": len(encoded),
+        "gzipBytes": len(gzip.compress(encoded)),
+        "parseMs": round(statistics.median(parse) * 1000, 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--history", type=int, default=1000)
+    parser.add_argument("--points", type=int, default=500)
+    parser.add_argument("--variables", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    localdb.setup_env(args.endpoint)
+    os.environ["TELEMETRY_TABLE"] = TABLE
+    localdb.create_telemetry_table(TABLE, recreate=True)
+    _seed(args)
+    import historical
+
+    body = {
+        "userId": "bench-user",
+        "topics": [{"device_id": f"device-{t}", "subtopic": "sub"} for t in range(args.topics)],
+        "points": args.points,
+    }
+    rows = _measure(historical, body, _structure_rows, args.repeat)
+    columns = _measure(historical, dict(body, format="columns"), _structure_columns, args.repeat)
+    print(json.dumps({
+        "topics": args.topics,
+        "points": args.points,
+        "variables": args.variables,
+        "rows": rows,
+        "columns": columns,
+        "bytesRatio": round(columns["bytes"] / rows["bytes"], 3),
+        "gzipBytesRatio": round(columns["gzipBytes"] / rows["gzipBytes"], 3),
+        "parseSpeedup": round(rows["parseMs"] / max(columns["parseMs"], 0.001), 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
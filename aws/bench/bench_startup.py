@@ -0,0 +1,85 @@
+"""Cold-start benchmark for ``tickets.lambda_handler``.
+
+Each run starts a fresh interpreter (the closest local analogue to a new
+Lambda container) and records:
+
+* ``import_ms``: time to ``import tickets`` (what the init phase pays),
+* ``first_ms``: latency of the first invocation in that process,
+* ``warm_ms``: latency of the second invocation, for comparison.
+
+Usage::
+
+    python aws/bench/bench_startup.py --runs 20 [--endpoint http://localhost:8000]
+
+Results are printed as JSON; pipe them to ``bench_output.txt`` to keep them.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, {here!r})
+import localdb
+localdb.setup_env()
+
+t0 = time.perf_counter()
+import tickets
+t1 = time.perf_counter()
+
+event = localdb.api_event("GET", "/tickets/{{ticketId}}", path_params={{"ticketId": "bench-missing"}})
+tickets.lambda_handler(event, None)
+t2 = time.perf_counter()
+tickets.lambda_handler(event, None)
+t3 = time.perf_counter()
+
+print(json.dumps({{
+    "import_ms": (t1 - t0) * 1000,
+    "first_ms": (t2 - t1) * 1000,
+    "warm_ms": (t3 - t2) * 1000,
+}}))
+"""
+
+
+def _summary(samples):
+    samples = sorted(samples)
+    return {
+        "min": round(samples[0], 2),
+        "p50": round(statistics.median(samples), 2),
+        "max": round(samples[-1], 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, HERE)
+    import localdb
+
+    localdb.setup_env(args.endpoint)
+    localdb.create_tickets_table()
+
+    code = CHILD.format(here=HERE)
+    runs = []
+    for _ in range(args.runs):
+        out = subprocess.run(
+            [sys.executable, "-c", code], check=True, capture_output=True, text=True, env=os.environ
+        )
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    report = {key: _summary([run[key] for run in runs]) for key in ("import_ms", "first_ms", "warm_ms")}
+    report["runs"] = len(runs)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Load test: dashboards on ``gateway.Gateway`` against ``localbroker.LocalBroker``.
+
+Runs the gateway in its own process, opens ``--dashboards`` WebSockets
+(one per simulated tab, spread over ``--users`` users, each signed in with
+a token as a browser would send it) that each subscribe
+to every topic of their user (``--devices`` x ``--subtopics``), then
+publishes ``--rate`` messages/s over all topics for ``--seconds``. A
+``--slow`` fraction of the dashboards read their socket only once a second
+to show samples being dropped rather than queued.
+
+Reports the broker connections the gateway used against the ones
+``MqttProvider.jsx`` would open (one per device per tab), and the gateway
+process's CPU while idle and under load, also scaled to 1,000 dashboards::
+
+    python aws/bench/load_gateway.py --dashboards 1000 --users 50 --rate 500
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import resource
+import secrets
+import time
+
+from localbroker import LocalBroker
+
+
+def _raise_fd_limit():
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def _serve_gateway(subscriptions, url, options, conn):
+    """Gateway process: serves until told to stop, answering ``stats`` requests."""
+    _raise_fd_limit()
+    from gateway import Gateway
+
+    async def run():
+        gateway = Gateway(subscriptions, url=url, **options)
+        server = await gateway.start("127.0.0.1", 0)
+        conn.send(server.sockets[0].getsockname()[1])
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await loop.run_in_executor(None, conn.recv)
+            if command == "stop":
+                break
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            conn.send(dict(
+                gateway.snapshot(),
+                cpuSeconds=usage.ru_utime + usage.ru_stime,
+                maxRssMb=round(usage.ru_maxrss / 1024, 1),
+            ))
+        await gateway.stop(server)
+
+    asyncio.run(run())
+
+
+def _topics(user, args):
+    return [
+        f"sait/user-{user}/device-{d}/sub-{s}"
+        for d in range(args.devices)
+        for s in range(args.subtopics)
+    ]
+
+
+def _token(key, user):
+    import jwt
+
+    return jwt.encode({"userId": f"user-{user}", "exp": int(time.time()) + 3600}, key)
+
+
+async def _dashboard(url, token, topics, slow, counts, ready):
+    from websockets.asyncio.client import connect
+
+    async with connect(url, subprotocols=["sait.v1", f"bearer.{token}"]) as ws:
+        await ws.send(json.dumps({"op": "subscribe", "topics": topics}))
+        reply = json.loads(await ws.recv())
+        counts["rejected"] += len(reply.get("rejected", []))
+        ready.release()
+        async for text in ws:
+            counts["frames"] += 1
+            counts["bytes"] += len(text)
+            if slow:
+                await asyncio.sleep(1.0)
+
+
+async def _load(args, gateway_port, broker_url, request, key):
+    from mqtt import MQTTClient
+
+    counts = {"frames": 0, "bytes": 0, "rejected": 0}
+    ready = asyncio.Semaphore(0)
+    slow = set(random.Random(7).sample(range(args.dashboards),
+                                       int(args.dashboards * args.slow)))
+    clients = []
+    for d in range(args.dashboards):
+        user = d % args.users
+        url = f"ws://127.0.0.1:{gateway_port}/"
+        clients.append(asyncio.ensure_future(
+            _dashboard(url, _token(key, user), _topics(user, args), d in slow, counts, ready)
+        ))
+        if d % 100 == 99:
+            await asyncio.sleep(0.05)
+    for _ in range(args.dashboards):
+        await ready.acquire()
+
+    await asyncio.sleep(1.0)
+    idle_start = await request("stats")
+    await asyncio.sleep(args.idle_seconds)
+    idle_end = await request("stats")
+
+    every_topic = [topic for user in range(args.users) for topic in _topics(user, args)]
+    sent = 0
+    async with MQTTClient(broker_url, "load-publisher", keepalive=0) as publisher:
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.seconds:
+            topic = every_topic[sent % len(every_topic)]
+            body = {"payload": {"temp": 20 + sent % 15, "hum": 40 + sent % 30}}
+            await publisher.publish(topic, json.dumps(body).encode())
+            sent += 1
+            delay = started + sent / args.rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elapsed = time.perf_counter() - started
+    await asyncio.sleep(1.0)
+    loaded = await request("stats")
+    for client in clients:
+        client.cancel()
+    return counts, sent, elapsed, idle_start, idle_end, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dashboards", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--subtopics", type=int, default=2)
+    parser.add_argument("--rate", type=float, default=500, help="published messages/s")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--idle-seconds", type=float, default=3)
+    parser.add_argument("--frame-rate", type=float, default=4)
+    parser.add_argument("--upstream", type=int, default=2)
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of slow readers")
+    args = parser.parse_args(argv)
+    _raise_fd_limit()
+
+    subscriptions = [(f"user-{u}", f"sait/user-{u}/#") for u in range(args.users)]
+    key = secrets.token_hex(32)
+    options = {"connections": args.upstream, "frame_rate": args.frame_rate, "linger": 1,
+               "token_key": key}
+    with LocalBroker() as broker:
+        broker_url = f"mqtt://{broker.host}:{broker.port}"
+        context = multiprocessing.get_context("spawn")
+        parent, child = context.Pipe()
+        process = context.Process(
+            target=_serve_gateway, args=(subscriptions, broker_url, options, child)
+        )
+        process.start()
+        gateway_port = parent.recv()
+
+        async def request(command):
+            parent.send(command)
+            return await asyncio.get_running_loop().run_in_executor(None, parent.recv)
+
+        async def run():
+            while (await request("stats"))["upstreamConnections"] < args.upstream:
+                await asyncio.sleep(0.1)
+            return await _load(args, gateway_port, broker_url, request, key)
+
+        counts, sent, elapsed, idle_start, idle_end, loaded = asyncio.run(run())
+        parent.send("stop")
+        process.join(timeout=10)
+
+    idle_cpu = (idle_end["cpuSeconds"] - idle_start["cpuSeconds"]) / args.idle_seconds
+    load_cpu = (loaded["cpuSeconds"] - idle_end["cpuSeconds"]) / (elapsed + 1.0)
+    per_thousand = 1000 / args.dashboards
+    print(json.dumps({
+        "dashboards": args.dashboards,
+        "websocketConnections": loaded["sessions"],
+        "upstreamBrokerConnections": loaded["upstreamConnections"],
+        "brokerConnectionsWithoutGateway": args.dashboards * args.devices,
+        "upstreamTopics": loaded["topics"],
+        "published": sent,
+        "publishedPerSecond": round(sent / elapsed, 1),
+        "framesSent": loaded["frames"],
+        "framesReceived": counts["frames"],
+        "megabytesReceived": round(counts["bytes"] / 1e6, 2),
+        "samplesCoalesced": loaded["dropped"],
+        "rejectedTopics": counts["rejected"],
+        "gatewayCpuIdlePercent": round(idle_cpu * 100, 2),
+        "gatewayCpuLoadPercent": round(load_cpu * 100, 2),
+        "gatewayCpuPercentPer1000Dashboards": round(load_cpu * 100 * per_thousand, 2),
+        "gatewayMaxRssMb": loaded["maxRssMb"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
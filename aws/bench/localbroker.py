@@ -0,0 +1,253 @@
+"""Local stand-in MQTT broker for the ingestion worker and its benchmark.
+
+Speaks the MQTT 3.1.1 subset the workers use: ``CONNECT`` (any
+credentials), ``SUBSCRIBE``/``UNSUBSCRIBE`` with ``+``/``#`` filters,
+``PUBLISH`` at QoS 0 and 1 (delivered at the lower of the publish and the
+subscription QoS; subscribers' ``PUBACK`` are counted in ``acked``),
+``PINGREQ`` and ``DISCONNECT``. No retained messages, persistent sessions,
+redelivery or TLS. Delivery waits for each subscriber's socket to drain, so
+a slow subscriber slows the publishers down instead of growing a queue::
+
+    with LocalBroker() as broker:
+        url = f"mqtt://{broker.host}:{broker.port}"
+        ...
+
+Run it on its own::
+
+    python aws/bench/localbroker.py --port 1883
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import struct
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda"))
+
+from mqtt import topic_matches  # noqa: E402
+
+CONNECT, CONNACK, PUBLISH, PUBACK = 1, 2, 3, 4
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def _string(value):
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+
+def _remaining_length(length):
+    out = bytearray()
+    while True:
+        length, digit = divmod(length, 128)
+        out.append(digit | (0x80 if length else 0))
+        if not length:
+            return bytes(out)
+
+
+def packet(kind, body=b"", flags=0):
+    return bytes([kind << 4 | flags]) + _remaining_length(len(body)) + body
+
+
+async def read_packet(reader):
+    """``(kind, flags, body)`` of the next packet; raises ``IncompleteReadError`` at EOF."""
+    first = (await reader.readexactly(1))[0]
+    length, shift = 0, 0
+    while True:
+        digit = (await reader.readexactly(1))[0]
+        length |= (digit & 0x7F) << shift
+        if not digit & 0x80:
+            break
+        shift += 7
+        if shift > 21:
+            raise ProtocolError("malformed remaining length")
+    body = await reader.readexactly(length) if length else b""
+    return first >> 4, first & 0x0F, body
+
+
+def read_string(body, offset):
+    (size,) = struct.unpack_from("!H", body, offset)
+    end = offset + 2 + size
+    return body[offset + 2:end].decode("utf-8"), end
+
+
+def publish_packet(topic, payload, qos=0, packet_id=None):
+    body = _string(topic)
+    if qos:
+        body += struct.pack("!H", packet_id)
+    return packet(PUBLISH, body + payload, qos << 1)
+
+
+def parse_publish(flags, body):
+    """``(topic, payload, qos, packet_id)`` of a ``PUBLISH`` body."""
+    topic, offset = read_string(body, 0)
+    qos = flags >> 1 & 0x03
+    packet_id = None
+    if qos:
+        (packet_id,) = struct.unpack_from("!H", body, offset)
+        offset += 2
+    return topic, body[offset:], qos, packet_id
+
+
+class _Session:
+    def __init__(self, writer):
+        self.writer = writer
+        self.filters = {}
+        self.lock = asyncio.Lock()
+        self.ids = itertools.cycle(range(1, 65536))
+
+    async def send(self, data):
+        async with self.lock:
+            self.writer.write(data)
+            await self.writer.drain()
+
+
+class LocalBroker:
+    """Asyncio broker on ``host:port`` (port 0 picks a free one), run in a thread."""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host, self.port = host, port
+        self.sessions = set()
+        self.connections = 0
+        self.published = 0
+        self.delivered = 0
+        self.acked = 0
+        self._routes = {}
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+
+    def _subscribers(self, topic):
+        route = self._routes.get(topic)
+        if route is None:
+            route = self._routes[topic] = []
+            for session in self.sessions:
+                granted = [qos for pattern, qos in session.filters.items()
+                           if topic_matches(pattern, topic)]
+                if granted:
+                    route.append((session, max(granted)))
+        return route
+
+    async def _publish(self, topic, payload, qos):
+        self.published += 1
+        for session, granted in self._subscribers(topic):
+            deliver = min(qos, granted)
+            packet_id = next(session.ids) if deliver else None
+            try:
+                await session.send(publish_packet(topic, payload, deliver, packet_id))
+                self.delivered += 1
+            except ConnectionError:
+                pass
+
+    async def _handle(self, reader, writer):
+        session = _Session(writer)
+        try:
+            kind, _, _ = await read_packet(reader)
+            if kind != CONNECT:
+                return
+            self.connections += 1
+            # Session present = 0: nothing is kept between connections.
+            await session.send(packet(CONNACK, b"\x00\x00"))
+            self.sessions.add(session)
+            while True:
+                kind, flags, body = await read_packet(reader)
+                if kind == PUBLISH:
+                    topic, payload, qos, packet_id = parse_publish(flags, body)
+                    if qos:
+                        await session.send(packet(PUBACK, struct.pack("!H", packet_id)))
+                    await self._publish(topic, payload, min(qos, 1))
+                elif kind == PUBACK:
+                    self.acked += 1
+                elif kind in (SUBSCRIBE, UNSUBSCRIBE):
+                    offset, filters = 2, {}
+                    while offset < len(body):
+                        topic, offset = read_string(body, offset)
+                        if kind == SUBSCRIBE:
+                            filters[topic] = min(body[offset], 1)
+                            offset += 1
+                        else:
+                            filters[topic] = None
+                    if kind == SUBSCRIBE:
+                        session.filters.update(filters)
+                        reply = packet(SUBACK, body[:2] + bytes(filters.values()))
+                    else:
+                        for topic in filters:
+                            session.filters.pop(topic, None)
+                        reply = packet(UNSUBACK, body[:2])
+                    self._routes.clear()
+                    await session.send(reply)
+                elif kind == PINGREQ:
+                    await session.send(packet(PINGRESP))
+                elif kind == DISCONNECT:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError, ProtocolError):
+            pass
+        finally:
+            if session in self.sessions:
+                self.sessions.discard(session)
+                self._routes.clear()
+            writer.close()
+
+    async def _serve(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start(self):
+        def run():
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(self._serve())
+            except asyncio.CancelledError:
+                pass
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        def cancel_all():
+            self._server.close()
+            for task in asyncio.all_tasks():
+                task.cancel()
+
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(cancel_all)
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args(argv)
+
+    broker = LocalBroker(args.host, args.port)
+    print(f"listening on {args.host}:{args.port}", flush=True)
+    try:
+        asyncio.run(broker._serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""DynamoDB Local helpers shared by the benchmarks in this directory.
+
+Start a local stand-in first, for example::
+
+    docker run --rm -p 8000:8000 amazon/dynamodb-local -jar DynamoDBLocal.jar -inMemory
+
+and point the benchmarks at it with ``DYNAMODB_ENDPOINT`` (defaults to
+``http://localhost:8000``). Dummy credentials are filled in when none are set.
+"""
+
+import os
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+
+
+def setup_env(endpoint=None):
+    """Prepare the environment so ``aws/lambda`` modules talk to DynamoDB Local."""
+    os.environ["DYNAMODB_ENDPOINT"] = endpoint or os.environ.get(
+        "DYNAMODB_ENDPOINT", "http://localhost:8000"
+    )
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "local")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "local")
+    # Keep benchmark output readable; set METRICS_ENABLED=1 to see EMF lines.
+    os.environ.setdefault("METRICS_ENABLED", "0")
+    if LAMBDA_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_DIR)
+    return os.environ["DYNAMODB_ENDPOINT"]
+
+
+def client():
+    import boto3
+
+    return boto3.client("dynamodb", endpoint_url=setup_env())
+
+
+def create_tickets_table(name="sait-tickets", recreate=False):
+    """Create the tickets table with the same keys and GSI as ``template.yaml``."""
+    ddb = client()
+    if name in ddb.list_tables()["TableNames"]:
+        if not recreate:
+            return name
+        ddb.delete_table(TableName=name)
+        ddb.get_waiter("table_not_exists").wait(TableName=name)
+    throughput = {"ReadCapacityUnits": 5, "WriteCapacityUnits": 5}
+    ddb.create_table(
+        TableName=name,
+        AttributeDefinitions=[
+            {"AttributeName": "ticketId", "AttributeType": "S"},
+            {"AttributeName": "userId", "AttributeType": "S"},
+            {"AttributeName": "createdAt", "AttributeType": "S"},
+        ],
+        KeySchema=[{"AttributeName": "ticketId", "KeyType": "HASH"}],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": "UserIdIndex",
+                "KeySchema": [
+                    {"AttributeName": "userId", "KeyType": "HASH"},
+                    {"AttributeName": "createdAt", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+                "ProvisionedThroughput": throughput,
+            }
+        ],
+        ProvisionedThroughput=throughput,
+    )
+    ddb.get_waiter("table_exists").wait(TableName=name)
+    return name
+
+
+def create_telemetry_table(name="sait-telemetry", recreate=False):
+    """Create a telemetry table keyed like ``TelemetryTable`` (``pk``/``ts``)."""
+    ddb = client()
+    if name in ddb.list_tables()["TableNames"]:
+        if not recreate:
+            return name
+        ddb.delete_table(TableName=name)
+        ddb.get_waiter("table_not_exists").wait(TableName=name)
+    ddb.create_table(
+        TableName=name,
+        AttributeDefinitions=[
+            {"AttributeName": "pk", "AttributeType": "S"},
+            {"AttributeName": "ts", "AttributeType": "N"},
+        ],
+        KeySchema=[
+            {"AttributeName": "pk", "KeyType": "HASH"},
+            {"AttributeName": "ts", "KeyType": "RANGE"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    ddb.get_waiter("table_exists").wait(TableName=name)
+    return name
+
+
+def api_event(method, resource, path_params=None, query=None, body=None, headers=None):
+    """Build a minimal API Gateway REST proxy event."""
+    import json
+
+    return {
+        "httpMethod": method,
+        "resource": resource,
+        "pathParameters": path_params,
+        "queryStringParameters": query,
+        "headers": headers or {},
+        "body": None if body is None else json.dumps(body),
+        "isBase64Encoded": False,
+    }
@@ -0,0 +1,140 @@
+"""Local stand-in SMTP server for the alarm mail dispatcher.
+
+Speaks just enough SMTP (``EHLO``/``HELO``, ``MAIL``, ``RCPT``, ``DATA``,
+``RSET``, ``NOOP``, ``QUIT``, no TLS or auth) for ``smtplib`` and keeps
+every message it accepts in memory, so ``alarm_mail`` can be run end to
+end without a real mail provider::
+
+    with LocalSMTPServer() as server:
+        os.environ.update(SMTP_HOST=server.host, SMTP_PORT=str(server.port),
+                          SMTP_STARTTLS="0")
+        ...
+        assert len(server.messages) == 1
+
+Run it on its own to watch what would be sent::
+
+    python aws/bench/localsmtp.py --port 1025
+"""
+
+import argparse
+import email
+import socketserver
+import threading
+from email import policy
+
+
+class _Session(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server.owner
+        with server.lock:
+            server.connections += 1
+        self._reply("220 localsmtp ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self._reply("250-localsmtp")
+                self._reply("250 8BITMIME")
+            elif verb == "HELO":
+                self._reply("250 localsmtp")
+            elif verb == "MAIL":
+                sender, recipients = command.partition(":")[2].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.partition(":")[2].strip().strip("<>")
+                if recipient in server.refuse:
+                    self._reply("550 5.1.1 Mailbox unavailable")
+                    continue
+                recipients.append(recipient)
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b".\r\n", b".\n"):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                message = email.message_from_bytes(b"".join(lines), policy=policy.default)
+                server.deliver(sender, recipients, message)
+                self._reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class LocalSMTPServer:
+    """Threaded SMTP sink on ``host:port`` (port 0 picks a free one).
+
+    Addresses in ``refuse`` are rejected at ``RCPT`` with a permanent 550,
+    like a mailbox that does not exist.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, echo=False, refuse=()):
+        self.messages = []
+        self.refuse = set(refuse)
+        self.connections = 0
+        self.echo = echo
+        self.lock = threading.Lock()
+        self._server = _Server((host, port), _Session)
+        self._server.owner = self
+        self.host, self.port = self._server.server_address
+        self._thread = None
+
+    def deliver(self, sender, recipients, message):
+        with self.lock:
+            self.messages.append((sender, recipients, message))
+        if self.echo:
+            print(f"--- {sender} -> {', '.join(recipients)}: {message['Subject']}", flush=True)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    args = parser.parse_args(argv)
+
+    server = LocalSMTPServer(args.host, args.port, echo=True)
+    print(f"listening on {server.host}:{server.port}", flush=True)
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Summarize EMF log lines from the SAIT Lambdas into per-route percentiles.
+
+Reads log text from files (or stdin), picks out the JSON lines written by
+``metrics.Invocation.finish`` (anything after a CloudWatch timestamp or
+request-id prefix is fine), and prints p50/p95/p99 per route for duration,
+DynamoDB latency, consumed capacity and response size, plus cold-start
+counts and init duration. Typical use::
+
+    aws logs tail /aws/lambda/TicketsFunction --since 1d > tickets.log
+    python aws/bench/report_metrics.py tickets.log
+    python aws/bench/report_metrics.py --json tickets.log > bench_output.txt
+"""
+
+import argparse
+import json
+import math
+import sys
+
+FIELDS = (
+    "HandlerDuration",
+    "DynamoDBLatency",
+    "DynamoDBCalls",
+    "ConsumedRCU",
+    "ConsumedWCU",
+    "ResponseBytes",
+)
+TABLE_FIELDS = ("HandlerDuration", "DynamoDBLatency", "ConsumedRCU", "ConsumedWCU", "ResponseBytes")
+PERCENTILES = (50, 95, 99)
+
+
+def parse_records(lines):
+    for line in lines:
+        start = line.find("{")
+        if start < 0 or '"_aws"' not in line:
+            continue
+        try:
+            record = json.loads(line[start:])
+        except ValueError:
+            continue
+        if isinstance(record, dict) and "Route" in record:
+            yield record
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(records):
+    routes = {}
+    for record in records:
+        key = f"{record.get('Service', '?')} {record['Route']}"
+        routes.setdefault(key, []).append(record)
+
+    report = {}
+    for key, rows in sorted(routes.items()):
+        entry = {"count": len(rows)}
+        for field in FIELDS:
+            values = sorted(float(row[field]) for row in rows if field in row)
+            entry[field] = {f"p{p}": percentile(values, p) for p in PERCENTILES}
+        init = sorted(float(row["InitDuration"]) for row in rows if "InitDuration" in row)
+        entry["coldStarts"] = sum(int(row.get("ColdStart", 0)) for row in rows)
+        entry["InitDuration"] = {f"p{p}": percentile(init, p) for p in PERCENTILES}
+        lookups = sum(row.get("CacheHits", 0) + row.get("CacheMisses", 0) for row in rows)
+        hits = sum(row.get("CacheHits", 0) for row in rows)
+        entry["cacheHitRate"] = round(hits / lookups, 4) if lookups else None
+        entry["errors"] = sum(1 for row in rows if int(row.get("StatusCode", 200)) >= 500)
+        report[key] = entry
+    return report
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    return f"{value:.0f}" if value >= 100 else f"{value:.2f}"
+
+
+def print_table(report, out=sys.stdout):
+    header = ["route", "n", "cold"]
+    header += [f"{field}.p{p}" for field in TABLE_FIELDS for p in PERCENTILES]
+    out.write("\t".join(header) + "\n")
+    for route, entry in report.items():
+        row = [route, str(entry["count"]), str(entry["coldStarts"])]
+        for field in TABLE_FIELDS:
+            row += [_fmt(entry[field][f"p{p}"]) for p in PERCENTILES]
+        out.write("\t".join(row) + "\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("logs", nargs="*", help="log files; stdin when omitted")
+    parser.add_argument("--json", action="store_true", help="print the full report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.logs:
+        records = []
+        for path in args.logs:
+            with open(path, encoding="utf-8", errors="replace") as handle:
+                records.extend(parse_records(handle))
+    else:
+        records = list(parse_records(sys.stdin))
+
+    report = summarize(records)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_table(report)
+
+
+if __name__ == "__main__":
+    main()
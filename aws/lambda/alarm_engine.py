@@ -0,0 +1,164 @@
+"""Vectorized evaluation of alarm rules against batches of telemetry.
+
+A rule is an alarm as ``Alarmas.jsx`` saves it: a ``topic`` and
+``variable``, a ``condition`` (one of ``OPERATORS``) and a threshold
+``value``, plus
+
+* ``waitTime``: debounce, in seconds. The condition must hold for this long
+  before the alarm fires, as the browser's ``setTimeout`` did.
+* ``hysteresis``: once the condition holds, it is only considered gone
+  when the value moves this far back past the threshold (``>`` and ``>=``
+  clear below ``value - hysteresis``, ``<`` and ``<=`` above
+  ``value + hysteresis``, ``==`` outside ``value ± hysteresis``). It has no
+  meaning for ``!=`` and is ignored there.
+
+:class:`RuleIndex` groups rules by ``(series, variable)`` into parallel
+arrays, so :func:`evaluate` compares every sample of a batch against every
+rule on that variable as one ``rules x samples`` NumPy operation, and the
+set/reset and debounce state machines are resolved with cumulative maxima
+instead of a Python loop per sample.
+"""
+
+import numpy as np
+
+import telemetry
+
+OPERATORS = (">", "<", "==", ">=", "<=", "!=")
+
+# (trips, holds) for values ``v`` against thresholds ``t`` with hysteresis ``h``.
+_TESTS = {
+    ">": lambda v, t, h: (v > t, v > t - h),
+    "<": lambda v, t, h: (v < t, v < t + h),
+    "==": lambda v, t, h: (v == t, np.abs(v - t) <= h),
+    ">=": lambda v, t, h: (v >= t, v >= t - h),
+    "<=": lambda v, t, h: (v <= t, v <= t + h),
+    "!=": lambda v, t, h: (v != t, v != t),
+}
+
+NO_TIME = -1
+
+
+def _number(value, default=0.0):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return number if np.isfinite(number) else default
+
+
+def rule_series(rule):
+    """Telemetry series a rule watches, or None if its topic cannot be read."""
+    device_id, subtopic = telemetry.split_topic(rule.get("topic") or "")
+    if not rule.get("userId") or not device_id or not subtopic:
+        return None
+    return telemetry.series_id(rule["userId"], device_id, subtopic)
+
+
+class RuleGroup:
+    """The rules on one ``(series, variable)``, as parallel arrays."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.operator = np.array([OPERATORS.index(rule["condition"]) for rule in rules])
+        self.threshold = np.array([_number(rule.get("value")) for rule in rules])
+        self.hysteresis = np.abs([_number(rule.get("hysteresis")) for rule in rules])
+        self.debounce_ms = np.array(
+            [int(_number(rule.get("waitTime")) * 1000) for rule in rules], dtype=np.int64
+        )
+
+    def __len__(self):
+        return len(self.rules)
+
+
+class RuleIndex:
+    """Rules grouped by ``(series, variable)``; rules that cannot be evaluated are skipped."""
+
+    def __init__(self, rules):
+        grouped = {}
+        self.skipped = 0
+        for rule in rules:
+            series = rule_series(rule)
+            if series is None or not rule.get("variable") or rule.get("condition") not in _TESTS:
+                self.skipped += 1
+                continue
+            grouped.setdefault((series, rule["variable"]), []).append(rule)
+        self.groups = {key: RuleGroup(group) for key, group in grouped.items()}
+        self.by_series = {}
+        for series, variable in self.groups:
+            self.by_series.setdefault(series, []).append(variable)
+
+    def __len__(self):
+        return sum(len(group) for group in self.groups.values())
+
+    def variables(self, series):
+        return self.by_series.get(series, ())
+
+    def group(self, series, variable):
+        return self.groups[(series, variable)]
+
+
+def initial_state(size):
+    """State of rules that have never seen a sample."""
+    return {
+        "condition": np.zeros(size, dtype=bool),
+        "since": np.full(size, NO_TIME, dtype=np.int64),
+        "active": np.zeros(size, dtype=bool),
+        "lastTs": np.full(size, NO_TIME, dtype=np.int64),
+    }
+
+
+def _carry(marks):
+    """Along each row, the column of the latest mark at or before each column (-1 if none)."""
+    columns = np.where(marks, np.arange(marks.shape[1]), -1)
+    return np.maximum.accumulate(columns, axis=1)
+
+
+def evaluate(group, ts, values, state):
+    """Run the samples ``(ts, values)`` through every rule of ``group``.
+
+    ``ts`` must be sorted. ``state`` holds one array per field of
+    :func:`initial_state`, aligned with ``group.rules``; samples at or before
+    a rule's ``lastTs`` were already seen by it and are skipped, so a
+    replayed batch fires nothing new. Returns ``(state, fired, cleared)``:
+    the state after the batch, ``(rule, sample)`` index pairs for each
+    alarm that fired, and the rule indices whose alarm went back to normal.
+    """
+    v, cols = values[None, :], ts[None, :]
+    trips = np.zeros((len(group), len(ts)), dtype=bool)
+    holds = np.zeros_like(trips)
+    for code, name in enumerate(OPERATORS):
+        rows = np.flatnonzero(group.operator == code)
+        if rows.size:
+            trips[rows], holds[rows] = _TESTS[name](
+                v, group.threshold[rows, None], group.hysteresis[rows, None]
+            )
+
+    # ts is sorted, so already-seen samples are a prefix of each row.
+    fresh = cols > state["lastTs"][:, None]
+    sets = trips & fresh
+    resets = ~holds & fresh
+    last_set = _carry(sets)
+    last_reset = _carry(resets)
+    condition = np.where(
+        (last_set < 0) & (last_reset < 0), state["condition"][:, None], last_set > last_reset
+    )
+
+    previous = np.concatenate([state["condition"][:, None], condition[:, :-1]], axis=1)
+    starts = np.where(condition & ~previous, cols, NO_TIME)
+    since = np.maximum.accumulate(starts, axis=1)
+    since = np.where(since == NO_TIME, state["since"][:, None], since)
+    confirmed = condition & (cols - since >= group.debounce_ms[:, None])
+    confirmed = np.where(fresh, confirmed, state["active"][:, None])
+
+    was = np.concatenate([state["active"][:, None], confirmed[:, :-1]], axis=1)
+    fired = np.argwhere(confirmed & ~was)
+    active = confirmed[:, -1]
+    cleared = np.flatnonzero(state["active"] & ~active)
+
+    new_state = {
+        "condition": condition[:, -1],
+        "since": np.where(condition[:, -1], since[:, -1], NO_TIME),
+        "active": active,
+        "lastTs": np.maximum(state["lastTs"], ts[-1]),
+    }
+    return new_state, [tuple(pair) for pair in fired], cleared
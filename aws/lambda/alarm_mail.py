@@ -0,0 +1,459 @@
+"""Alarm e-mail digests: one mail per recipient per ``interval``, not per alarm.
+
+Fired alarms (see ``alarms``) reach recipients in two steps:
+
+``queue_handler`` runs on the ``ALARM_EVENTS_TABLE`` stream and files each
+event in ``ALARM_OUTBOX_TABLE`` once per recipient, under the digest window
+the event falls in::
+
+    pk        "<recipient>#<window start, epoch ms>"
+    eventId   as in the events table
+    dueAt     window end, epoch ms; the digest is sent after it
+    dueShard  0 .. DUE_SHARDS - 1, from the recipient; with dueAt, the key
+              of the ``due`` index the dispatcher queries
+    ...       the event's fields, plus expiresAt (TTL)
+
+Recipients are the alarm's ``emailRecipients`` or, when it has none, the
+addresses the user saved through ``/correo`` in ``ALARM_EMAILS_TABLE``.
+The window length is the ``interval`` (minutes) saved with those
+addresses, ``DEFAULT_INTERVAL_MINUTES`` otherwise. Events are keyed by
+their id, so a retried stream batch files nothing twice.
+
+``schedule_handler`` runs every minute. It finds the windows that have
+closed by querying the ``due`` index, one partition per shard, so the cost
+follows the mail due rather than the size of the outbox. It sends each one
+as a single digest over one reused SMTP connection (:class:`SMTPPool`)
+and deletes it from the outbox. Sending is paced by a global token bucket
+(``MAIL_RATE``/``MAIL_BURST``, the provider's quota) and by one bucket per
+recipient (``RECIPIENT_MAILS_PER_HOUR``); a digest over its recipient's
+budget waits for a later run. However many alarms fire, a recipient gets
+at most one mail per window and the dispatcher runs once a minute.
+
+A digest the server fails to take stays in the outbox for the next run,
+counts as ``failed`` and gives its recipient's token back; one bad digest
+does not stop the others. When
+the server refuses the recipient permanently (5xx), the digest is moved to
+``dead#<pk>`` and the address is quarantined (``quarantine#<recipient>``)
+for ``QUARANTINE_DAYS``; digests for it are dead-lettered without being
+sent. Neither kind of row is in the ``due`` index.
+"""
+
+import os
+import time
+import zlib
+from collections import OrderedDict
+
+import metrics
+
+import dynamo
+import telemetry
+from ratelimit import TokenBucket
+from ttlcache import TTLCache
+
+ALARM_OUTBOX_TABLE = os.environ.get("ALARM_OUTBOX_TABLE", "sait-alarm-outbox")
+ALARM_EMAILS_TABLE = os.environ.get("ALARM_EMAILS_TABLE", "sait-alarm-emails")
+DEFAULT_INTERVAL_MINUTES = int(os.environ.get("ALARM_MAIL_INTERVAL_MINUTES", "30"))
+ALARM_OUTBOX_DUE_INDEX = os.environ.get("ALARM_OUTBOX_DUE_INDEX", "due")
+DUE_SHARDS = int(os.environ.get("ALARM_OUTBOX_DUE_SHARDS", "4"))
+OUTBOX_TTL_DAYS = 7
+QUARANTINE_DAYS = int(os.environ.get("ALARM_MAIL_QUARANTINE_DAYS", "30"))
+MAX_DIGEST_ROWS = 50
+
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", "587"))
+SMTP_USER = os.environ.get("SMTP_USER") or None
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD") or None
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "1") != "0"
+SMTP_MAX_IDLE = float(os.environ.get("SMTP_MAX_IDLE", "60"))
+MAIL_FROM = os.environ.get("MAIL_FROM", "alarmas@sait.local")
+
+MAIL_RATE = float(os.environ.get("MAIL_RATE", "10"))
+MAIL_BURST = float(os.environ.get("MAIL_BURST", "20"))
+RECIPIENT_MAILS_PER_HOUR = float(os.environ.get("RECIPIENT_MAILS_PER_HOUR", "6"))
+
+# Stop picking up digests this close to the Lambda timeout.
+RESERVE_MS = 5000
+
+_settings = TTLCache(maxsize=1024, ttl=60)
+_quarantine = TTLCache(maxsize=1024, ttl=300)
+
+
+class SMTPPool:
+    """Keeps one SMTP connection open across warm invocations.
+
+    :meth:`send` reuses the connection while it is fresh, checks it with
+    ``NOOP`` after ``max_idle`` seconds and reconnects once if the server
+    dropped it.
+    """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, user=SMTP_USER, password=SMTP_PASSWORD,
+                 starttls=SMTP_STARTTLS, max_idle=SMTP_MAX_IDLE, timeout=10):
+        self.host, self.port = host, port
+        self.user, self.password = user, password
+        self.starttls = starttls
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connects = 0
+        self._smtp = None
+        self._used = 0.0
+
+    def _connect(self):
+        import smtplib
+
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.user:
+            smtp.login(self.user, self.password)
+        self.connects += 1
+        return smtp
+
+    def _connection(self):
+        import smtplib
+
+        if self._smtp is not None and time.monotonic() - self._used > self.max_idle:
+            try:
+                if self._smtp.noop()[0] != 250:
+                    self.close()
+            except (smtplib.SMTPException, OSError):
+                self.close()
+        if self._smtp is None:
+            self._smtp = self._connect()
+        return self._smtp
+
+    def send(self, message):
+        import smtplib
+
+        for attempt in (0, 1):
+            try:
+                self._connection().send_message(message)
+                self._used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None:
+            try:
+                smtp.quit()
+            except Exception:
+                smtp.close()
+
+
+pool = SMTPPool()
+mail_bucket = TokenBucket(MAIL_RATE, capacity=MAIL_BURST)
+_recipient_buckets = OrderedDict()
+
+
+def recipient_bucket(recipient, max_recipients=10_000):
+    bucket = _recipient_buckets.get(recipient)
+    if bucket is None:
+        rate = RECIPIENT_MAILS_PER_HOUR / 3600
+        bucket = _recipient_buckets[recipient] = TokenBucket(rate, capacity=1)
+        while len(_recipient_buckets) > max_recipients:
+            _recipient_buckets.popitem(last=False)
+    _recipient_buckets.move_to_end(recipient)
+    return bucket
+
+
+def user_settings(user_id):
+    """``(emails, interval_ms)`` saved through ``/correo`` for ``user_id``."""
+    cached = _settings.get(user_id)
+    if cached is not None:
+        return cached
+    from boto3.dynamodb.conditions import Key
+
+    table = dynamo.table(ALARM_EMAILS_TABLE)
+    result = table.query(KeyConditionExpression=Key("userId").eq(user_id))
+    items = result.get("Items", [])
+    emails = [item["email"] for item in items if item.get("email")]
+    intervals = [int(item["interval"]) for item in items if item.get("interval")]
+    minutes = max(intervals) if intervals else DEFAULT_INTERVAL_MINUTES
+    cached = (emails, max(1, minutes) * 60_000)
+    _settings.set(user_id, cached)
+    return cached
+
+
+def due_shard(recipient):
+    # crc32 rather than hash(): the shard must not change between processes.
+    return zlib.crc32(recipient.encode("utf-8")) % DUE_SHARDS
+
+
+def outbox_items(event):
+    """Outbox rows for one alarm event, one per recipient."""
+    emails, interval = user_settings(event["userId"])
+    recipients = event.get("emailRecipients") or emails
+    fired_at = int(event["eventId"].partition("#")[0])
+    window = fired_at - fired_at % interval
+    items = []
+    for recipient in dict.fromkeys(address.strip().lower() for address in recipients):
+        if "@" not in recipient:
+            continue
+        item = {key: value for key, value in event.items() if key != "emailRecipients"}
+        item.update({
+            "pk": f"{recipient}#{window}",
+            "recipient": recipient,
+            "dueAt": window + interval,
+            "dueShard": due_shard(recipient),
+            "expiresAt": (window + interval) // 1000 + OUTBOX_TTL_DAYS * 86_400,
+        })
+        items.append(item)
+    return items
+
+
+def queue_handler(event, context):
+    records = event.get("Records", [])
+    invocation = metrics.begin("alarm-mail", "queue")
+    status = 500
+    try:
+        requests = []
+        for record in records:
+            image = record.get("dynamodb", {}).get("NewImage")
+            if record.get("eventName") != "INSERT" or not image:
+                continue
+            for item in outbox_items(dynamo.deserialize_item(image)):
+                requests.append({"PutRequest": {"Item": item}})
+        failed = dynamo.batch_write(ALARM_OUTBOX_TABLE, requests)
+        if failed:
+            # Rows are keyed by event id, so the stream retrying is safe.
+            raise RuntimeError(f"{len(failed)} outbox writes were not processed")
+        status = 200
+        return {"records": len(records), "queued": len(requests)}
+    finally:
+        invocation.finish(status, 0)
+
+
+def due_digests(now_ms):
+    """``{pk: [rows]}`` of every window that closed by ``now_ms``, oldest first."""
+    from boto3.dynamodb.conditions import Key
+
+    table = dynamo.table(ALARM_OUTBOX_TABLE)
+    digests = {}
+    for shard in range(DUE_SHARDS):
+        kwargs = {}
+        while True:
+            page = table.query(
+                IndexName=ALARM_OUTBOX_DUE_INDEX,
+                KeyConditionExpression=Key("dueShard").eq(shard) & Key("dueAt").lte(int(now_ms)),
+                **kwargs,
+            )
+            for item in page.get("Items", []):
+                digests.setdefault(item["pk"], []).append(item)
+            if "LastEvaluatedKey" not in page:
+                break
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+    return dict(sorted(digests.items(), key=lambda entry: entry[1][0]["dueAt"]))
+
+
+def quarantined(recipient):
+    """The reason ``recipient`` was quarantined, or None."""
+    cached = _quarantine.get(recipient)
+    if cached is not None:
+        return cached or None
+    item = dynamo.table(ALARM_OUTBOX_TABLE).get_item(
+        Key={"pk": f"quarantine#{recipient}", "eventId": "-"}
+    ).get("Item")
+    # TTL deletes lag by up to a couple of days; an expired marker no longer counts.
+    if item and int(item.get("expiresAt", 0)) <= time.time():
+        item = None
+    reason = item.get("reason", "refused") if item else ""
+    _quarantine.set(recipient, reason)
+    return reason or None
+
+
+def dead_letter(pk, rows, reason, now_ms):
+    """Move a digest out of the ``due`` index to ``dead#<pk>`` and quarantine its recipient."""
+    recipient = rows[0]["recipient"]
+    expires_at = now_ms // 1000 + QUARANTINE_DAYS * 86_400
+    dead = []
+    for row in rows:
+        item = {key: value for key, value in row.items() if key != "dueShard"}
+        item.update({"pk": f"dead#{pk}", "reason": reason, "expiresAt": expires_at})
+        dead.append({"PutRequest": {"Item": item}})
+    if not quarantined(recipient):
+        dead.append({"PutRequest": {"Item": {
+            "pk": f"quarantine#{recipient}",
+            "eventId": "-",
+            "recipient": recipient,
+            "reason": reason,
+            "quarantinedAt": now_ms,
+            "expiresAt": expires_at,
+        }}})
+        _quarantine.set(recipient, reason)
+    if dynamo.batch_write(ALARM_OUTBOX_TABLE, dead):
+        return  # the digest stays due and is dead-lettered again next run
+    _delete(pk, rows)
+
+
+def _delete(pk, rows):
+    keys = [{"pk": pk, "eventId": row["eventId"]} for row in rows]
+    # A failed delete only means the digest is handled again next run.
+    dynamo.batch_write(ALARM_OUTBOX_TABLE, [{"DeleteRequest": {"Key": key}} for key in keys])
+
+
+def backfill_due_shards():
+    """Give rows queued before the ``due`` index existed a ``dueShard``; returns the count."""
+    table = dynamo.table(ALARM_OUTBOX_TABLE)
+    updated = 0
+    for items, _ in dynamo.scan_segment(
+        ALARM_OUTBOX_TABLE, 0, 1,
+        FilterExpression="attribute_not_exists(dueShard) AND attribute_exists(dueAt)"
+        " AND NOT begins_with(pk, :dead)",
+        ExpressionAttributeValues={":dead": {"S": "dead#"}},
+    ):
+        for item in items:
+            table.update_item(
+                Key={"pk": item["pk"], "eventId": item["eventId"]},
+                UpdateExpression="SET dueShard = :shard",
+                ConditionExpression="attribute_exists(pk)",
+                ExpressionAttributeValues={":shard": due_shard(item["recipient"])},
+            )
+            updated += 1
+    return updated
+
+
+def _cell(value):
+    return "" if value is None else str(value)
+
+
+def render_digest(recipient, rows):
+    """One ``EmailMessage`` listing ``rows`` (outbox items), newest first."""
+    from email.message import EmailMessage
+    from html import escape
+
+    rows = sorted(rows, key=lambda row: row["eventId"], reverse=True)
+    shown, hidden = rows[:MAX_DIGEST_ROWS], len(rows) - MAX_DIGEST_ROWS
+    headers = ("Alarma", "Dispositivo", "Variable", "Condición", "Valor Actual", "Fecha")
+    table = [
+        (
+            row.get("alarmName"),
+            row.get("deviceName"),
+            row.get("variable"),
+            f"{row.get('condition')} {_cell(row.get('value'))}",
+            row.get("valorActual"),
+            row.get("fecha"),
+        )
+        for row in shown
+    ]
+    more = f"y {hidden} alertas más" if hidden > 0 else ""
+
+    message = EmailMessage()
+    message["From"] = MAIL_FROM
+    message["To"] = recipient
+    plural = "alerta activada" if len(rows) == 1 else "alertas activadas"
+    message["Subject"] = f"SAIT: {len(rows)} {plural}"
+    text = ["\t".join(headers)] + ["\t".join(_cell(cell) for cell in line) for line in table]
+    message.set_content("\n".join(text + ([more] if more else [])) + "\n")
+    html_rows = "".join(
+        "<tr>" + "".join(f"<td>{escape(_cell(cell))}</td>" for cell in line) + "</tr>"
+        for line in table
+    )
+    head = "".join(f"<th>{escape(name)}</th>" for name in headers)
+    message.add_alternative(
+        f"<table border='1' cellpadding='4'><tr>{head}</tr>{html_rows}</table>"
+        + (f"<p>{escape(more)}</p>" if more else ""),
+        subtype="html",
+    )
+    return message
+
+
+def send_digest(recipient, rows):
+    """Send one digest; returns ``(sent, refusal)``.
+
+    ``refusal`` is the server's reply when it refused the recipient for
+    good (5xx). Other failures give ``(False, None)`` and the digest is
+    retried next run; losing the server raises ``OSError``.
+    """
+    import smtplib
+
+    try:
+        pool.send(render_digest(recipient, rows))
+    except smtplib.SMTPRecipientsRefused as err:
+        refusals = list(err.recipients.values())
+        if refusals and all(code >= 500 for code, _ in refusals):
+            code, text = refusals[0]
+            return False, f"{code} {text.decode('utf-8', 'replace')}"
+        return False, None
+    except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as err:
+        raise ConnectionError(str(err)) from err
+    except smtplib.SMTPException:
+        pool.close()
+        return False, None
+    return True, None
+
+
+def dispatch(now_ms, remaining_ms=lambda: float("inf")):
+    """Send every closed window as one digest; returns counts for the log line."""
+    counts = {"digests": 0, "sent": 0, "events": 0, "deferred": 0, "failed": 0, "deadLettered": 0}
+    unreachable = False
+    for pk, rows in due_digests(now_ms).items():
+        counts["digests"] += 1
+        if unreachable or remaining_ms() < RESERVE_MS:
+            counts["deferred"] += 1
+            continue
+        recipient = rows[0]["recipient"]
+        reason = quarantined(recipient)
+        if reason:
+            dead_letter(pk, rows, reason, now_ms)
+            counts["deadLettered"] += 1
+            continue
+        bucket = recipient_bucket(recipient)
+        if not bucket.try_acquire():
+            counts["deferred"] += 1
+            continue
+        mail_bucket.acquire()
+        try:
+            sent, reason = send_digest(recipient, rows)
+        except OSError:
+            # No server to talk to: the rest of the run would only wait on timeouts.
+            pool.close()
+            unreachable = True
+            bucket.release()
+            counts["failed"] += 1
+            continue
+        if reason:
+            dead_letter(pk, rows, reason, now_ms)
+            counts["deadLettered"] += 1
+        elif not sent:
+            # Nothing reached the recipient, so the retry must not wait out their budget.
+            bucket.release()
+            counts["failed"] += 1
+        else:
+            counts["sent"] += 1
+            counts["events"] += len(rows)
+            _delete(pk, rows)
+    return counts
+
+
+def schedule_handler(event, context):
+    invocation = metrics.begin("alarm-mail", "dispatch")
+    status = 500
+    try:
+        remaining = getattr(context, "get_remaining_time_in_millis", None)
+        counts = dispatch(telemetry.now_ms(), remaining or (lambda: float("inf")))
+        status = 200
+        return counts
+    finally:
+        invocation.finish(status, 0)
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Alarm mail outbox maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill-due", help="add dueShard to rows queued before the due index")
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill-due":
+        print(json.dumps({"updated": backfill_due_shards()}))
+
+
+metrics.init_finished()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Server-side alarm evaluation and the alarm events the dashboard lists.
+
+``stream_handler`` runs on the telemetry table's stream, so alarms fire
+whether or not anyone has ``Alarmas.jsx`` open. Each batch is grouped by
+series and run through every rule on each ``(series, variable)`` at once
+(see ``alarm_engine``). Rules are the items the ``/alarms`` API saves in
+``ALARMS_TABLE``; they are scanned at most every ``RULES_TTL`` seconds per
+container.
+
+Per-rule evaluation state (hysteresis, debounce start, whether the alarm is
+active and the last sample seen) lives in ``ALARM_STATE_TABLE`` under
+``"<userId>#<alarmId>"``. Fired alarms go to ``ALARM_EVENTS_TABLE``::
+
+    userId    partition key
+    eventId   "<fired at, epoch ms, 13 digits>#<alarmId>", so events sort by time
+    alarmId, alarmName, deviceName, topic, variable, condition, value,
+    valorActual, fecha (ISO-8601), emailRecipients, expiresAt (TTL)
+
+Events are written before state, and event ids are derived from the sample
+that fired, so a retried batch rewrites the same events and then finds the
+samples already seen. The stream keeps each series on one shard, in order.
+
+Routes, as wired in ``template.yaml``::
+
+    GET /leeralertas?userId&limit&since   fired alarms, newest first
+"""
+
+import os
+import time
+from decimal import Decimal
+
+import metrics
+
+import numpy as np
+
+import alarm_engine
+import dynamo
+import telemetry
+from apigw import HttpError, query_params, response, route_handler
+from ttlcache import TTLCache
+
+ALARMS_TABLE = os.environ.get("ALARMS_TABLE", "sait-alarms")
+ALARM_STATE_TABLE = os.environ.get("ALARM_STATE_TABLE", "sait-alarm-state")
+ALARM_EVENTS_TABLE = os.environ.get("ALARM_EVENTS_TABLE", "sait-alarm-events")
+RULES_TTL = float(os.environ.get("ALARM_RULES_TTL", "60"))
+EVENT_TTL_DAYS = int(os.environ.get("ALARM_EVENT_TTL_DAYS", "90"))
+DEFAULT_EVENTS = 100
+MAX_EVENTS = 1000
+
+_rules = TTLCache(maxsize=1, ttl=RULES_TTL)
+
+
+def rule_index():
+    """:class:`alarm_engine.RuleIndex` of every saved alarm, cached for ``RULES_TTL``."""
+    index = _rules.get("all")
+    if index is None:
+        rules = []
+        for items, _ in dynamo.scan_segment(ALARMS_TABLE, 0, 1):
+            rules.extend(items)
+        index = alarm_engine.RuleIndex(rules)
+        _rules.set("all", index)
+    return index
+
+
+def state_key(rule):
+    return f"{rule['userId']}#{rule['alarmId']}"
+
+
+def batch_samples(records):
+    """``{series: (ts, payloads)}`` from stream records, each series sorted by time."""
+    samples = {}
+    for record in records:
+        if record.get("eventName") == "REMOVE":
+            continue
+        image = record.get("dynamodb", {}).get("NewImage") or {}
+        series = image.get("pk", {}).get("S")
+        ts = image.get("ts", {}).get("N")
+        if series and ts:
+            payload = image.get("payload", {}).get("M", {})
+            samples.setdefault(series, []).append((int(ts), payload))
+    out = {}
+    for series, rows in samples.items():
+        rows.sort(key=lambda row: row[0])
+        ts = np.array([row[0] for row in rows], dtype=np.int64)
+        out[series] = (ts, [row[1] for row in rows])
+    return out
+
+
+def _column(payloads, variable):
+    values = np.full(len(payloads), np.nan)
+    for i, payload in enumerate(payloads):
+        attr = payload.get(variable)
+        if attr is not None:
+            number = telemetry.attr_number(attr)
+            if number is not None:
+                values[i] = number
+    return values
+
+
+def load_state(rules):
+    """Evaluation state of ``rules`` from ``ALARM_STATE_TABLE``, as engine arrays."""
+    state = alarm_engine.initial_state(len(rules))
+    keys = [{"pk": state_key(rule)} for rule in rules]
+    items, failed = dynamo.batch_get(ALARM_STATE_TABLE, keys)
+    if failed:
+        raise RuntimeError(f"{len(failed)} alarm states could not be read")
+    position = {key["pk"]: i for i, key in enumerate(keys)}
+    for item in items:
+        i = position[item["pk"]]
+        state["condition"][i] = bool(item.get("condition"))
+        state["active"][i] = bool(item.get("active"))
+        state["since"][i] = int(item.get("since", alarm_engine.NO_TIME))
+        state["lastTs"][i] = int(item.get("lastTs", alarm_engine.NO_TIME))
+    return state
+
+
+def _number(value):
+    return Decimal(repr(float(value)))
+
+
+def _event(rule, fired_at, value):
+    return {
+        "userId": rule["userId"],
+        "eventId": f"{fired_at:013d}#{rule['alarmId']}",
+        "alarmId": rule["alarmId"],
+        "alarmName": rule.get("alarmName") or rule.get("name"),
+        "deviceName": rule.get("deviceName"),
+        "topic": rule.get("topic"),
+        "variable": rule["variable"],
+        "condition": rule["condition"],
+        "value": rule.get("value"),
+        "valorActual": _number(value),
+        "fecha": telemetry.iso_ms(fired_at),
+        "emailRecipients": list(rule.get("emailRecipients") or []),
+        "expiresAt": fired_at // 1000 + EVENT_TTL_DAYS * 86_400,
+    }
+
+
+def _state_item(rule, state, i):
+    item = {
+        "pk": state_key(rule),
+        "condition": bool(state["condition"][i]),
+        "active": bool(state["active"][i]),
+        "lastTs": int(state["lastTs"][i]),
+    }
+    if state["since"][i] != alarm_engine.NO_TIME:
+        item["since"] = int(state["since"][i])
+    return item
+
+
+def _write(table_name, items):
+    failed = dynamo.batch_write(table_name, [{"PutRequest": {"Item": item}} for item in items])
+    if failed:
+        # Event ids and state are both derived from the samples, so the
+        # stream retrying the whole batch is safe.
+        raise RuntimeError(f"{len(failed)} writes to {table_name} were not processed")
+
+
+def process(records, index):
+    """Evaluate one stream batch against ``index``; returns counts for the log line."""
+    counts = {"records": len(records), "rules": 0, "fired": 0, "cleared": 0}
+    evaluated = []
+    for series, (ts, payloads) in batch_samples(records).items():
+        for variable in index.variables(series):
+            values = _column(payloads, variable)
+            present = ~np.isnan(values)
+            if present.any():
+                group = index.group(series, variable)
+                evaluated.append((group, ts[present], values[present]))
+    if not evaluated:
+        return counts
+
+    rules = [rule for group, _, _ in evaluated for rule in group.rules]
+    state = load_state(rules)
+    events, states, offset = [], [], 0
+    for group, ts, values in evaluated:
+        window = slice(offset, offset + len(group))
+        before = {name: column[window] for name, column in state.items()}
+        after, fired, cleared = alarm_engine.evaluate(group, ts, values, before)
+        for rule, sample in fired:
+            events.append(_event(group.rules[rule], int(ts[sample]), values[sample]))
+        changed = np.zeros(len(group), dtype=bool)
+        for name, column in after.items():
+            changed |= column != before[name]
+        states.extend(_state_item(group.rules[i], after, i) for i in np.flatnonzero(changed))
+        counts["rules"] += len(group)
+        counts["cleared"] += len(cleared)
+        offset += len(group)
+    counts["fired"] = len(events)
+
+    _write(ALARM_EVENTS_TABLE, events)
+    _write(ALARM_STATE_TABLE, states)
+    return counts
+
+
+def stream_handler(event, context):
+    records = event.get("Records", [])
+    invocation = metrics.begin("alarms", "stream")
+    status = 500
+    try:
+        started = time.perf_counter()
+        counts = process(records, rule_index())
+        counts["ms"] = round((time.perf_counter() - started) * 1000, 3)
+        status = 200
+        return counts
+    finally:
+        invocation.finish(status, 0)
+
+
+def get_events(event):
+    """Fired alarms of a user, newest first, as the ``Alertas Activadas`` table reads them."""
+    params = query_params(event)
+    user_id = params.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    try:
+        limit = int(params.get("limit") or DEFAULT_EVENTS)
+    except ValueError:
+        raise HttpError(400, "limit must be an integer") from None
+    if not 1 <= limit <= MAX_EVENTS:
+        raise HttpError(400, f"limit must be between 1 and {MAX_EVENTS}")
+
+    from boto3.dynamodb.conditions import Key
+
+    condition = Key("userId").eq(user_id)
+    if params.get("since"):
+        try:
+            since = telemetry.parse_time(params["since"], telemetry.time_zone(params))
+        except ValueError as err:
+            raise HttpError(400, f"since must be an ISO-8601 date or epoch: {err}") from None
+        condition &= Key("eventId").gte(f"{since:013d}")
+    result = dynamo.table(ALARM_EVENTS_TABLE).query(
+        KeyConditionExpression=condition, ScanIndexForward=False, Limit=limit
+    )
+    return response(200, result.get("Items", []))
+
+
+ROUTES = {
+    ("GET", "/leeralertas"): get_events,
+}
+
+
+lambda_handler = route_handler("alarms", ROUTES)
+
+
+metrics.init_finished()
@@ -0,0 +1,186 @@
+"""Helpers for API Gateway (REST, payload v1) proxy events and responses.
+
+Only the standard library (and ``metrics``, which uses nothing else) is
+imported here so that every Lambda in this package can use it without
+adding to its cold start.
+"""
+
+import json
+import logging
+import os
+from decimal import Decimal
+
+import metrics
+
+GZIP_MIN_BYTES = int(os.environ.get("GZIP_MIN_BYTES", "1024"))
+
+logger = logging.getLogger("apigw")
+
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": (
+        "Content-Type,Authorization,If-Match,If-None-Match,Idempotency-Key"
+    ),
+    "Access-Control-Allow-Methods": "GET,POST,PUT,PATCH,OPTIONS",
+    "Access-Control-Expose-Headers": (
+        "ETag,Idempotent-Replayed,Location,X-Cache,X-Cache-Hits,X-Cache-Misses"
+    ),
+}
+
+
+class HttpError(Exception):
+    """An error that maps directly onto an HTTP error response."""
+
+    def __init__(self, status, message, details=None, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+        self.headers = headers
+
+
+def _default(value):
+    # DynamoDB's resource API hands numbers back as Decimal.
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, set):
+        return sorted(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(body):
+    return json.dumps(body, default=_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def response(status, body=None, headers=None):
+    """Build a proxy integration response with a JSON body."""
+    out_headers = {"Content-Type": "application/json", **CORS_HEADERS}
+    if headers:
+        out_headers.update(headers)
+    return {
+        "statusCode": status,
+        "headers": out_headers,
+        "body": "" if body is None else dumps(body),
+    }
+
+
+def error_response(err):
+    body = {"error": err.message}
+    if err.details:
+        body.update(err.details)
+    return response(err.status, body, err.headers)
+
+
+def accepts_gzip(event):
+    accept = header(event, "Accept-Encoding") or ""
+    return any(part.split(";")[0].strip() == "gzip" for part in accept.lower().split(","))
+
+
+def maybe_gzip(event, resp, min_bytes=None):
+    """Gzip ``resp`` in place when the client accepts it and the body is large.
+
+    Small bodies are left alone: below ``GZIP_MIN_BYTES`` the CPU spent
+    compressing costs more than the bytes saved. The API needs ``*/*`` in its
+    binary media types for API Gateway to decode the base64 body.
+    """
+    body = resp.get("body")
+    threshold = GZIP_MIN_BYTES if min_bytes is None else min_bytes
+    if not body or resp.get("isBase64Encoded") or not accepts_gzip(event):
+        return resp
+    raw = body.encode("utf-8")
+    if len(raw) < threshold:
+        return resp
+    import base64
+    import gzip
+
+    resp["body"] = base64.b64encode(gzip.compress(raw, compresslevel=5)).decode("ascii")
+    resp["isBase64Encoded"] = True
+    resp["headers"]["Content-Encoding"] = "gzip"
+    resp["headers"]["Vary"] = "Accept-Encoding"
+    return resp
+
+
+def json_body(event):
+    """Return the decoded JSON request body, or raise a 400."""
+    raw = event.get("body")
+    if not raw:
+        raise HttpError(400, "Request body is required")
+    if event.get("isBase64Encoded"):
+        import base64
+
+        raw = base64.b64decode(raw)
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise HttpError(400, "Request body is not valid JSON") from None
+    if not isinstance(body, dict):
+        raise HttpError(400, "Request body must be a JSON object")
+    return body
+
+
+def query_params(event):
+    return event.get("queryStringParameters") or {}
+
+
+def path_params(event):
+    return event.get("pathParameters") or {}
+
+
+def header(event, name):
+    """Case-insensitive request header lookup."""
+    wanted = name.lower()
+    for key, value in (event.get("headers") or {}).items():
+        if key.lower() == wanted:
+            return value
+    return None
+
+
+def dispatch(event, routes, gzip=True):
+    """Run the handler ``routes`` has for ``event``'s method and resource.
+
+    Whatever happens the result is a response with the CORS headers: a
+    ``404`` for an unknown route, the error's response for an
+    :class:`HttpError`, and a logged ``500`` for anything else, which
+    API Gateway would otherwise turn into a bare ``502`` the browser
+    reports as a CORS failure.
+    """
+    if event.get("httpMethod") == "OPTIONS":
+        return response(204)
+    route = (event.get("httpMethod"), event.get("resource"))
+    handler = routes.get(route)
+    if handler is None:
+        return error_response(HttpError(404, "Route not found"))
+    try:
+        result = handler(event)
+        return maybe_gzip(event, result) if gzip else result
+    except HttpError as err:
+        return error_response(err)
+    except Exception:
+        logger.exception("Unhandled error in %s %s", *route)
+        return error_response(HttpError(500, "Internal server error"))
+
+
+def route_handler(service, routes, gzip=True, counters=None):
+    """The ``lambda_handler`` of a function serving ``routes``.
+
+    Each invocation goes through :func:`dispatch` and is recorded with
+    ``metrics`` under ``service``. ``counters`` returns running totals
+    (``cache_hits``, ``cache_misses``); what they grew by during the
+    invocation is reported with it.
+    """
+    def lambda_handler(event, context):
+        route = (event.get("httpMethod"), event.get("resource"))
+        invocation = metrics.begin(service, " ".join(str(part) for part in route))
+        before = counters() if counters else {}
+        status, body = 500, ""
+        try:
+            result = dispatch(event, routes, gzip)
+            status, body = result["statusCode"], result.get("body") or ""
+            return result
+        finally:
+            after = counters() if counters else {}
+            invocation.finish(
+                status, len(body), **{name: after[name] - before[name] for name in after}
+            )
+
+    return lambda_handler
@@ -0,0 +1,144 @@
+"""Everything ``MqttProvider.jsx`` needs to start, in one request.
+
+On login the provider fetched ``/devices?userId`` and then, one device at a
+time, ``/mqtttopic?userId&deviceName`` before it could connect: one round
+trip per device. ``GET /bootstrap`` returns the same fleet at once::
+
+    {"devices": [{"deviceId", "name", "location", "lastSeen",
+                  "credentials": {"username", "ref"},
+                  "subtopics": [{"subtopic", "topic", "lastSeen"}, ...]}, ...]}
+
+Devices come from ``DEVICES_TABLE``, the table the ``/devices`` API owns
+(partition key ``userId``); passwords are not projected, ``credentials.ref``
+is the item's ``credentialsRef`` if it has one and its ``deviceId``
+otherwise. Subtopics and ``lastSeen`` come from the ``catalog`` topic items
+of the same user, matched on ``deviceId``. That is two Queries, each on
+one partition, however many devices the user owns.
+
+The response carries an ``ETag`` over its body; a request whose
+``If-None-Match`` matches gets a 304 with no body. ``lastSeen`` is rounded
+down to ``LAST_SEEN_RESOLUTION_MS`` so a fleet that is merely reporting
+keeps its ETag between reloads.
+
+Routes, as wired in ``template.yaml``::
+
+    GET /bootstrap?userId
+"""
+
+import hashlib
+import os
+
+import metrics
+
+import dynamo
+from apigw import HttpError, dumps, header, query_params, response, route_handler
+from catalog import CATALOG_TABLE, topic_key
+
+DEVICES_TABLE = os.environ.get("DEVICES_TABLE", "sait-devices")
+LAST_SEEN_RESOLUTION_MS = int(os.environ.get("BOOTSTRAP_LAST_SEEN_RESOLUTION_MS", "300000"))
+
+
+def _query(table_name, condition, projection, names):
+    items, kwargs = [], {}
+    table = dynamo.table(table_name)
+    while True:
+        page = table.query(
+            KeyConditionExpression=condition,
+            ProjectionExpression=projection,
+            ExpressionAttributeNames=names,
+            **kwargs,
+        )
+        items.extend(page.get("Items", []))
+        if "LastEvaluatedKey" not in page:
+            return items
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def devices(user_id):
+    from boto3.dynamodb.conditions import Key
+
+    return _query(
+        DEVICES_TABLE,
+        Key("userId").eq(user_id),
+        "deviceId, #name, #location, username, credentialsRef",
+        {"#name": "name", "#location": "location"},
+    )
+
+
+def topics(user_id):
+    from boto3.dynamodb.conditions import Key
+
+    return _query(
+        CATALOG_TABLE,
+        Key("userId").eq(user_id) & Key("sk").begins_with(topic_key("")),
+        "deviceId, subtopic, #topic, lastSeen",
+        {"#topic": "topic"},
+    )
+
+
+def _rounded(ms):
+    return None if ms is None else int(ms) // LAST_SEEN_RESOLUTION_MS * LAST_SEEN_RESOLUTION_MS
+
+
+def fleet(device_items, topic_items):
+    """The ``devices`` list of the response, by name."""
+    by_device = {}
+    for item in topic_items:
+        by_device.setdefault(item.get("deviceId"), []).append({
+            "subtopic": item.get("subtopic"),
+            "topic": item.get("topic"),
+            "lastSeen": _rounded(item.get("lastSeen")),
+        })
+    out = []
+    for item in device_items:
+        device_id = item.get("deviceId")
+        subtopics = sorted(by_device.get(device_id, []), key=lambda entry: entry["subtopic"])
+        seen = [entry["lastSeen"] for entry in subtopics if entry["lastSeen"] is not None]
+        out.append({
+            "deviceId": device_id,
+            "name": item.get("name"),
+            "location": item.get("location"),
+            "lastSeen": max(seen) if seen else None,
+            "credentials": {
+                "username": item.get("username"),
+                "ref": item.get("credentialsRef") or device_id,
+            },
+            "subtopics": subtopics,
+        })
+    out.sort(key=lambda device: (str(device["name"] or ""), str(device["deviceId"])))
+    return out
+
+
+def _etag(body):
+    return '"' + hashlib.sha256(dumps(body).encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def get_bootstrap(event):
+    user_id = query_params(event).get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+    body = {"devices": fleet(devices(user_id), topics(user_id))}
+
+    etag = _etag(body)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _matches(header(event, "If-None-Match"), etag):
+        return response(304, headers=headers)
+    return response(200, body, headers)
+
+
+ROUTES = {
+    ("GET", "/bootstrap"): get_bootstrap,
+}
+
+
+lambda_handler = route_handler("bootstrap", ROUTES)
+
+
+metrics.init_finished()
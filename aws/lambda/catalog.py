@@ -0,0 +1,296 @@
+"""Catalog of the topics and variables each user has published.
+
+``ChartConfigModal.jsx`` used to download every stored message to find the
+topic list and each topic's variable names. ``CATALOG_TABLE`` keeps just
+that, one partition per user::
+
+    userId     partition key
+    sk         "topic#<device_id>/<subtopic>"             one item per topic
+               "var#<device_id>/<subtopic>#<variable>"    one item per variable
+    topic, deviceId, subtopic (topics) / topic, name, type (variables)
+    firstSeen, lastSeen   epoch ms
+
+``type`` is the DynamoDB type of the variable's latest value: ``number``,
+``string``, ``boolean``, ``object``, ``list`` or ``null``.
+
+:func:`update` is fed by the telemetry stream (from
+``telemetry_rollups.stream_handler``: a stream serves at most two readers
+per shard, and rollups and alarms already use both). Each batch becomes one
+conditional ``UpdateItem`` per topic and variable it touched, which never
+moves ``lastSeen`` backwards; a container skips keys it wrote less than
+``LAST_SEEN_RESOLUTION_MS`` earlier, so steady traffic costs a few writes
+a minute per topic. Existing messages can be indexed with::
+
+    python catalog.py backfill
+
+Routes, as wired in ``template.yaml``::
+
+    GET /catalog?userId&limit&cursor          topics, by name
+    GET /catalog?userId&topic&limit&cursor    variables of one topic, by name
+
+Either is one Query on one partition, whatever the size of the history.
+"""
+
+import os
+
+import metrics
+
+import dynamo
+from apigw import HttpError, query_params, response, route_handler
+from ttlcache import TTLCache
+
+CATALOG_TABLE = os.environ.get("TELEMETRY_CATALOG_TABLE", "sait-telemetry-catalog")
+LAST_SEEN_RESOLUTION_MS = int(os.environ.get("CATALOG_LAST_SEEN_RESOLUTION_MS", "60000"))
+UPDATE_WORKERS = int(os.environ.get("CATALOG_UPDATE_WORKERS", "8"))
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+TYPES = {
+    "N": "number",
+    "S": "string",
+    "BOOL": "boolean",
+    "M": "object",
+    "L": "list",
+    "NULL": "null",
+}
+
+_written = TTLCache(maxsize=100_000, ttl=3600)
+
+
+def topic_key(topic):
+    return f"topic#{topic}"
+
+
+def variable_key(topic, name):
+    return f"var#{topic}#{name}"
+
+
+def split_series(series):
+    """``"<userId>#<device_id>#<subtopic>"`` -> ``(userId, device_id, subtopic)``."""
+    user_id, device_id, subtopic = (series.split("#", 2) + ["", ""])[:3]
+    return user_id, device_id, subtopic
+
+
+def attr_type(attr):
+    return next((TYPES[kind] for kind in attr if kind in TYPES), "string")
+
+
+def collect(images):
+    """Latest sighting of every topic and variable in ``images`` (typed telemetry items).
+
+    Returns ``{(userId, sk): (first, last, attributes)}`` with the first and
+    last timestamps seen and the non-key fields to store.
+    """
+    seen = {}
+
+    def sighting(key, ts, attributes):
+        known = seen.get(key)
+        if known is None:
+            seen[key] = (ts, ts, attributes)
+        elif known[1] < ts:
+            seen[key] = (min(known[0], ts), ts, attributes)
+        elif known[0] > ts:
+            seen[key] = (ts,) + known[1:]
+
+    for image in images:
+        series = image.get("pk", {}).get("S")
+        ts = image.get("ts", {}).get("N")
+        if not series or not ts:
+            continue
+        ts = int(ts)
+        user_id, device_id, subtopic = split_series(series)
+        if not user_id or not device_id or not subtopic:
+            continue
+        topic = f"{device_id}/{subtopic}"
+        sighting(
+            (user_id, topic_key(topic)),
+            ts,
+            {"topic": topic, "deviceId": device_id, "subtopic": subtopic},
+        )
+        for name, attr in image.get("payload", {}).get("M", {}).items():
+            sighting(
+                (user_id, variable_key(topic, name)),
+                ts,
+                {"topic": topic, "name": name, "type": attr_type(attr)},
+            )
+    return seen
+
+
+def _stale(key, ts, attributes):
+    written = _written.get(key)
+    return written is None or (
+        ts - written[0] >= LAST_SEEN_RESOLUTION_MS or written[1] != attributes.get("type")
+    )
+
+
+def _update(key, first, ts, attributes):
+    user_id, sk = key
+    names = {f"#a{i}": name for i, name in enumerate(attributes)}
+    values = {f":a{i}": {"S": value} for i, value in enumerate(attributes.values())}
+    values[":ts"] = {"N": str(ts)}
+    values[":first"] = {"N": str(first)}
+    sets = ["lastSeen = :ts", "firstSeen = if_not_exists(firstSeen, :first)"]
+    sets.extend(f"#a{i} = :a{i}" for i in range(len(attributes)))
+    try:
+        dynamo.client.update_item(
+            TableName=CATALOG_TABLE,
+            Key={"userId": {"S": user_id}, "sk": {"S": sk}},
+            UpdateExpression="SET " + ", ".join(sets),
+            ConditionExpression="attribute_not_exists(lastSeen) OR lastSeen < :ts",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+        )
+    except dynamo.client.exceptions.ConditionalCheckFailedException:
+        pass
+
+
+def update(images, max_workers=UPDATE_WORKERS):
+    """Record the topics and variables of ``images``; returns the number of writes."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    pending = [
+        (key, first, ts, attributes)
+        for key, (first, ts, attributes) in collect(images).items()
+        if _stale(key, ts, attributes)
+    ]
+    if not pending:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as pool:
+        list(pool.map(lambda entry: _update(*entry), pending))
+    for key, _, ts, attributes in pending:
+        _written.set(key, (ts, attributes.get("type")))
+    return len(pending)
+
+
+def update_from_records(records):
+    """:func:`update` for the inserted and modified items of a telemetry stream batch."""
+    images = [
+        record["dynamodb"]["NewImage"]
+        for record in records
+        if record.get("eventName") != "REMOVE" and record.get("dynamodb", {}).get("NewImage")
+    ]
+    return update(images)
+
+
+def _page(user_id, prefix, limit, cursor):
+    from boto3.dynamodb.conditions import Key
+
+    kwargs = {
+        "KeyConditionExpression": Key("userId").eq(user_id) & Key("sk").begins_with(prefix),
+        "Limit": limit,
+    }
+    if cursor:
+        kwargs["ExclusiveStartKey"] = cursor
+    page = dynamo.table(CATALOG_TABLE).query(**kwargs)
+    items = page.get("Items", [])
+    for item in items:
+        item.pop("sk", None)
+        item.pop("userId", None)
+    return items, page.get("LastEvaluatedKey")
+
+
+def topics(user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, device_id=None):
+    prefix = topic_key(f"{device_id}/" if device_id else "")
+    return _page(user_id, prefix, limit, cursor)
+
+
+def variables(user_id, topic, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    return _page(user_id, variable_key(topic, ""), limit, cursor)
+
+
+def subtopics(user_id, device_id):
+    """Every subtopic of one device, as ``GET /report`` lists them."""
+    names, cursor = [], None
+    while True:
+        items, cursor = topics(user_id, MAX_PAGE_SIZE, cursor, device_id)
+        names.extend(item["subtopic"] for item in items)
+        if not cursor:
+            return names
+
+
+def _limit(params):
+    raw = params.get("limit")
+    if raw in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise HttpError(400, "limit must be an integer") from None
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HttpError(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def get_catalog(event):
+    params = query_params(event)
+    user_id = params.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+    cursor = None
+    if params.get("cursor"):
+        try:
+            cursor = dynamo.decode_cursor(params["cursor"])
+        except ValueError:
+            raise HttpError(400, "Invalid cursor") from None
+        if cursor.get("userId") != user_id:
+            raise HttpError(400, "Cursor does not belong to this userId")
+
+    limit = _limit(params)
+    topic = params.get("topic")
+    if topic:
+        items, last_key = variables(user_id, topic, limit, cursor)
+        body = {"topic": topic, "variables": items}
+    else:
+        items, last_key = topics(user_id, limit, cursor)
+        body = {"topics": items}
+    next_cursor = dynamo.encode_cursor(last_key)
+    if next_cursor:
+        body["nextCursor"] = next_cursor
+    return response(200, body)
+
+
+def backfill(table_name=None):
+    """Index every message already in the telemetry table (one full Scan)."""
+    import telemetry
+
+    request = {
+        "TableName": table_name or telemetry.TELEMETRY_TABLE,
+        "ProjectionExpression": "pk, ts, payload",
+    }
+    scanned = writes = 0
+    while True:
+        page = dynamo.client.scan(**request)
+        items = page.get("Items", [])
+        scanned += len(items)
+        writes += update(items)
+        if "LastEvaluatedKey" not in page:
+            return {"scanned": scanned, "writes": writes}
+        request["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+ROUTES = {
+    ("GET", "/catalog"): get_catalog,
+}
+
+
+lambda_handler = route_handler("catalog", ROUTES)
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Telemetry catalog maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_cmd = commands.add_parser("backfill", help="index the messages already stored")
+    backfill_cmd.add_argument("--table", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        print(json.dumps(backfill(args.table)))
+
+
+metrics.init_finished()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,608 @@
+"""Dashboards saved one component at a time, edited with change sets.
+
+``DashboardConfig.jsx`` saved by sending one ``DELETE /dashboard`` per
+queued deletion and then POSTing the whole dashboard, every component
+included. Here each subdashboard and each component is its own item in
+``DASHBOARDS_TABLE``, one partition per user::
+
+    userId     partition key
+    sk         "sub#<subdashboardId>"                        subdashboards
+               "sub#<subdashboardId>#comp#<componentId>"     components
+               "meta"                                        import marker
+    type       "subdashboard" | "component" | "meta"
+    subdashboardId, componentId (components)
+    name, color (subdashboards) / chartType, componentName, variables, ... (components)
+    children   number of components (subdashboards)
+    version    starts at 1, bumped by each update
+    updatedAt  ISO-8601
+
+The first request for a user copies the document ``GET /dashboard`` of the
+API this one replaces (``LEGACY_DASHBOARD_URL``) into the table and then
+writes the ``meta`` item, so nobody's dashboard goes missing when the
+client moves over; ``python dashboards.py backfill USER_ID ...`` runs the
+same import ahead of time. If the old API cannot be read the request fails
+with a ``502`` and the import is tried again on the next one.
+
+Routes, as wired in ``template.yaml``::
+
+    GET   /dashboards?userId[&allowedSubdashboards=a,b]
+                               the dashboard, in the shape GET /dashboard returns;
+                               subaccounts only get the subdashboards they may see
+    PATCH /dashboards          apply a change set
+
+A change set names only what the edit touched::
+
+    {"userId": "...",
+     "adds":    [{"type": "component", "id": "...", "subdashboardId": "...", ...fields}],
+     "updates": [{"type": "subdashboard", "id": "...", "version": 3, ...fields}],
+     "deletes": [{"type": "component", "id": "...", "subdashboardId": "...", "version": 2}]}
+
+Ids are chosen by the client, as subdashboard ids already are. An add fails
+if the item exists; an update must carry the ``version`` it was read at
+and only sets the fields it names; a delete is checked against its
+``version`` when it has one. Deleting a subdashboard also deletes its
+components. Any failed check cancels the transaction and the response is a
+``409`` listing the conflicting items with their stored copies.
+
+Components and their subdashboard are kept consistent through ``children``:
+adding or deleting components bumps it, on the condition that the
+subdashboard still exists (a ``409`` with ``"operation": "parent"``
+otherwise), and a subdashboard is only deleted if ``children`` still
+equals the components deleted along with it. A component added while its
+subdashboard is being deleted therefore fails one of the two writes instead
+of being left behind without a parent.
+
+The change set is written with ``TransactWriteItems``. Up to
+``TRANSACT_LIMIT`` writes it is one transaction: all of it applies or none
+of it does. Larger change sets go in order, adds, then updates, then
+deletes, one transaction per chunk, so a conflict part way through never
+deletes something before the writes that replace it. The ``409`` then
+says how many changes were applied; a retry of the same change set gets
+conflicts for those, with their new versions.
+"""
+
+import json
+import os
+import time
+from decimal import Decimal
+
+import metrics
+
+import dynamo
+from apigw import HttpError, json_body, query_params, response, route_handler
+
+DASHBOARDS_TABLE = os.environ.get("DASHBOARDS_TABLE", "sait-dashboard-items")
+LEGACY_DASHBOARD_URL = os.environ.get("LEGACY_DASHBOARD_URL") or None
+LEGACY_TIMEOUT = 5
+META_KEY = "meta"
+
+FIELDS = {
+    "subdashboard": ("name", "color"),
+    "component": (
+        "chartType", "componentName", "variables", "colSize", "height", "formula",
+        "formulaDisplayType", "formulaUnit", "formulaMin", "formulaMax",
+    ),
+}
+OPERATIONS = ("adds", "updates", "deletes")
+MAX_CHANGES = 1000
+TRANSACT_LIMIT = 100
+# TransactWriteItems takes at most 4 MB; leave room for the typed encoding.
+TRANSACT_MAX_BYTES = 3_500_000
+# Room kept for each subdashboard ``children`` update a transaction adds.
+PARENT_BYTES = 300
+# Adds and updates before deletes; subdashboards before their components on
+# the way in and after them on the way out.
+RANK = {
+    ("adds", "subdashboard"): 0,
+    ("adds", "component"): 1,
+    ("updates", "subdashboard"): 2,
+    ("updates", "component"): 3,
+    ("deletes", "component"): 4,
+    ("deletes", "subdashboard"): 5,
+}
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def sort_key(kind, item_id, subdashboard_id=None):
+    if kind == "subdashboard":
+        return f"sub#{item_id}"
+    return f"sub#{subdashboard_id}#comp#{item_id}"
+
+
+def _decimals(value):
+    # The typed serializer takes Decimal, not float.
+    return json.loads(json.dumps(value), parse_float=Decimal)
+
+
+def _version(entry, required):
+    raw = entry.get("version")
+    if raw is None and not required:
+        return None
+    if isinstance(raw, bool) or not isinstance(raw, int) or raw < 1:
+        raise HttpError(400, "version must be the positive integer the item was read at")
+    return raw
+
+
+class _Change:
+    """One write of a change set and the item it targets."""
+
+    def __init__(self, op, kind, item_id, subdashboard_id, entry=None):
+        self.op = op
+        self.kind = kind
+        self.item_id = item_id
+        self.subdashboard_id = subdashboard_id
+        self.entry = entry or {}
+        self.sk = sort_key(kind, item_id, subdashboard_id)
+
+    @property
+    def rank(self):
+        return RANK[self.op, self.kind]
+
+    def describe(self):
+        out = {"type": self.kind, "id": self.item_id}
+        if self.kind == "component":
+            out["subdashboardId"] = self.subdashboard_id
+        return out
+
+
+def parse_changes(body):
+    """The :class:`_Change` list of a change-set body; raises 400 on a malformed one."""
+    changes, seen = [], set()
+    for op in OPERATIONS:
+        entries = body.get(op) or []
+        if not isinstance(entries, list):
+            raise HttpError(400, f"{op} must be a list")
+        for entry in entries:
+            if not isinstance(entry, dict):
+                raise HttpError(400, f"each entry of {op} must be a JSON object")
+            kind = entry.get("type")
+            if kind not in FIELDS:
+                raise HttpError(400, f"type must be one of: {', '.join(FIELDS)}")
+            if entry.get("id") in (None, ""):
+                raise HttpError(400, f"every entry of {op} needs an id")
+            subdashboard_id = entry.get("subdashboardId")
+            if kind == "component" and subdashboard_id in (None, ""):
+                raise HttpError(400, "components need a subdashboardId")
+            change = _Change(
+                op, kind, str(entry["id"]),
+                None if kind == "subdashboard" else str(subdashboard_id), entry,
+            )
+            if change.sk in seen:
+                raise HttpError(400, f"{kind} {change.item_id} appears more than once")
+            seen.add(change.sk)
+            changes.append(change)
+    if not changes:
+        raise HttpError(400, f"The change set is empty; send any of: {', '.join(OPERATIONS)}")
+    if len(changes) > MAX_CHANGES:
+        raise HttpError(400, f"At most {MAX_CHANGES} changes per request")
+    deleted = {change.item_id for change in changes
+               if change.op == "deletes" and change.kind == "subdashboard"}
+    for change in changes:
+        if change.kind == "component" and change.op != "deletes" \
+                and change.subdashboard_id in deleted:
+            raise HttpError(
+                400, f"component {change.item_id} {change.op[:-1]}s to subdashboard "
+                f"{change.subdashboard_id}, which the change set deletes"
+            )
+    return changes
+
+
+def _component_keys(user_id, subdashboard_id):
+    from boto3.dynamodb.conditions import Key
+
+    condition = Key("userId").eq(user_id) & Key("sk").begins_with(f"sub#{subdashboard_id}#comp#")
+    items, kwargs = [], {"ProjectionExpression": "componentId"}
+    table = dynamo.table(DASHBOARDS_TABLE)
+    while True:
+        page = table.query(KeyConditionExpression=condition, **kwargs)
+        items.extend(page.get("Items", []))
+        if "LastEvaluatedKey" not in page:
+            return [item["componentId"] for item in items]
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def cascade(user_id, changes):
+    """``changes`` plus a delete for each component of a deleted subdashboard."""
+    targeted = {change.sk for change in changes}
+    extra = []
+    for change in changes:
+        if change.op != "deletes" or change.kind != "subdashboard":
+            continue
+        for component_id in _component_keys(user_id, change.item_id):
+            child = _Change("deletes", "component", component_id, change.item_id)
+            if child.sk not in targeted:
+                targeted.add(child.sk)
+                extra.append(child)
+    return changes + extra
+
+
+def _action(user_id, change, now, children=0):
+    """The ``TransactWriteItems`` entry for ``change``.
+
+    ``children`` is the net number of components the same transaction adds
+    to (positive) or deletes from (negative) the subdashboard ``change``
+    writes.
+    """
+    key = {"userId": user_id, "sk": change.sk}
+    fields = {name: _decimals(change.entry[name])
+              for name in FIELDS[change.kind] if name in change.entry}
+    common = {"TableName": DASHBOARDS_TABLE, "ReturnValuesOnConditionCheckFailure": "ALL_OLD"}
+
+    if change.op == "parent":
+        return {"Update": dict(
+            common,
+            Key=dynamo.serialize_item(key),
+            UpdateExpression="ADD #children :delta",
+            ConditionExpression="attribute_exists(sk)",
+            ExpressionAttributeNames={"#children": "children"},
+            ExpressionAttributeValues=dynamo.serialize_item({":delta": change.entry["delta"]}),
+        )}
+
+    if change.op == "adds":
+        item = dict(key, type=change.kind, **fields, version=1, updatedAt=now)
+        if change.kind == "subdashboard":
+            item.update(subdashboardId=change.item_id, children=children)
+        else:
+            item.update(subdashboardId=change.subdashboard_id, componentId=change.item_id)
+        return {"Put": dict(
+            common,
+            Item=dynamo.serialize_item(item),
+            ConditionExpression="attribute_not_exists(sk)",
+        )}
+
+    if change.op == "updates":
+        expected = _version(change.entry, required=True)
+        if not fields:
+            raise HttpError(
+                400, f"Nothing to update for {change.kind} {change.item_id}; "
+                f"allowed fields: {', '.join(FIELDS[change.kind])}"
+            )
+        fields["updatedAt"] = now
+        names = {f"#{name}": name for name in fields}
+        names["#version"] = "version"
+        values = {f":{name}": value for name, value in fields.items()}
+        values.update({":one": 1, ":expected": expected})
+        added = " ADD #version :one"
+        if children:
+            names["#children"] = "children"
+            values[":children"] = children
+            added += ", #children :children"
+        return {"Update": dict(
+            common,
+            Key=dynamo.serialize_item(key),
+            UpdateExpression="SET " + ", ".join(f"#{name} = :{name}" for name in fields)
+            + added,
+            ConditionExpression="#version = :expected",
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=dynamo.serialize_item(values),
+        )}
+
+    delete = dict(common, Key=dynamo.serialize_item(key))
+    conditions, names, values = [], {}, {}
+    expected = _version(change.entry, required=False)
+    if expected is not None:
+        conditions.append("#version = :expected")
+        names["#version"] = "version"
+        values[":expected"] = expected
+    if change.kind == "subdashboard":
+        # Only if no component was added since the cascade listed them.
+        conditions.append("#children = :children")
+        names["#children"] = "children"
+        values[":children"] = -children
+    if conditions:
+        delete.update(
+            ConditionExpression=" AND ".join(conditions),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=dynamo.serialize_item(values),
+        )
+    return {"Delete": delete}
+
+
+def _parent(change):
+    """The subdashboard whose ``children`` a component add or delete changes."""
+    if change.kind == "component" and change.op in ("adds", "deletes"):
+        return change.subdashboard_id
+    return None
+
+
+def _transaction(user_id, changes, now):
+    """``(change, action)`` pairs for one transaction, ``children`` updates included."""
+    deltas = {}
+    for change in changes:
+        parent = _parent(change)
+        if parent is not None:
+            deltas[parent] = deltas.get(parent, 0) + (1 if change.op == "adds" else -1)
+    pairs = []
+    for change in changes:
+        children = deltas.pop(change.item_id, 0) if change.kind == "subdashboard" else 0
+        pairs.append((change, _action(user_id, change, now, children)))
+    # Subdashboards the transaction does not write get an update of their
+    # own, even when its adds and deletes cancel out: it checks they exist.
+    for subdashboard_id, delta in deltas.items():
+        parent = _Change("parent", "subdashboard", subdashboard_id, None, {"delta": delta})
+        pairs.append((parent, _action(user_id, parent, now)))
+    return pairs
+
+
+def transactions(user_id, ordered, now):
+    """Group ``ordered`` changes into transactions of ``(change, action)`` pairs.
+
+    Each stays within ``TRANSACT_LIMIT`` writes and ``TRANSACT_MAX_BYTES``,
+    counting one ``children`` update for every subdashboard whose components
+    it adds or deletes. Every action is built before anything is written, so
+    a malformed change fails the request up front.
+    """
+    out, chunk, parents, size = [], [], set(), 0
+    for change in ordered:
+        parent = _parent(change)
+        change_size = len(json.dumps(_action(user_id, change, now)))
+        touched = parents | {parent} if parent is not None else parents
+        if chunk and (len(chunk) + 1 + len(touched) > TRANSACT_LIMIT
+                      or size + change_size + len(touched) * PARENT_BYTES > TRANSACT_MAX_BYTES):
+            out.append(_transaction(user_id, chunk, now))
+            chunk, parents, size = [], set(), 0
+        chunk.append(change)
+        size += change_size
+        if parent is not None:
+            parents.add(parent)
+    if chunk:
+        out.append(_transaction(user_id, chunk, now))
+    return out
+
+
+def chunks(actions):
+    """Split plain actions into transactions within the count and size limits."""
+    chunk, size = [], 0
+    for action in actions:
+        action_size = len(json.dumps(action))
+        if chunk and (len(chunk) == TRANSACT_LIMIT or size + action_size > TRANSACT_MAX_BYTES):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(action)
+        size += action_size
+    if chunk:
+        yield chunk
+
+
+def _conflicts(chunk, exc):
+    """The items whose condition failed, from a ``TransactionCanceledException``."""
+    reasons = exc.response.get("CancellationReasons") or []
+    conflicts = []
+    for (change, _), reason in zip(chunk, reasons):
+        if reason.get("Code") != "ConditionalCheckFailed":
+            continue
+        current = dynamo.deserialize_item(reason["Item"]) if reason.get("Item") else None
+        if current:
+            current.pop("userId", None)
+            current.pop("sk", None)
+        conflicts.append(dict(change.describe(), operation=change.op, current=current))
+    return conflicts
+
+
+def apply_changes(user_id, changes):
+    """Write ``changes``; returns the counts and the new version of each added or updated item."""
+    from botocore.exceptions import ClientError
+
+    now = _now()
+    ordered = sorted(changes, key=lambda change: change.rank)
+    applied = dict.fromkeys(OPERATIONS, 0)
+    versions = []
+    for index, chunk in enumerate(transactions(user_id, ordered, now)):
+        try:
+            dynamo.client.transact_write_items(TransactItems=[action for _, action in chunk])
+        except ClientError as exc:
+            if exc.response["Error"]["Code"] != "TransactionCanceledException":
+                raise
+            conflicts = _conflicts(chunk, exc)
+            if not conflicts:
+                raise
+            raise HttpError(
+                409,
+                "Dashboard was modified by someone else; refetch and retry",
+                details={"conflicts": conflicts, "applied": applied, "appliedChunks": index},
+            ) from None
+        for change, _ in chunk:
+            if change.op == "parent":
+                continue
+            applied[change.op] += 1
+            if change.op == "adds":
+                versions.append(dict(change.describe(), version=1))
+            elif change.op == "updates":
+                versions.append(dict(change.describe(), version=change.entry["version"] + 1))
+    return {"applied": applied, "versions": versions}
+
+
+def _legacy_document(user_id):
+    """The user's ``GET /dashboard`` document from the old API; 502 if it cannot be read."""
+    from urllib.error import HTTPError as LegacyError
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+
+    url = f"{LEGACY_DASHBOARD_URL}?{urlencode({'userId': user_id})}"
+    try:
+        with urlopen(url, timeout=LEGACY_TIMEOUT) as handle:
+            return json.load(handle)
+    except LegacyError as err:
+        if err.code == 404:
+            return {}
+        raise HttpError(502, "Could not read the dashboard saved before; retry") from None
+    except (OSError, ValueError):
+        raise HttpError(502, "Could not read the dashboard saved before; retry") from None
+
+
+def legacy_items(user_id, document, now):
+    """Items of this table for a ``GET /dashboard`` document."""
+    items = []
+    for dashboard in (document or {}).get("dashboards") or []:
+        if not isinstance(dashboard, dict) or dashboard.get("subdashboardId") in (None, ""):
+            continue
+        subdashboard_id = str(dashboard["subdashboardId"])
+        components = [entry for entry in dashboard.get("components") or []
+                      if isinstance(entry, dict)]
+        items.append({
+            "userId": user_id, "sk": sort_key("subdashboard", subdashboard_id),
+            "type": "subdashboard", "subdashboardId": subdashboard_id,
+            "name": dashboard.get("subdashboardName"), "color": dashboard.get("subdashboardColor"),
+            "children": len(components), "version": 1, "updatedAt": now,
+        })
+        seen = set()
+        for index, component in enumerate(components):
+            # The old document has no component ids; their position stands in.
+            component_id = str(component.get("id") or index)
+            if component_id in seen:
+                component_id = f"{component_id}-{index}"
+            seen.add(component_id)
+            item = {name: _decimals(component[name])
+                    for name in FIELDS["component"] if component.get(name) is not None}
+            item.update(
+                userId=user_id, sk=sort_key("component", component_id, subdashboard_id),
+                type="component", subdashboardId=subdashboard_id, componentId=component_id,
+                version=1, updatedAt=now,
+            )
+            items.append(item)
+    return items
+
+
+def imported(user_id):
+    item = dynamo.table(DASHBOARDS_TABLE).get_item(
+        Key={"userId": user_id, "sk": META_KEY}, ConsistentRead=True,
+    ).get("Item")
+    return item is not None
+
+
+def import_legacy(user_id):
+    """Copy the user's old ``/dashboard`` document in, once; returns the items written.
+
+    The ``meta`` item goes last, only if it is still missing: an import
+    that fails part way is run again in full by the next request, and two
+    racing imports write the same items.
+    """
+    from botocore.exceptions import ClientError
+
+    if not LEGACY_DASHBOARD_URL:
+        return 0
+    now = _now()
+    items = legacy_items(user_id, _legacy_document(user_id), now)
+    meta = {"userId": user_id, "sk": META_KEY, "type": "meta",
+            "imported": len(items), "updatedAt": now}
+    actions = [{"Put": {"TableName": DASHBOARDS_TABLE, "Item": dynamo.serialize_item(item)}}
+               for item in items]
+    actions.append({"Put": {
+        "TableName": DASHBOARDS_TABLE,
+        "Item": dynamo.serialize_item(meta),
+        "ConditionExpression": "attribute_not_exists(sk)",
+    }})
+    try:
+        for chunk in chunks(actions):
+            dynamo.client.transact_write_items(TransactItems=chunk)
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] != "TransactionCanceledException":
+            raise
+        return 0  # another request finished the import first
+    return len(items)
+
+
+def patch_dashboards(event):
+    body = json_body(event)
+    user_id = body.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    if LEGACY_DASHBOARD_URL and not imported(user_id):
+        import_legacy(user_id)
+    changes = cascade(user_id, parse_changes(body))
+    return response(200, apply_changes(user_id, changes))
+
+
+def _items(user_id):
+    from boto3.dynamodb.conditions import Key
+
+    items, kwargs = [], {}
+    table = dynamo.table(DASHBOARDS_TABLE)
+    while True:
+        page = table.query(KeyConditionExpression=Key("userId").eq(user_id), **kwargs)
+        items.extend(page.get("Items", []))
+        if "LastEvaluatedKey" not in page:
+            break
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+    return items
+
+
+def load(user_id):
+    """Every item of ``user_id``, as ``{"dashboards": [...]}`` like ``GET /dashboard``.
+
+    Imports the old document first if the user has not been imported yet.
+    """
+    items = _items(user_id)
+    if LEGACY_DASHBOARD_URL and not any(item["sk"] == META_KEY for item in items):
+        import_legacy(user_id)
+        items = _items(user_id)
+
+    dashboards = {}
+    # Sort keys put each subdashboard right before its components.
+    for item in items:
+        if item.get("type") == "subdashboard":
+            dashboards[item["subdashboardId"]] = {
+                "subdashboardId": item["subdashboardId"],
+                "subdashboardName": item.get("name"),
+                "subdashboardColor": item.get("color"),
+                "version": item.get("version"),
+                "components": [],
+            }
+        elif item.get("subdashboardId") in dashboards:
+            component = {name: item[name] for name in FIELDS["component"] if name in item}
+            component.update(id=item["componentId"], version=item.get("version"))
+            dashboards[item["subdashboardId"]]["components"].append(component)
+    return {"dashboards": list(dashboards.values())}
+
+
+def get_dashboards(event):
+    params = query_params(event)
+    user_id = params.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+    body = load(user_id)
+    if params.get("allowedSubdashboards") is not None:
+        allowed = {part for part in params["allowedSubdashboards"].split(",") if part}
+        body["dashboards"] = [dashboard for dashboard in body["dashboards"]
+                              if dashboard["subdashboardId"] in allowed]
+    return response(200, body)
+
+
+ROUTES = {
+    ("GET", "/dashboards"): get_dashboards,
+    ("PATCH", "/dashboards"): patch_dashboards,
+}
+
+
+lambda_handler = route_handler("dashboards", ROUTES)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dashboard items maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill = commands.add_parser("backfill", help="import the /dashboard documents of users")
+    backfill.add_argument("users", nargs="*", metavar="USER_ID")
+    backfill.add_argument("--users-file", help="file with one user id per line")
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        if not LEGACY_DASHBOARD_URL:
+            parser.error("LEGACY_DASHBOARD_URL is not set")
+        users = list(args.users)
+        if args.users_file:
+            with open(args.users_file, encoding="utf-8") as handle:
+                users.extend(line.strip() for line in handle if line.strip())
+        for user_id in users:
+            written = None if imported(user_id) else import_legacy(user_id)
+            print(json.dumps({"userId": user_id, "imported": written}))
+
+
+metrics.init_finished()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Vectorized downsampling of telemetry series with NumPy.
+
+All functions take a sorted ``int64`` array of epoch-millisecond timestamps
+and ``float64`` value arrays of the same length, with ``NaN`` where a
+message did not carry the variable.
+
+* :func:`bucketize` splits ``[start, end)`` into equal buckets and returns
+  count/sum/min/max/avg/last per bucket for every variable, all on one
+  shared axis of bucket start times.
+* :func:`merge` does the same for rows that are already aggregates (the
+  rollup rows), combining them into coarser buckets.
+* :func:`lttb` picks the Largest-Triangle-Three-Buckets subset of one
+  series, which keeps its visual shape with far fewer points.
+"""
+
+import numpy as np
+
+AGGREGATES = ("min", "max", "avg", "last")
+
+
+def bucket_edges(start_ms, end_ms, points):
+    """``points`` equal-width buckets covering ``[start_ms, end_ms)``; returns (starts, width)."""
+    span = max(1, end_ms - start_ms)
+    width = max(1, -(-span // max(1, points)))  # ceil division
+    count = -(-span // width)
+    return start_ms + np.arange(count, dtype=np.int64) * width, width
+
+
+def _empty_stats(n_buckets):
+    stats = {"count": np.zeros(n_buckets, dtype=np.int64), "sum": np.zeros(n_buckets)}
+    for agg in AGGREGATES:
+        stats[agg] = np.full(n_buckets, np.nan)
+    return stats
+
+
+def _runs(index):
+    """Start and end offsets of each run of equal values in a non-decreasing ``index``."""
+    run_starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    return run_starts, np.r_[run_starts[1:], len(index)]
+
+
+def _bucket_stats(index, values, n_buckets):
+    """Per-bucket count/sum/min/max/avg/last of ``values``.
+
+    ``index`` holds each sample's bucket and must be non-decreasing (the
+    samples are in time order), so every bucket is one contiguous run and
+    ``reduceat`` can aggregate all of them in a single pass.
+    """
+    stats = _empty_stats(n_buckets)
+    if len(index) == 0:
+        return stats
+    run_starts, run_ends = _runs(index)
+    buckets = index[run_starts]
+    counts = run_ends - run_starts
+    stats["count"][buckets] = counts
+    stats["sum"][buckets] = np.add.reduceat(values, run_starts)
+    stats["min"][buckets] = np.minimum.reduceat(values, run_starts)
+    stats["max"][buckets] = np.maximum.reduceat(values, run_starts)
+    stats["avg"][buckets] = stats["sum"][buckets] / counts
+    stats["last"][buckets] = values[run_ends - 1]
+    return stats
+
+
+def _merge_stats(index, parts, n_buckets):
+    """Like :func:`_bucket_stats`, but each row is itself a count/sum/min/max/last aggregate."""
+    stats = _empty_stats(n_buckets)
+    if len(index) == 0:
+        return stats
+    run_starts, run_ends = _runs(index)
+    buckets = index[run_starts]
+    stats["count"][buckets] = np.add.reduceat(parts["count"], run_starts)
+    stats["sum"][buckets] = np.add.reduceat(parts["sum"], run_starts)
+    stats["min"][buckets] = np.minimum.reduceat(parts["min"], run_starts)
+    stats["max"][buckets] = np.maximum.reduceat(parts["max"], run_starts)
+    stats["avg"][buckets] = stats["sum"][buckets] / stats["count"][buckets]
+    stats["last"][buckets] = parts["last"][run_ends - 1]
+    return stats
+
+
+def _bucket_index(ts, start_ms, width, n_buckets):
+    in_range = (ts >= start_ms) & (ts < start_ms + n_buckets * width)
+    return in_range, ((ts - start_ms) // width).astype(np.intp)
+
+
+def bucketize(ts, columns, start_ms, end_ms, points):
+    """Aggregate ``columns`` ({name: values}) into at most ``points`` time buckets.
+
+    Returns ``(bucket_starts, width_ms, stats)`` where ``stats[name]`` maps
+    ``count``, ``sum``, ``min``, ``max``, ``avg`` and ``last`` to arrays
+    aligned with ``bucket_starts``. Empty buckets hold ``NaN`` (count 0).
+    """
+    starts, width = bucket_edges(start_ms, end_ms, points)
+    n_buckets = len(starts)
+    in_range, index_all = _bucket_index(ts, start_ms, width, n_buckets)
+    stats = {}
+    for name, values in columns.items():
+        keep = in_range & ~np.isnan(values)
+        stats[name] = _bucket_stats(index_all[keep], values[keep], n_buckets)
+    return starts, width, stats
+
+
+def merge(ts, partials, start_ms, width, n_buckets):
+    """Combine aggregate rows into ``n_buckets`` buckets of ``width`` ms from ``start_ms``.
+
+    ``partials[name]`` maps ``count``/``sum``/``min``/``max``/``last`` to
+    arrays aligned with ``ts`` (count 0 where a row lacks the variable).
+    Returns ``(bucket_starts, stats)`` shaped like :func:`bucketize`.
+    """
+    starts = start_ms + np.arange(n_buckets, dtype=np.int64) * width
+    in_range, index_all = _bucket_index(ts, start_ms, width, n_buckets)
+    stats = {}
+    for name, parts in partials.items():
+        keep = in_range & (parts["count"] > 0)
+        stats[name] = _merge_stats(
+            index_all[keep], {agg: values[keep] for agg, values in parts.items()}, n_buckets
+        )
+    return starts, stats
+
+
+def drop_empty(starts, stats):
+    """Remove buckets where no variable has data, keeping every series aligned."""
+    if not stats:
+        return starts, stats
+    occupied = np.zeros(len(starts), dtype=bool)
+    for series in stats.values():
+        occupied |= series["count"] > 0
+    return starts[occupied], {
+        name: {agg: values[occupied] for agg, values in series.items()}
+        for name, series in stats.items()
+    }
+
+
+def lttb(ts, values, threshold):
+    """Indices of the Largest-Triangle-Three-Buckets selection of a series.
+
+    NaN samples are skipped. Returns all indices when the series already has
+    ``threshold`` points or fewer.
+    """
+    valid = np.flatnonzero(~np.isnan(values))
+    n = len(valid)
+    if threshold >= n or threshold < 3:
+        return valid
+    x = ts[valid].astype(np.float64)
+    y = values[valid]
+
+    # Bucket boundaries for the n-2 interior points, split into threshold-2 buckets.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_lo:nxt_hi].mean()
+        avg_y = y[nxt_lo:nxt_hi].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return valid[selected]
+
+
+def to_list(values, decimals=None):
+    """JSON-ready list with ``None`` for NaN (and optional rounding)."""
+    if decimals is not None and values.dtype.kind == "f":
+        values = np.round(values, decimals)
+    out = values.tolist()
+    if values.dtype.kind == "f":
+        return [None if v != v else v for v in out]
+    return out
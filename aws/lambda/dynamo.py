@@ -0,0 +1,238 @@
+"""Shared DynamoDB resource for every handler in this package.
+
+The resource (and the urllib3 connection pool behind it) is created once,
+while the module is imported during the Lambda init phase, and is reused by
+every warm invocation of the container. Setting ``DYNAMODB_ENDPOINT`` points
+it at DynamoDB Local for benchmarks and local runs.
+
+Every call made through it is timed and asks for ``ReturnConsumedCapacity``
+so ``metrics`` can report per-invocation call counts, latency and capacity.
+"""
+
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+import metrics
+
+_CONFIG = Config(
+    connect_timeout=2,
+    read_timeout=5,
+    retries={"max_attempts": 3, "mode": "standard"},
+    max_pool_connections=int(os.environ.get("DYNAMODB_MAX_POOL", "10")),
+)
+
+_ENDPOINT = os.environ.get("DYNAMODB_ENDPOINT") or None
+
+resource = boto3.resource("dynamodb", endpoint_url=_ENDPOINT, config=_CONFIG)
+
+_tables = {}
+_client = None
+_client_lock = threading.Lock()
+
+
+def _request_consumed_capacity(params, model, **kwargs):
+    if "ReturnConsumedCapacity" in model.input_shape.members:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+
+
+def _start_timer(context, **kwargs):
+    context["started"] = time.perf_counter()
+
+
+def _record_call(parsed, model, context, **kwargs):
+    started = context.get("started")
+    elapsed_ms = (time.perf_counter() - started) * 1000 if started else 0.0
+    metrics.record_dynamo_call(model.name, elapsed_ms, parsed.get("ConsumedCapacity"))
+
+
+def _instrument(events):
+    events.register("provide-client-params.dynamodb", _request_consumed_capacity)
+    events.register("before-call.dynamodb", _start_timer)
+    events.register("after-call.dynamodb", _record_call)
+
+
+_instrument(resource.meta.client.meta.events)
+
+
+def get_client():
+    """Plain low-level client (typed attribute values), created on first use.
+
+    Unlike ``Table`` objects it is thread-safe, so worker threads use it
+    directly. It cannot be ``resource.meta.client``: boto3 installs its
+    Python-type conversion on that one. Functions that never make a typed
+    call do not pay for creating it during init.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                created = boto3.client("dynamodb", endpoint_url=_ENDPOINT, config=_CONFIG)
+                _instrument(created.meta.events)
+                _client = created
+    return _client
+
+
+def __getattr__(name):
+    # ``dynamo.client`` keeps working for callers; it is built lazily.
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def table(name):
+    """Return a cached ``Table`` handle; creating one makes no API call."""
+    handle = _tables.get(name)
+    if handle is None:
+        handle = _tables[name] = resource.Table(name)
+    return handle
+
+
+def _number(value):
+    # Key attributes of type N come back from the resource API as Decimal.
+    return int(value) if value == value.to_integral_value() else float(value)
+
+
+def encode_cursor(last_evaluated_key):
+    """Turn a ``LastEvaluatedKey`` into an opaque, URL-safe page cursor."""
+    if not last_evaluated_key:
+        return None
+    import base64
+    import json
+
+    raw = json.dumps(last_evaluated_key, separators=(",", ":"), sort_keys=True, default=_number)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of :func:`encode_cursor`; raises ``ValueError`` on garbage."""
+    import base64
+    import binascii
+    import json
+    from decimal import Decimal
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(raw, parse_float=Decimal, parse_int=Decimal)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("malformed cursor") from None
+    if not isinstance(key, dict) or not all(isinstance(v, (str, Decimal)) for v in key.values()):
+        raise ValueError("malformed cursor")
+    return key
+
+
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+
+
+def _backoff(attempt, base=0.05, cap=1.0):
+    # "Full jitter": spreads retries from concurrent containers apart.
+    import random
+
+    time.sleep(random.uniform(0, min(cap, base * 2 ** attempt)))
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def batch_write(table_name, requests, max_attempts=5, typed=False):
+    """Send ``PutRequest``/``DeleteRequest`` dicts in chunks of 25.
+
+    ``UnprocessedItems`` are retried with jittered exponential backoff; the
+    requests still unprocessed after ``max_attempts`` are returned so the
+    caller can report them per item. With ``typed=True`` the items are
+    already in low-level attribute-value form and go through ``client``,
+    which is also safe to call from several threads.
+    """
+    api = get_client() if typed else resource
+    failed = []
+    for chunk in _chunks(list(requests), BATCH_WRITE_SIZE):
+        pending = {table_name: chunk}
+        for attempt in range(max_attempts):
+            result = api.batch_write_item(RequestItems=pending)
+            pending = result.get("UnprocessedItems") or {}
+            if not pending:
+                break
+            _backoff(attempt)
+        failed.extend(pending.get(table_name, []))
+    return failed
+
+
+def batch_get(table_name, keys, projection=None, names=None, max_attempts=5):
+    """Fetch ``keys`` in chunks of 100, retrying ``UnprocessedKeys``.
+
+    Returns ``(items, unprocessed_keys)``; item order is not guaranteed.
+    """
+    items, failed = [], []
+    for chunk in _chunks(list(keys), BATCH_GET_SIZE):
+        request = {"Keys": chunk}
+        if projection:
+            request["ProjectionExpression"] = projection
+            request["ExpressionAttributeNames"] = names
+        pending = {table_name: request}
+        for attempt in range(max_attempts):
+            result = resource.batch_get_item(RequestItems=pending)
+            items.extend(result.get("Responses", {}).get(table_name, []))
+            pending = result.get("UnprocessedKeys") or {}
+            if not pending:
+                break
+            _backoff(attempt)
+        if pending:
+            failed.extend(pending[table_name]["Keys"])
+    return items, failed
+
+
+def deserialize_item(raw_item):
+    """Convert a low-level (typed) item, e.g. from a stream record or ``client`` call."""
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserialize = TypeDeserializer().deserialize
+    return {key: deserialize(value) for key, value in raw_item.items()}
+
+
+def serialize_item(item):
+    """Convert an item with Decimal numbers to the low-level (typed) form ``client`` takes."""
+    from boto3.dynamodb.types import TypeSerializer
+
+    serialize = TypeSerializer().serialize
+    return {key: serialize(value) for key, value in item.items()}
+
+
+def scan_segment(table_name, segment, total_segments, start_key=None, **kwargs):
+    """Yield ``(items, last_evaluated_key)`` for each page of one Scan segment.
+
+    Uses the thread-safe low-level client, so several segments can be read
+    from worker threads at once; items are deserialized to plain values.
+    ``start_key`` resumes a segment from a previous ``last_evaluated_key``.
+    """
+    request = dict(kwargs, TableName=table_name, Segment=segment, TotalSegments=total_segments)
+    if start_key:
+        request["ExclusiveStartKey"] = start_key
+    while True:
+        page = get_client().scan(**request)
+        items = [deserialize_item(item) for item in page.get("Items", [])]
+        last_key = page.get("LastEvaluatedKey")
+        yield items, last_key
+        if not last_key:
+            return
+        request["ExclusiveStartKey"] = last_key
+
+
+def parallel_scan(table_name, total_segments, worker, max_workers=None, **kwargs):
+    """Run ``worker(segment, pages)`` for every segment on a thread pool.
+
+    ``pages`` is that segment's :func:`scan_segment` generator. Returns the
+    workers' results in segment order; the first worker exception is raised.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(segment):
+        return worker(segment, scan_segment(table_name, segment, total_segments, **kwargs))
+
+    with ThreadPoolExecutor(max_workers=max_workers or total_segments) as pool:
+        return list(pool.map(run, range(total_segments)))
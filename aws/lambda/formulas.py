@@ -0,0 +1,250 @@
+"""Formulas of ``FormulaComponent`` compiled once and evaluated over NumPy arrays.
+
+Formulas use the mathjs syntax the widget already accepts, over the names
+``var1``, ``var2``, ... (the widget's variables in order)::
+
+    (var1 - var2) / var3 * 100
+    sqrt(var1^2 + var2^2)
+    max(var1, var2, 0) + log(var3, 10)
+
+:func:`compile_formula` parses the text with :mod:`ast` and accepts only
+numbers, the ``varN`` names, ``pi``/``e``, arithmetic, comparisons and calls
+to the functions in ``FUNCTIONS`` with the argument counts in ``ARITY``;
+anything else (attributes, subscripts, strings, lambdas, other names, a
+function name that is not called) raises :class:`FormulaError`. The checked tree is
+compiled to a code object and cached by formula text, so the parse and the
+check run once per container, not once per value.
+
+:meth:`Formula.evaluate` runs it on whole arrays, one NumPy operation per
+node. Division by zero and other domain errors give ``inf``/``NaN`` rather
+than raising, and comparisons give ``1.0``/``0.0`` as in mathjs.
+"""
+
+import ast
+import functools
+import os
+import re
+
+import numpy as np
+
+MAX_FORMULA_LENGTH = 500
+MAX_NODES = 200
+CACHE_SIZE = int(os.environ.get("FORMULA_CACHE_SIZE", "1024"))
+
+VARIABLE = re.compile(r"var[1-9][0-9]*\Z")
+
+
+def _log(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
+def _round(x, decimals=0):
+    # mathjs's ``round(x, n)``; NumPy needs ``n`` as an int, not a float64 scalar.
+    return np.round(x, int(decimals))
+
+
+def _reduce(ufunc):
+    return lambda first, *rest: functools.reduce(ufunc, rest, first)
+
+
+FUNCTIONS = {
+    "abs": np.abs,
+    "sqrt": np.sqrt,
+    "cbrt": np.cbrt,
+    "exp": np.exp,
+    "log": _log,
+    "log10": np.log10,
+    "log2": np.log2,
+    "pow": np.power,
+    "mod": np.mod,
+    "sign": np.sign,
+    "round": _round,
+    "floor": np.floor,
+    "ceil": np.ceil,
+    "min": _reduce(np.minimum),
+    "max": _reduce(np.maximum),
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "atan2": np.arctan2,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+}
+# (fewest, most) arguments of each function; None means any number.
+ARITY = dict.fromkeys(FUNCTIONS, (1, 1))
+ARITY.update({
+    "log": (1, 2),
+    "round": (1, 2),
+    "pow": (2, 2),
+    "mod": (2, 2),
+    "atan2": (2, 2),
+    "min": (1, None),
+    "max": (1, None),
+})
+CONSTANTS = {"pi": np.pi, "PI": np.pi, "e": np.e, "E": np.e}
+
+_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Call, ast.Name, ast.Constant,
+    ast.Load, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow, ast.UAdd, ast.USub,
+    ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+)
+
+
+class FormulaError(ValueError):
+    """The formula cannot be parsed or uses something outside the whitelist."""
+
+
+class _Constants(ast.NodeTransformer):
+    """Numbers -> names bound to ``np.float64``.
+
+    Plain Python numbers would make ``1/0`` raise and ``9^9^9`` build a huge
+    integer; as NumPy scalars they give ``inf`` like the arrays do.
+    """
+
+    def __init__(self):
+        self.values = {}
+
+    def visit_Constant(self, node):
+        name = f"_c{len(self.values)}"
+        self.values[name] = np.float64(node.value)
+        return ast.Name(id=name, ctx=ast.Load())
+
+
+class _Comparisons(ast.NodeTransformer):
+    """``a < b`` -> ``_f(a < b)`` so comparisons yield 1.0/0.0 and chains work on arrays."""
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        parts = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            parts.append(ast.Compare(left=left, ops=[op], comparators=[right]))
+            left = right
+        test = parts[0]
+        for part in parts[1:]:
+            test = ast.BinOp(left=test, op=ast.Mult(), right=part)
+        return ast.Call(func=ast.Name(id="_f", ctx=ast.Load()), args=[test], keywords=[])
+
+
+def _arguments(fewest, most):
+    if most is None:
+        return f"at least {fewest} argument" + ("s" if fewest != 1 else "")
+    if fewest == most:
+        return f"{fewest} argument" + ("s" if fewest != 1 else "")
+    return f"{fewest} to {most} arguments"
+
+
+def _check(tree):
+    nodes = list(ast.walk(tree))
+    if len(nodes) > MAX_NODES:
+        raise FormulaError(f"formula is too long (more than {MAX_NODES} terms)")
+    called = {id(node.func) for node in nodes if isinstance(node, ast.Call)}
+    variables = set()
+    for node in nodes:
+        if not isinstance(node, _NODES):
+            raise FormulaError(f"{type(node).__name__} is not allowed in formulas")
+        if isinstance(node, ast.Constant) and (
+            isinstance(node.value, bool) or not isinstance(node.value, (int, float))
+        ):
+            raise FormulaError("only numbers are allowed as constants")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+                name = getattr(node.func, "id", "this call")
+                raise FormulaError(f"unknown function {name!r}")
+            if node.keywords:
+                raise FormulaError("keyword arguments are not allowed")
+            fewest, most = ARITY[node.func.id]
+            if len(node.args) < fewest or (most is not None and len(node.args) > most):
+                raise FormulaError(f"{node.func.id}() takes {_arguments(fewest, most)}")
+        elif isinstance(node, ast.Name):
+            if VARIABLE.match(node.id):
+                variables.add(node.id)
+            elif node.id in FUNCTIONS:
+                if id(node) not in called:
+                    raise FormulaError(f"{node.id} is a function; call it as {node.id}(...)")
+            elif node.id not in CONSTANTS:
+                raise FormulaError(f"unknown name {node.id!r}; use var1, var2, ...")
+    return variables
+
+
+class Formula:
+    """A checked, compiled formula; build it with :func:`compile_formula`."""
+
+    def __init__(self, text, code, variables, constants):
+        self.text = text
+        self.code = code
+        self.constants = constants
+        self.variables = sorted(variables, key=lambda name: int(name[3:]))
+
+    def evaluate(self, values):
+        """Evaluate over ``values`` (``{"var1": array or number, ...}``).
+
+        Returns a ``float64`` array with the broadcast shape of the inputs.
+        A missing variable, or inputs the formula cannot be evaluated on
+        (e.g. ``round(var1, var2)`` over arrays, or shapes that do not
+        broadcast), raise :class:`FormulaError`.
+        """
+        missing = [name for name in self.variables if name not in values]
+        if missing:
+            raise FormulaError(f"no values for {', '.join(missing)}")
+        inputs = {name: np.asarray(values[name], dtype=np.float64) for name in self.variables}
+        namespace = dict(FUNCTIONS, **CONSTANTS, **self.constants, _f=_as_float, **inputs)
+        try:
+            shape = np.broadcast_shapes(*(array.shape for array in inputs.values()))
+            with np.errstate(all="ignore"):
+                result = eval(self.code, {"__builtins__": {}}, namespace)
+            return np.broadcast_to(np.asarray(result, dtype=np.float64), shape).copy()
+        except (ArithmeticError, TypeError, ValueError) as err:
+            raise FormulaError(f"cannot evaluate {self.text!r}: {err}") from None
+
+
+def _as_float(test):
+    return np.asarray(test, dtype=np.float64)
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def compile_formula(text):
+    """Parse, check and compile ``text``; cached by formula text."""
+    if not isinstance(text, str) or not text.strip():
+        raise FormulaError("formula is empty")
+    if len(text) > MAX_FORMULA_LENGTH:
+        raise FormulaError(f"formula is longer than {MAX_FORMULA_LENGTH} characters")
+    # mathjs writes powers as ``^``.
+    source = text.strip().replace("^", "**")
+    try:
+        tree = ast.parse(source, mode="eval")
+    except SyntaxError as err:
+        raise FormulaError(f"invalid formula: {err.msg}") from None
+    variables = _check(tree)
+    constants = _Constants()
+    tree = ast.fix_missing_locations(constants.visit(_Comparisons().visit(tree)))
+    code = compile(tree, "<formula>", "eval")
+    return Formula(text, code, variables, constants.values)
+
+
+def align(series):
+    """Put ``[(ts, values), ...]`` on the union of their timestamps.
+
+    Each input carries its last non-``NaN`` value forward (``NaN`` before
+    its first sample), the same "latest value of every variable" the widget computes
+    with when one of them changes. Returns ``(axis, [values, ...])``.
+    """
+    if not series:
+        return np.array([], dtype=np.int64), []
+    axis = np.unique(np.concatenate([np.asarray(ts, dtype=np.int64) for ts, _ in series]))
+    aligned = []
+    for ts, values in series:
+        ts = np.asarray(ts, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        ts, values = ts[present], values[present]
+        index = np.searchsorted(ts, axis, side="right") - 1
+        out = np.full(len(axis), np.nan)
+        known = index >= 0
+        out[known] = values[index[known]]
+        aligned.append(out)
+    return axis, aligned
@@ -0,0 +1,442 @@
+"""WebSocket fan-out of live device messages, one socket per browser tab.
+
+``MqttProvider.jsx`` opens one broker connection per device in every tab.
+This gateway holds a single upstream MQTT subscription per topic (spread
+over ``GATEWAY_UPSTREAM_CONNECTIONS`` broker connections) and gives each
+browser one WebSocket::
+
+    new WebSocket("wss://gateway/?fps=<frames per second>", ["sait.v1", "bearer." + token])
+
+    -> {"op": "subscribe", "topics": ["sait/.../device/subtopic", ...]}
+    <- {"type": "subscribed", "topics": [...], "rejected": [...]}
+    -> {"op": "unsubscribe", "topics": [...]}
+    <- {"type": "update", "topics": {"<topic>": {"ts": <epoch ms>, "message": {...}}}}
+
+``message`` is the device's message as published (``{"payload": {...}}``),
+so it can go straight into ``updateMqttData``. A user may only subscribe to
+topics matching their filters in the subscription file (see
+``mqtt.load_subscriptions``), the same one ``ingest`` uses.
+
+The upgrade carries the bearer token the REST APIs are called with: in an
+``Authorization: Bearer`` header or, since browsers cannot set headers on
+a WebSocket, as a ``bearer.<token>`` subprotocol offered next to
+``sait.v1``. It is verified with ``GATEWAY_JWT_KEY`` and the user is its
+``GATEWAY_JWT_USER_CLAIM`` claim; a missing, invalid or expired token gets
+a ``401`` and a user with no subscriptions a ``403``, before the upgrade.
+The session is closed when the token expires. Upgrades whose ``Origin``
+is not in ``GATEWAY_ALLOWED_ORIGINS`` get a ``403``; clients that send no
+``Origin`` (not browsers) are let through on their token.
+
+Updates are coalesced per topic: each session sends at most ``fps`` frames
+a second (``GATEWAY_FRAME_RATE`` by default and at most), each carrying the
+latest message of every topic that changed since the previous frame. A
+consumer that reads slowly keeps its socket buffer full, so its frames go
+out less often and the samples in between are dropped; memory per session
+is bounded by its subscription list, not by the message rate. An upstream
+subscription is dropped ``UNSUBSCRIBE_LINGER`` seconds after its last
+browser leaves, so page reloads do not churn the broker.
+
+Run it with::
+
+    GATEWAY_MQTT_URL=mqtts://broker:8883 GATEWAY_SUBSCRIPTIONS=subs.json \
+    GATEWAY_JWT_KEY=... GATEWAY_ALLOWED_ORIGINS=https://app.example.com python gateway.py
+
+Needs ``websockets`` and ``PyJWT`` (``aws/requirements-workers.txt``).
+
+It logs one JSON line of counters every ``STATS_INTERVAL`` seconds.
+"""
+
+import asyncio
+import http
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qs, urlsplit
+
+import jwt
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from mqtt import MQTTClient, MQTTError, load_subscriptions, topic_matches
+
+MQTT_URL = os.environ.get("GATEWAY_MQTT_URL", "mqtt://localhost:1883")
+MQTT_USERNAME = os.environ.get("GATEWAY_MQTT_USERNAME") or None
+MQTT_PASSWORD = os.environ.get("GATEWAY_MQTT_PASSWORD") or None
+SUBSCRIPTIONS_FILE = os.environ.get("GATEWAY_SUBSCRIPTIONS", "subscriptions.json")
+HOST = os.environ.get("GATEWAY_HOST", "0.0.0.0")
+PORT = int(os.environ.get("GATEWAY_PORT", "8080"))
+UPSTREAM_CONNECTIONS = int(os.environ.get("GATEWAY_UPSTREAM_CONNECTIONS", "2"))
+FRAME_RATE = float(os.environ.get("GATEWAY_FRAME_RATE", "4"))
+MAX_SUBSCRIPTIONS = int(os.environ.get("GATEWAY_MAX_SUBSCRIPTIONS", "500"))
+UNSUBSCRIBE_LINGER = float(os.environ.get("GATEWAY_UNSUBSCRIBE_LINGER", "30"))
+STATS_INTERVAL = float(os.environ.get("GATEWAY_STATS_INTERVAL", "60"))
+# HS256 secret or PEM public key of the tokens the login API issues.
+JWT_KEY = os.environ.get("GATEWAY_JWT_KEY") or None
+JWT_ALGORITHMS = os.environ.get("GATEWAY_JWT_ALGORITHMS", "HS256").split(",")
+JWT_USER_CLAIM = os.environ.get("GATEWAY_JWT_USER_CLAIM", "userId")
+ALLOWED_ORIGINS = [origin.strip() for origin in
+                   os.environ.get("GATEWAY_ALLOWED_ORIGINS", "").split(",") if origin.strip()]
+SUBPROTOCOL = "sait.v1"
+TOKEN_PROTOCOL_PREFIX = "bearer."
+RECONNECT_MAX_DELAY = 30.0
+
+logger = logging.getLogger("gateway")
+
+
+class _Topic:
+    __slots__ = ("name", "upstream", "sessions", "fragment", "linger")
+
+    def __init__(self, name, upstream):
+        self.name = name
+        self.upstream = upstream
+        self.sessions = set()
+        self.fragment = None
+        self.linger = None
+
+
+def _select_subprotocol(connection, offered):
+    # Browsers that sent their token as a subprotocol need one chosen back.
+    return SUBPROTOCOL if SUBPROTOCOL in offered else None
+
+
+def bearer_token(request):
+    """The token of an upgrade request, from its header or its subprotocols."""
+    authorization = request.headers.get("Authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token.strip():
+        return token.strip()
+    for offered in request.headers.get_all("Sec-WebSocket-Protocol"):
+        for protocol in offered.split(","):
+            protocol = protocol.strip()
+            if protocol.startswith(TOKEN_PROTOCOL_PREFIX):
+                return protocol[len(TOKEN_PROTOCOL_PREFIX):]
+    return None
+
+
+class _Session:
+    def __init__(self, ws, user_id, frame_rate):
+        self.ws = ws
+        self.user_id = user_id
+        self.interval = 1.0 / frame_rate
+        self.topics = set()
+        self.dirty = set()
+        self.wake = asyncio.Event()
+        self.frames = 0
+        self.dropped = 0
+
+
+class _Upstream:
+    """One broker connection and the topics subscribed on it; reconnects on its own."""
+
+    def __init__(self, gateway, index):
+        self.gateway = gateway
+        self.index = index
+        self.topics = set()
+        self.client = None
+        self.ready = asyncio.Event()
+
+    async def run(self):
+        gateway = self.gateway
+        delay = 1.0
+        while True:
+            client = MQTTClient(gateway.url, f"{gateway.client_id}-{self.index}",
+                                gateway.username, gateway.password)
+            try:
+                await client.connect()
+                self.client = client
+                topics = sorted(self.topics)
+                for start in range(0, len(topics), 100):
+                    await client.subscribe(topics[start:start + 100])
+                self.ready.set()
+                gateway.stats["upstreamConnects"] += 1
+                delay = 1.0
+                async for message in client.messages():
+                    gateway.deliver(message.topic, message.payload)
+            except (OSError, MQTTError, asyncio.TimeoutError) as err:
+                logger.warning("upstream %d: %s", self.index, err)
+            finally:
+                self.ready.clear()
+                self.client = None
+                await client.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    async def subscribe(self, names):
+        self.topics.update(names)
+        if self.ready.is_set():
+            try:
+                await self.client.subscribe(names)
+            except (ConnectionError, MQTTError) as err:
+                # run() subscribes everything in ``topics`` again on reconnect.
+                logger.warning("upstream %d subscribe: %s", self.index, err)
+
+    async def unsubscribe(self, names):
+        self.topics.difference_update(names)
+        if self.ready.is_set():
+            try:
+                await self.client.unsubscribe(names)
+            except ConnectionError:
+                pass
+
+
+class Gateway:
+    """Topic registry, upstream connections and browser sessions."""
+
+    def __init__(self, subscriptions, url=MQTT_URL, username=MQTT_USERNAME,
+                 password=MQTT_PASSWORD, connections=UPSTREAM_CONNECTIONS,
+                 frame_rate=FRAME_RATE, max_subscriptions=MAX_SUBSCRIPTIONS,
+                 linger=UNSUBSCRIBE_LINGER, client_id="sait-gateway", token_key=JWT_KEY,
+                 algorithms=JWT_ALGORITHMS, user_claim=JWT_USER_CLAIM, origins=ALLOWED_ORIGINS):
+        if not token_key:
+            raise ValueError("a token key is required to authenticate browsers")
+        self.token_key, self.algorithms, self.user_claim = token_key, algorithms, user_claim
+        self.origins = list(origins)
+        self.filters = {}
+        for user_id, pattern in subscriptions:
+            self.filters.setdefault(user_id, []).append(pattern)
+        self.url, self.username, self.password = url, username, password
+        self.connection_count = max(1, connections)
+        self.frame_rate = frame_rate
+        self.max_subscriptions = max_subscriptions
+        self.linger = linger
+        self.client_id = client_id
+        self.topics = {}
+        self.sessions = set()
+        self.upstreams = []
+        self._turn = 0
+        self._tasks = []
+        self.stats = dict.fromkeys(
+            ("messages", "frames", "dropped", "upstreamConnects", "sessionsOpened",
+             "sessionsRefused"), 0
+        )
+
+    # -- upstream ---------------------------------------------------------
+
+    def deliver(self, name, payload):
+        """Record the latest message of ``name`` and mark it for its sessions."""
+        topic = self.topics.get(name)
+        if topic is None:
+            return
+        self.stats["messages"] += 1
+        text = payload.decode("utf-8", "replace")
+        try:
+            json.loads(text)
+        except ValueError:
+            text = json.dumps(text)
+        topic.fragment = f'{json.dumps(name)}:{{"ts":{int(time.time() * 1000)},"message":{text}}}'
+        for session in topic.sessions:
+            if name in session.dirty:
+                session.dropped += 1
+            else:
+                session.dirty.add(name)
+                session.wake.set()
+
+    def _next_upstream(self):
+        self._turn = (self._turn + 1) % len(self.upstreams)
+        return self.upstreams[self._turn]
+
+    # -- sessions ---------------------------------------------------------
+
+    def claims(self, token):
+        """The verified claims of ``token``, or None if it is not valid now."""
+        try:
+            claims = jwt.decode(token, self.token_key, algorithms=self.algorithms,
+                                options={"require": ["exp"]})
+        except jwt.InvalidTokenError:
+            return None
+        return claims if claims.get(self.user_claim) else None
+
+    def _authenticate(self, connection, request):
+        """``process_request`` hook: refuse the upgrade unless the token names a known user."""
+        token = bearer_token(request)
+        claims = self.claims(token) if token else None
+        if claims is None:
+            self.stats["sessionsRefused"] += 1
+            response = connection.respond(
+                http.HTTPStatus.UNAUTHORIZED, "Invalid or missing token\n"
+            )
+            response.headers["WWW-Authenticate"] = "Bearer"
+            return response
+        user_id = str(claims[self.user_claim])
+        if user_id not in self.filters:
+            self.stats["sessionsRefused"] += 1
+            return connection.respond(http.HTTPStatus.FORBIDDEN, "No topics for this user\n")
+        connection.username = user_id
+        connection.expires = claims["exp"]
+        return None
+
+    def allowed(self, user_id, name):
+        return "+" not in name and "#" not in name and any(
+            topic_matches(pattern, name) for pattern in self.filters.get(user_id, ())
+        )
+
+    async def subscribe(self, session, names):
+        accepted, rejected, new = [], [], {}
+        for name in dict.fromkeys(names):
+            if not isinstance(name, str) or not self.allowed(session.user_id, name):
+                rejected.append(name)
+                continue
+            if name not in session.topics and len(session.topics) >= self.max_subscriptions:
+                rejected.append(name)
+                continue
+            topic = self.topics.get(name)
+            if topic is None:
+                topic = self.topics[name] = _Topic(name, self._next_upstream())
+                new.setdefault(topic.upstream, []).append(name)
+            if topic.linger is not None:
+                topic.linger.cancel()
+                topic.linger = None
+            topic.sessions.add(session)
+            session.topics.add(name)
+            accepted.append(name)
+            if topic.fragment is not None:
+                session.dirty.add(name)
+                session.wake.set()
+        for upstream, names in new.items():
+            await upstream.subscribe(names)
+        return accepted, rejected
+
+    def unsubscribe(self, session, names):
+        loop = asyncio.get_running_loop()
+        for name in names:
+            topic = self.topics.get(name)
+            session.topics.discard(name)
+            session.dirty.discard(name)
+            if topic is None:
+                continue
+            topic.sessions.discard(session)
+            if not topic.sessions and topic.linger is None:
+                topic.linger = loop.call_later(self.linger, self._expire, topic)
+
+    def _expire(self, topic):
+        topic.linger = None
+        if topic.sessions or self.topics.get(topic.name) is not topic:
+            return
+        del self.topics[topic.name]
+        asyncio.ensure_future(topic.upstream.unsubscribe([topic.name]))
+
+    async def _sender(self, session):
+        while True:
+            await session.wake.wait()
+            session.wake.clear()
+            began = time.monotonic()
+            parts = [self.topics[name].fragment for name in session.dirty
+                     if name in self.topics and self.topics[name].fragment]
+            session.dirty.clear()
+            if parts:
+                # Waits while the browser is behind; newer samples replace
+                # the pending ones in the meantime.
+                try:
+                    await session.ws.send('{"type":"update","topics":{' + ",".join(parts) + "}}")
+                except ConnectionClosed:
+                    return
+                session.frames += 1
+                self.stats["frames"] += 1
+            await asyncio.sleep(max(0.0, session.interval - (time.monotonic() - began)))
+
+    async def handle(self, ws):
+        query = parse_qs(urlsplit(ws.request.path).query)
+        try:
+            fps = min(float(query.get("fps", [self.frame_rate])[0]), self.frame_rate)
+        except ValueError:
+            fps = self.frame_rate
+        session = _Session(ws, ws.username, max(fps, 0.1))
+        self.sessions.add(session)
+        self.stats["sessionsOpened"] += 1
+        sender = asyncio.ensure_future(self._sender(session))
+        loop = asyncio.get_running_loop()
+        expiry = loop.call_later(
+            max(0.0, ws.expires - time.time()),
+            lambda: asyncio.ensure_future(ws.close(1008, "token expired")),
+        )
+        try:
+            async for text in ws:
+                try:
+                    request = json.loads(text)
+                    op, names = request.get("op"), request.get("topics")
+                except (ValueError, AttributeError):
+                    op, names = None, None
+                if op not in ("subscribe", "unsubscribe") or not isinstance(names, list):
+                    await ws.send(json.dumps({"type": "error", "error": "invalid request"}))
+                elif op == "subscribe":
+                    accepted, rejected = await self.subscribe(session, names)
+                    await ws.send(json.dumps(
+                        {"type": "subscribed", "topics": accepted, "rejected": rejected}
+                    ))
+                else:
+                    self.unsubscribe(session, names)
+        except ConnectionClosed:
+            pass
+        finally:
+            expiry.cancel()
+            sender.cancel()
+            self.unsubscribe(session, list(session.topics))
+            self.sessions.discard(session)
+            self.stats["dropped"] += session.dropped
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            print(json.dumps(self.snapshot()), flush=True)
+
+    def snapshot(self):
+        return dict(
+            self.stats,
+            sessions=len(self.sessions),
+            topics=len(self.topics),
+            dropped=self.stats["dropped"] + sum(session.dropped for session in self.sessions),
+            upstreamConnections=sum(upstream.ready.is_set() for upstream in self.upstreams),
+        )
+
+    async def start(self, host=HOST, port=PORT):
+        """Connect upstream and start listening; returns the ``asyncio.Server``."""
+        self.upstreams = [_Upstream(self, index) for index in range(self.connection_count)]
+        self._tasks = [asyncio.ensure_future(upstream.run()) for upstream in self.upstreams]
+        self._tasks.append(asyncio.ensure_future(self._report()))
+        return await serve(
+            self.handle, host, port,
+            # ``None`` lets non-browser clients, which send no Origin, through.
+            origins=[*self.origins, None],
+            process_request=self._authenticate,
+            select_subprotocol=_select_subprotocol,
+        )
+
+    async def stop(self, server):
+        server.close()
+        await server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="WebSocket fan-out gateway for live telemetry")
+    parser.add_argument("--subscriptions", default=SUBSCRIPTIONS_FILE)
+    parser.add_argument("--url", default=MQTT_URL)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if not JWT_KEY:
+        parser.error("GATEWAY_JWT_KEY is not set")
+
+    async def serve():
+        gateway = Gateway(load_subscriptions(args.subscriptions), url=args.url)
+        server = await gateway.start(args.host, args.port)
+        try:
+            await server.serve_forever()
+        finally:
+            await gateway.stop(server)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,655 @@
+"""Downsampled telemetry for the history charts and ``reportes.jsx``.
+
+Routes, as wired in ``template.yaml``::
+
+    GET /historical?userId&device_id&subtopic&variables&start_date&end_date
+    GET /filtromqtt?userId&topic&filter=5m|30m|1h|3h|12h|custom&startDate&endDate
+    POST /filtromqtt:batch   every widget of a dashboard at once (see get_widgets)
+    POST /formulas:series    FormulaComponent formulas over history (see get_formulas)
+    POST /mqtthistorico      last samples of the dashboard's live topics (see get_latest)
+
+Both take ``points`` (default ``DEFAULT_POINTS``) and return at most that
+many points per variable, whatever the window, so a 30-day chart costs the
+same to draw as a 5-minute one. ``mode`` picks how:
+
+* ``buckets`` (default): equal time buckets with min/max/avg/last each.
+* ``lttb``: Largest-Triangle-Three-Buckets samples of the raw series.
+
+Windows that already hold ``points`` samples or fewer are returned raw.
+Bucketed windows long enough for a rollup resolution (see
+``telemetry_rollups.pick_resolution``) are read from the 1m/1h/1d rollups
+rather than from raw telemetry; ``resolution`` in the response says which
+was used.
+
+``format=columns`` returns every variable on one shared timestamp axis::
+
+    {"timestamps": [...], "series": {"temp": {"avg": [...], "min": [...], ...}},
+     "mode": "buckets", "bucketMs": 3600000, "resolution": "1h", "rawPoints": 812345,
+     "truncated": false}
+
+Without it the routes keep the row shapes the widgets already read
+(``{timestamp, var: value}`` for ``/historical`` and
+``{timestamp, values: {var: value}}`` for ``/filtromqtt``), using each
+bucket's ``avg`` (or ``agg=min|max|last``).
+
+Dates without a UTC offset are read in the zone given by ``tz`` (IANA
+name) or ``utcOffset`` (minutes east of UTC); without either they are
+rejected with a 400. The batch routes also take them at the top level of
+the body, for every entry that does not set its own.
+"""
+
+import os
+
+import metrics
+
+import numpy as np
+
+import downsample
+import formulas
+import telemetry
+import telemetry_rollups
+from apigw import HttpError, json_body, query_params, response, route_handler
+
+DEFAULT_POINTS = int(os.environ.get("HISTORICAL_DEFAULT_POINTS", "1000"))
+MAX_POINTS = 5000
+MODES = ("buckets", "lttb")
+FORMATS = ("rows", "columns")
+AGGS = ("avg", "min", "max", "last")
+MAX_BATCH_WIDGETS = 50
+MAX_FORMULA_VARIABLES = 10
+LATEST_POINTS = int(os.environ.get("HISTORICAL_LATEST_POINTS", "100"))
+MAX_LATEST_TOPICS = 100
+BATCH_READ_WORKERS = int(os.environ.get("HISTORICAL_READ_WORKERS", "8"))
+DECIMALS = 6
+
+
+def _int_param(params, name, default, maximum):
+    raw = params.get(name)
+    if raw in (None, ""):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise HttpError(400, f"{name} must be an integer") from None
+    if not 1 <= value <= maximum:
+        raise HttpError(400, f"{name} must be between 1 and {maximum}")
+    return value
+
+
+def _choice(params, name, choices):
+    value = params.get(name) or choices[0]
+    if value not in choices:
+        raise HttpError(400, f"{name} must be one of {', '.join(choices)}")
+    return value
+
+
+def _variables(raw):
+    names = [name.strip() for name in (raw or "").split(",") if name.strip()]
+    return list(dict.fromkeys(names)) or None
+
+
+def _raw_series(ts, columns):
+    return {
+        "timestamps": downsample.to_list(ts),
+        "series": {
+            name: {"value": downsample.to_list(values, DECIMALS)}
+            for name, values in columns.items()
+        },
+        "mode": "raw",
+    }
+
+
+def _bucket_series(starts, width, stats):
+    starts, stats = downsample.drop_empty(starts, stats)
+    return {
+        "timestamps": downsample.to_list(starts),
+        "series": {
+            name: {
+                agg: downsample.to_list(series[agg], DECIMALS) for agg in downsample.AGGREGATES
+            }
+            for name, series in stats.items()
+        },
+        "mode": "buckets",
+        "bucketMs": width,
+    }
+
+
+def _lttb_series(ts, columns, points):
+    picks = {name: downsample.lttb(ts, values, points) for name, values in columns.items()}
+    if picks:
+        axis = np.unique(np.concatenate([ts[index] for index in picks.values()]))
+    else:
+        axis = ts[:0]
+    series = {}
+    for name, index in picks.items():
+        aligned = np.full(len(axis), np.nan)
+        aligned[np.searchsorted(axis, ts[index])] = columns[name][index]
+        series[name] = {"value": downsample.to_list(aligned, DECIMALS)}
+    return {"timestamps": downsample.to_list(axis), "series": series, "mode": "lttb"}
+
+
+def _plan(start_ms, end_ms, points, mode):
+    """Where a query reads from: a rollup resolution, or ``"raw"``."""
+    if mode == "buckets":
+        return telemetry_rollups.pick_resolution(start_ms, end_ms, points) or "raw"
+    return "raw"
+
+
+def _from_raw(ts, columns, truncated, start_ms, end_ms, points, mode, variables=None):
+    if variables:
+        columns = {name: columns.get(name, np.full(len(ts), np.nan)) for name in variables}
+    if len(ts) <= points:
+        result = _raw_series(ts, columns)
+    elif mode == "lttb":
+        result = _lttb_series(ts, columns, points)
+    else:
+        result = _bucket_series(*downsample.bucketize(ts, columns, start_ms, end_ms, points))
+    result.update({"resolution": "raw", "rawPoints": int(len(ts)), "truncated": truncated})
+    return result
+
+
+def _from_rollups(rows, start_ms, end_ms, points, resolution, variables=None):
+    ts, messages, partials = rows
+    if variables:
+        partials = {
+            name: partials.get(name) or telemetry_rollups.empty_parts(len(ts))
+            for name in variables
+        }
+    starts, width, stats, total = telemetry_rollups.rebucket(
+        ts, messages, partials, start_ms, end_ms, points, resolution
+    )
+    result = _bucket_series(starts, width, stats)
+    result.update({"resolution": resolution, "rawPoints": total, "truncated": False})
+    return result
+
+
+def _read(series, resolution, start_ms, end_ms, variables):
+    if resolution == "raw":
+        return telemetry.read_raw(series, start_ms, end_ms, variables)
+    return telemetry_rollups.read_rollups(series, resolution, start_ms, end_ms, variables)
+
+
+def _shape(data, query):
+    """Result for one query from ``data`` read by :func:`_read` over a window covering it."""
+    start_ms, end_ms = query["start"], query["end"]
+    if query["resolution"] == "raw":
+        ts, columns, truncated = data
+        lo, hi = np.searchsorted(ts, [start_ms, end_ms + 1])
+        columns = {name: values[lo:hi] for name, values in columns.items()}
+        result = _from_raw(
+            ts[lo:hi],
+            columns,
+            truncated,
+            start_ms,
+            end_ms,
+            query["points"],
+            query["mode"],
+            query["variables"],
+        )
+    else:
+        result = _from_rollups(
+            data, start_ms, end_ms, query["points"], query["resolution"], query["variables"]
+        )
+    result.update({"start": start_ms, "end": end_ms})
+    return result
+
+
+def query_series(
+    user_id, device_id, subtopic, variables, start_ms, end_ms, points, mode="buckets"
+):
+    """Downsampled columns for one series; the body of ``format=columns``."""
+    query = {
+        "series": telemetry.series_id(user_id, device_id, subtopic),
+        "variables": variables,
+        "start": start_ms,
+        "end": end_ms,
+        "points": points,
+        "mode": mode,
+        "resolution": _plan(start_ms, end_ms, points, mode),
+    }
+    data = _read(query["series"], query["resolution"], start_ms, end_ms, variables)
+    return _shape(data, query)
+
+
+def _merged_reads(queries):
+    """Group queries into reads: same series and source, overlapping windows merged.
+
+    Returns ``[(series, resolution, start, end, variables, [query, ...]), ...]``
+    where ``variables`` is the union the members need (``None`` for all).
+    """
+    groups = {}
+    for query in queries:
+        groups.setdefault((query["series"], query["resolution"]), []).append(query)
+    reads = []
+    for (series, resolution), members in groups.items():
+        members.sort(key=lambda query: query["start"])
+        current = None
+        for query in members:
+            if current and query["start"] <= current["end"]:
+                current["end"] = max(current["end"], query["end"])
+                current["members"].append(query)
+            else:
+                current = {"start": query["start"], "end": query["end"], "members": [query]}
+                reads.append((series, resolution, current))
+    merged = []
+    for series, resolution, window in reads:
+        wanted = [query["variables"] for query in window["members"]]
+        variables = None
+        if all(wanted):
+            variables = sorted({name for names in wanted for name in names})
+        merged.append(
+            (series, resolution, window["start"], window["end"], variables, window["members"])
+        )
+    return merged
+
+
+def batch_query(queries, max_workers=BATCH_READ_WORKERS):
+    """Run many queries with one read per series, source and overlapping window.
+
+    Each query dict carries ``series``, ``variables``, ``start``, ``end``,
+    ``points`` and ``mode``. Reads run on a thread pool; every query is then
+    downsampled from the read that covers it. Returns the results in input
+    order and the number of reads made.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    for query in queries:
+        query["resolution"] = _plan(query["start"], query["end"], query["points"], query["mode"])
+    reads = _merged_reads(queries)
+    if not reads:
+        return [], 0
+
+    def run(read):
+        series, resolution, start_ms, end_ms, variables, members = read
+        data = _read(series, resolution, start_ms, end_ms, variables)
+        return [(id(query), _shape(data, query)) for query in members]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(reads))) as pool:
+        shaped = dict(pair for pairs in pool.map(run, reads) for pair in pairs)
+    return [shaped[id(query)] for query in queries], len(reads)
+
+
+def _row_values(result, agg):
+    key = "value" if result["mode"] != "buckets" else agg
+    return {name: series[key] for name, series in result["series"].items()}
+
+
+def to_rows(result, agg="avg", nested=False):
+    """Row-per-timestamp view of :func:`query_series`; ``None`` values are left out."""
+    values = _row_values(result, agg)
+    rows = []
+    for i, ts in enumerate(result["timestamps"]):
+        point = {name: column[i] for name, column in values.items() if column[i] is not None}
+        row = {"timestamp": telemetry.iso_ms(ts)}
+        if nested:
+            row["values"] = point
+        else:
+            row.update(point)
+        rows.append(row)
+    return rows
+
+
+def _respond(params, result, nested):
+    if _choice(params, "format", FORMATS) == "columns":
+        return response(200, result)
+    agg = _choice(params, "agg", AGGS)
+    return response(200, to_rows(result, agg, nested))
+
+
+def _query(params, device_id, subtopic, start_ms, end_ms):
+    user_id = params.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+    if not device_id or not subtopic:
+        raise HttpError(400, "device_id and subtopic (or topic) are required")
+    return query_series(
+        user_id,
+        device_id,
+        subtopic,
+        _variables(params.get("variables")),
+        start_ms,
+        end_ms,
+        _int_param(params, "points", DEFAULT_POINTS, MAX_POINTS),
+        _choice(params, "mode", MODES),
+    )
+
+
+def _time_zone(params, default=None):
+    try:
+        if default is not None and not params.get("tz") and params.get("utcOffset") in (None, ""):
+            return default
+        return telemetry.time_zone(params)
+    except ValueError as err:
+        raise HttpError(400, str(err)) from None
+
+
+def get_historical(event):
+    params = query_params(event)
+    tz = _time_zone(params)
+    try:
+        start_ms, end_ms = telemetry.time_window(
+            params.get("start_date"), params.get("end_date"), tz=tz
+        )
+    except ValueError as err:
+        raise HttpError(400, f"Invalid start_date/end_date: {err}") from None
+    result = _query(params, params.get("device_id"), params.get("subtopic"), start_ms, end_ms)
+    return _respond(params, result, nested=False)
+
+
+def _filter_window(params, default="1h", tz=None):
+    """``(start_ms, end_ms)`` from ``filter`` (a preset or ``custom``) and the date params.
+
+    ``tz`` is the zone for dates without an offset when ``params`` names none.
+    """
+    tz = _time_zone(params, tz)
+    filter_name = params.get("filter") or default
+    if filter_name != "custom" and filter_name not in telemetry.FILTER_WINDOWS_MS:
+        raise HttpError(400, f"Unknown filter {filter_name!r}")
+    if filter_name == "custom" and not params.get("startDate"):
+        raise HttpError(400, "startDate is required for the custom filter")
+    try:
+        return telemetry.time_window(
+            params.get("startDate") if filter_name == "custom" else None,
+            params.get("endDate") if filter_name == "custom" else None,
+            filter_name,
+            tz,
+        )
+    except ValueError as err:
+        raise HttpError(400, f"Invalid startDate/endDate: {err}") from None
+
+
+def _topic(params):
+    if params.get("topic"):
+        return telemetry.split_topic(params["topic"])
+    return params.get("device_id"), params.get("subtopic")
+
+
+def get_filtromqtt(event):
+    params = query_params(event)
+    start_ms, end_ms = _filter_window(params)
+    device_id, subtopic = _topic(params)
+    result = _query(params, device_id, subtopic, start_ms, end_ms)
+    return _respond(params, result, nested=True)
+
+
+def _widget_query(user_id, spec, tz=None):
+    if not isinstance(spec, dict):
+        raise HttpError(400, "widget must be a JSON object")
+    device_id, subtopic = _topic(spec)
+    if not device_id or not subtopic:
+        raise HttpError(400, "topic (or device_id and subtopic) is required")
+    variables = spec.get("variables")
+    if isinstance(variables, list):
+        variables = ",".join(str(name) for name in variables)
+    start_ms, end_ms = _filter_window(spec, tz=tz)
+    return {
+        "series": telemetry.series_id(user_id, device_id, subtopic),
+        "variables": _variables(variables),
+        "start": start_ms,
+        "end": end_ms,
+        "points": _int_param(spec, "points", DEFAULT_POINTS, MAX_POINTS),
+        "mode": _choice(spec, "mode", MODES),
+        "format": _choice(spec, "format", FORMATS),
+        "agg": _choice(spec, "agg", AGGS),
+    }
+
+
+def get_widgets(event):
+    """Series for every widget of a dashboard in one call (``POST /filtromqtt:batch``).
+
+    The body is ``{"userId": ..., "widgets": [{"id", "topic", "variables",
+    "filter", "startDate", "endDate", "points", "mode", "format", "agg"}]}``
+    with the same meaning as the ``/filtromqtt`` parameters. Widgets on the
+    same topic whose windows overlap share one read, so the cost follows
+    the number of distinct topics rather than the number of widgets. Each
+    widget comes back as ``ok`` with its ``data`` or ``failed`` with the
+    reason, and any failure makes the status 207.
+    """
+    body = json_body(event)
+    user_id = body.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    specs = body.get("widgets")
+    if not isinstance(specs, list) or not specs:
+        raise HttpError(400, "widgets must be a non-empty list")
+    if len(specs) > MAX_BATCH_WIDGETS:
+        raise HttpError(400, f"At most {MAX_BATCH_WIDGETS} widgets per request")
+    tz = _time_zone(body)
+
+    results, queries = [], []
+    for index, spec in enumerate(specs):
+        widget_id = spec.get("id", index) if isinstance(spec, dict) else index
+        try:
+            query = _widget_query(user_id, spec, tz)
+        except HttpError as err:
+            results.append({"id": widget_id, "status": "failed", "error": err.message})
+            continue
+        query.update({"id": widget_id, "index": index})
+        queries.append(query)
+        results.append(None)
+
+    shaped, reads = batch_query(queries)
+    for query, result in zip(queries, shaped):
+        data = result if query["format"] == "columns" else to_rows(result, query["agg"], True)
+        results[query["index"]] = {"id": query["id"], "status": "ok", "data": data}
+
+    failed = any(result["status"] == "failed" for result in results)
+    return response(207 if failed else 200, {"widgets": results, "reads": reads})
+
+
+def _formula_queries(user_id, spec, tz=None):
+    """``(formula, queries)`` for one formula spec; one query per ``varN`` it uses."""
+    if not isinstance(spec, dict):
+        raise HttpError(400, "formula must be a JSON object")
+    try:
+        formula = formulas.compile_formula(spec.get("formula"))
+    except formulas.FormulaError as err:
+        raise HttpError(400, str(err)) from None
+    if not formula.variables:
+        raise HttpError(400, "formula must use at least one of var1, var2, ...")
+    inputs = spec.get("variables")
+    if not isinstance(inputs, list) or not inputs:
+        raise HttpError(400, "variables must be a non-empty list")
+    if len(inputs) > MAX_FORMULA_VARIABLES:
+        raise HttpError(400, f"At most {MAX_FORMULA_VARIABLES} variables per formula")
+    start_ms, end_ms = _filter_window(spec, tz=tz)
+    points = _int_param(spec, "points", DEFAULT_POINTS, MAX_POINTS)
+    queries = []
+    for name in formula.variables:
+        position = int(name[3:]) - 1
+        source = inputs[position] if position < len(inputs) else None
+        if not isinstance(source, dict) or not source.get("variable") or not source.get("value"):
+            raise HttpError(400, f"{name} has no topic and value")
+        device_id, subtopic = telemetry.split_topic(source["variable"])
+        if not device_id or not subtopic:
+            raise HttpError(400, f"{name}: {source['variable']!r} is not a device topic")
+        queries.append({
+            "series": telemetry.series_id(user_id, device_id, subtopic),
+            "variables": [source["value"]],
+            "start": start_ms,
+            "end": end_ms,
+            "points": points,
+            "mode": "buckets",
+            "name": name,
+        })
+    return formula, queries
+
+
+def derived_series(formula, queries, results, agg="avg"):
+    """Evaluate ``formula`` over the :func:`batch_query` ``results`` of its ``queries``.
+
+    Inputs are aligned with :func:`formulas.align`, so series on different
+    topics, or windows returned raw, still line up. The result has the
+    ``format=columns`` shape with a single ``value`` series. Raises
+    :class:`formulas.FormulaError` if the formula cannot be evaluated.
+    """
+    inputs = []
+    for query, result in zip(queries, results):
+        key = agg if result["mode"] == "buckets" else "value"
+        column = result["series"][query["variables"][0]][key]
+        values = np.array([np.nan if value is None else value for value in column])
+        inputs.append((np.array(result["timestamps"], dtype=np.int64), values))
+    axis, aligned = formulas.align(inputs)
+    values = formula.evaluate(dict(zip((query["name"] for query in queries), aligned)))
+    values = np.where(np.isfinite(values), values, np.nan)
+    return {
+        "timestamps": downsample.to_list(axis),
+        "series": {"value": {"value": downsample.to_list(values, DECIMALS)}},
+        "mode": "derived",
+        "formula": formula.text,
+        "resolution": results[0]["resolution"] if results else None,
+        "rawPoints": sum(result["rawPoints"] for result in results),
+        "truncated": any(result["truncated"] for result in results),
+    }
+
+
+def get_formulas(event):
+    """History of ``FormulaComponent`` formulas (``POST /formulas:series``).
+
+    The body is ``{"userId": ..., "formulas": [{"id", "formula",
+    "variables": [{"variable": topic, "value": name}, ...], "filter",
+    "startDate", "endDate", "points", "format", "agg"}]}``, the fields the
+    dashboard saves for the component plus the ``/filtromqtt`` window ones.
+    Every input of every formula is read through :func:`batch_query`, so a
+    whole dashboard costs one read per topic, and each formula is compiled
+    once per container (see ``formulas``). Results come back per formula as
+    in ``/filtromqtt:batch``, with 207 if any failed.
+    """
+    body = json_body(event)
+    user_id = body.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    specs = body.get("formulas")
+    if not isinstance(specs, list) or not specs:
+        raise HttpError(400, "formulas must be a non-empty list")
+    if len(specs) > MAX_BATCH_WIDGETS:
+        raise HttpError(400, f"At most {MAX_BATCH_WIDGETS} formulas per request")
+    tz = _time_zone(body)
+
+    results, planned, queries = [], [], []
+    for index, spec in enumerate(specs):
+        formula_id = spec.get("id", index) if isinstance(spec, dict) else index
+        try:
+            formula, formula_queries = _formula_queries(user_id, spec, tz)
+            options = (_choice(spec, "format", FORMATS), _choice(spec, "agg", AGGS))
+        except HttpError as err:
+            results.append({"id": formula_id, "status": "failed", "error": err.message})
+            continue
+        planned.append((index, formula_id, formula, formula_queries, options))
+        queries.extend(formula_queries)
+        results.append(None)
+
+    shaped, reads = batch_query(queries)
+    offset = 0
+    for index, formula_id, formula, formula_queries, (fmt, agg) in planned:
+        inputs = shaped[offset:offset + len(formula_queries)]
+        offset += len(formula_queries)
+        try:
+            result = derived_series(formula, formula_queries, inputs, agg)
+        except formulas.FormulaError as err:
+            results[index] = {"id": formula_id, "status": "failed", "error": str(err)}
+            continue
+        data = result if fmt == "columns" else to_rows(result, nested=True)
+        results[index] = {"id": formula_id, "status": "ok", "data": data}
+
+    failed = any(result["status"] == "failed" for result in results)
+    return response(207 if failed else 200, {"formulas": results, "reads": reads})
+
+
+def latest_columns(series, points, variables=None):
+    """The last ``points`` samples of one series, oldest first.
+
+    ``{"time": [epoch ms, ...], "values": {var: [number or None, ...]}}``,
+    the shape ``Dashboard.jsx`` builds for its live widgets. One descending
+    Query with ``Limit``, however long the history.
+    """
+    projection, names = telemetry.payload_projection(variables)
+    pages = telemetry.query_pages(
+        series, 0, telemetry.now_ms() + 86_400_000, projection, names,
+        descending=True, limit=points,
+    )
+    items = next(pages, [])[:points]
+    items.reverse()
+    time, values = [], {name: [] for name in variables or ()}
+    for row, item in enumerate(items):
+        time.append(int(item["ts"]["N"]))
+        for name, attr in item.get("payload", {}).get("M", {}).items():
+            number = telemetry.attr_number(attr)
+            column = values.get(name)
+            if column is None:
+                if variables or number is None:
+                    continue
+                column = values[name] = []
+            column.extend([None] * (row - len(column)))
+            column.append(number)
+    for column in values.values():
+        column.extend([None] * (len(time) - len(column)))
+    return {"time": time, "values": values}
+
+
+def _latest_rows(columns):
+    rows = []
+    for i, ts in enumerate(columns["time"]):
+        value = {name: column[i] for name, column in columns["values"].items()
+                 if column[i] is not None}
+        rows.append({"timestamp": telemetry.iso_ms(ts), "value": value})
+    return rows
+
+
+def get_latest(event):
+    """Warm start for a dashboard's live widgets (``POST /mqtthistorico``).
+
+    The body is ``{"userId": ..., "topics": [{"device_id", "subtopic"}],
+    "points", "variables", "format"}``. Returns ``{"<device_id>:<subtopic>":
+    ...}`` with the last ``points`` (default ``LATEST_POINTS``) samples of
+    each topic, already sorted oldest first; all topics are read at once.
+    ``format=columns`` gives each topic as :func:`latest_columns`, ready for
+    the widgets as is; without it each topic is the list of ``{timestamp,
+    value: {var: value}}`` rows the dashboard used to sort itself.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    body = json_body(event)
+    user_id = body.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    topics = body.get("topics")
+    if not isinstance(topics, list) or not topics:
+        raise HttpError(400, "topics must be a non-empty list")
+    keys = {}
+    for topic in topics:
+        if not isinstance(topic, dict) or not topic.get("device_id") or not topic.get("subtopic"):
+            raise HttpError(400, "every topic needs device_id and subtopic")
+        device_id, subtopic = str(topic["device_id"]), str(topic["subtopic"])
+        keys[f"{device_id}:{subtopic}"] = telemetry.series_id(user_id, device_id, subtopic)
+    if len(keys) > MAX_LATEST_TOPICS:
+        raise HttpError(400, f"At most {MAX_LATEST_TOPICS} topics per request")
+    points = _int_param(body, "points", LATEST_POINTS, MAX_POINTS)
+    variables = body.get("variables")
+    if isinstance(variables, list):
+        variables = ",".join(str(name) for name in variables)
+    variables = _variables(variables)
+    columnar = _choice(body, "format", FORMATS) == "columns"
+
+    def read(series):
+        columns = latest_columns(series, points, variables)
+        return columns if columnar else _latest_rows(columns)
+
+    with ThreadPoolExecutor(max_workers=min(BATCH_READ_WORKERS, len(keys))) as pool:
+        results = dict(zip(keys, pool.map(read, keys.values())))
+    return response(200, results)
+
+
+ROUTES = {
+    ("GET", "/historical"): get_historical,
+    ("GET", "/filtromqtt"): get_filtromqtt,
+    ("POST", "/filtromqtt:batch"): get_widgets,
+    ("POST", "/formulas:series"): get_formulas,
+    ("POST", "/mqtthistorico"): get_latest,
+}
+
+
+lambda_handler = route_handler("historical", ROUTES)
+
+
+metrics.init_finished()
@@ -0,0 +1,404 @@
+"""Long-running MQTT -> ``TELEMETRY_TABLE`` ingestion worker.
+
+Subscribes to every device topic over ``INGEST_CONNECTIONS`` broker
+connections (the filters are spread across them, many per connection),
+parses each message's JSON ``payload`` and writes it as a telemetry item
+(see ``telemetry``). Everything downstream - rollups, alarms, the catalog -
+then follows from the table's stream.
+
+Which user a topic belongs to comes from the subscription list, a JSON
+file of ``{"userId": ..., "topic": <MQTT filter>}`` entries
+(``INGEST_SUBSCRIPTIONS``). As in ``MqttProvider.jsx``, the last two
+levels of a topic are the device id and the subtopic, and topics with
+fewer than ``MIN_TOPIC_LEVELS`` levels are ignored.
+
+Writes are batched:
+
+* each series (one DynamoDB partition) has its own buffer; samples that
+  land on the same millisecond are moved to the next one so no write
+  replaces another;
+* once ``BATCH_ITEMS`` samples are buffered they go out as one
+  ``BatchWriteItem``, taken round-robin across series so a batch spreads
+  over partitions; anything older than ``FLUSH_INTERVAL`` seconds is sent
+  even if the batch is not full;
+* at most ``MAX_INFLIGHT`` batches are in flight (boto3 runs in threads);
+* items DynamoDB left unprocessed, or whose batch failed, go back to the
+  front of their series buffer and are written again; only an item
+  DynamoDB rejects outright (e.g. over 400 KB) is dropped, as ``rejected``.
+
+At QoS 1 (``INGEST_MQTT_QOS=1``) a message is acknowledged to the broker
+only once its item is written (or rejected), and the sessions are
+persistent, so what is buffered when the worker dies is delivered again.
+The broker then holds at most its in-flight window of unacknowledged
+messages per connection (mosquitto's ``max_inflight_messages``); keep it
+at ``BATCH_ITEMS`` or more or batches will wait on ``FLUSH_INTERVAL``.
+
+Backpressure runs the other way: when every flush slot is busy, or retried
+items fill the buffers, the batcher stops taking messages, the bounded
+queue (``QUEUE_SIZE``) fills, the MQTT readers stop reading their sockets
+and TCP slows the broker down. Nothing is buffered without limit. Needs
+``paho-mqtt`` (see ``mqtt``). Run it with::
+
+    INGEST_MQTT_URL=mqtts://broker:8883 INGEST_SUBSCRIPTIONS=subs.json python ingest.py
+
+It logs one JSON line of counters every ``STATS_INTERVAL`` seconds.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+
+import dynamo
+import telemetry
+from mqtt import MQTTClient, MQTTError, load_subscriptions, topic_matches
+
+MQTT_URL = os.environ.get("INGEST_MQTT_URL", "mqtt://localhost:1883")
+MQTT_USERNAME = os.environ.get("INGEST_MQTT_USERNAME") or None
+MQTT_PASSWORD = os.environ.get("INGEST_MQTT_PASSWORD") or None
+MQTT_QOS = int(os.environ.get("INGEST_MQTT_QOS", "0"))
+SUBSCRIPTIONS_FILE = os.environ.get("INGEST_SUBSCRIPTIONS", "subscriptions.json")
+CONNECTIONS = int(os.environ.get("INGEST_CONNECTIONS", "4"))
+QUEUE_SIZE = int(os.environ.get("INGEST_QUEUE_SIZE", "20000"))
+BATCH_ITEMS = dynamo.BATCH_WRITE_SIZE
+FLUSH_INTERVAL = float(os.environ.get("INGEST_FLUSH_INTERVAL", "1.0"))
+MAX_INFLIGHT = int(os.environ.get("INGEST_MAX_INFLIGHT", "16"))
+STATS_INTERVAL = float(os.environ.get("INGEST_STATS_INTERVAL", "60"))
+MIN_TOPIC_LEVELS = int(os.environ.get("INGEST_MIN_TOPIC_LEVELS", "4"))
+RECONNECT_MAX_DELAY = 30.0
+# Rounds of retrying unprocessed items once the worker is told to stop.
+STOP_RETRIES = 3
+
+logger = logging.getLogger("ingest")
+
+
+class TopicRouter:
+    """Maps a topic to ``(userId, series)`` through the subscription filters."""
+
+    def __init__(self, subscriptions, min_levels=MIN_TOPIC_LEVELS, max_topics=100_000):
+        self.exact, self.patterns = {}, []
+        for user, topic in subscriptions:
+            if "+" in topic or "#" in topic:
+                self.patterns.append((user, topic))
+            else:
+                self.exact[topic] = user
+        self.min_levels = max(2, min_levels)
+        self.max_topics = max_topics
+        self._cache = OrderedDict()
+
+    def route(self, topic):
+        cached = self._cache.get(topic)
+        if cached is not None:
+            return cached
+        user = self.exact.get(topic)
+        if user is None:
+            user = next((owner for owner, pattern in self.patterns
+                         if topic_matches(pattern, topic)), None)
+        if user is None or topic.count("/") + 1 < self.min_levels:
+            return None
+        routed = (user, telemetry.series_id(user, *telemetry.split_topic(topic)))
+        self._cache[topic] = routed
+        if len(self._cache) > self.max_topics:
+            self._cache.popitem(last=False)
+        return routed
+
+
+def to_attr(value):
+    """Python JSON value -> DynamoDB attribute value (``None`` when unstorable)."""
+    if isinstance(value, bool):
+        return {"BOOL": value}
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return {"N": repr(value)}
+    if isinstance(value, str):
+        return {"S": value}
+    if value is None:
+        return {"NULL": True}
+    if isinstance(value, dict):
+        return {"M": {key: attr for key, attr in ((k, to_attr(v)) for k, v in value.items())
+                      if attr is not None}}
+    if isinstance(value, list):
+        return {"L": [attr for attr in map(to_attr, value) if attr is not None]}
+    return None
+
+
+def parse_payload(body):
+    """The ``payload`` object of a device message as a typed map, or ``None``."""
+    try:
+        message = json.loads(body)
+    except (UnicodeDecodeError, ValueError):
+        return None
+    payload = message.get("payload") if isinstance(message, dict) else None
+    if not isinstance(payload, dict) or not payload:
+        return None
+    return to_attr(payload)
+
+
+def _key(item):
+    return item["pk"]["S"], item["ts"]["N"]
+
+
+class Ingestor:
+    """Buffers parsed messages per series and writes them in ``BatchWriteItem`` calls."""
+
+    def __init__(self, subscriptions, url=MQTT_URL, username=MQTT_USERNAME,
+                 password=MQTT_PASSWORD, connections=CONNECTIONS, qos=MQTT_QOS,
+                 queue_size=QUEUE_SIZE, flush_interval=FLUSH_INTERVAL,
+                 max_inflight=MAX_INFLIGHT, table=None, client_id="sait-ingest"):
+        self.subscriptions = list(subscriptions)
+        self.router = TopicRouter(self.subscriptions)
+        self.url, self.username, self.password = url, username, password
+        self.connections = max(1, min(connections, len(self.subscriptions) or 1))
+        self.qos = qos
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.max_inflight = max_inflight
+        self.table = table or telemetry.TELEMETRY_TABLE
+        self.client_id = client_id
+        self.stats = dict.fromkeys(
+            ("received", "unrouted", "invalid", "written", "retried", "rejected", "batches",
+             "connects"), 0
+        )
+        self._buffers = OrderedDict()
+        self._buffered = 0
+        self._last_ts = {}
+        self._flushes = set()
+        self._clients = []
+        self._executor = None
+        self.stopping = None
+
+    # -- MQTT side --------------------------------------------------------
+
+    def _filters(self, index):
+        return [topic for i, (_, topic) in enumerate(self.subscriptions)
+                if i % self.connections == index]
+
+    async def _connection(self, index, queue):
+        filters = self._filters(index)
+        delay = 1.0
+        while not self.stopping.is_set():
+            client = MQTTClient(self.url, f"{self.client_id}-{index}", self.username,
+                                self.password, max_pending=max(1, self.queue_size // 10),
+                                manual_ack=True, clean=not self.qos)
+            try:
+                await client.connect()
+                for start in range(0, len(filters), 100):
+                    await client.subscribe(filters[start:start + 100], self.qos)
+                self.stats["connects"] += 1
+                delay = 1.0
+                async for message in client.messages():
+                    self.stats["received"] += 1
+                    ack = functools.partial(client.ack, message) if message.qos else None
+                    received_ms = int(time.time() * 1000)
+                    await queue.put((message.topic, message.payload, received_ms, ack))
+            except (OSError, MQTTError, asyncio.TimeoutError) as err:
+                logger.warning("connection %d: %s", index, err)
+            finally:
+                if self.stopping.is_set():
+                    # Still needed to acknowledge what the last batches write.
+                    self._clients.append(client)
+                else:
+                    await client.close()
+            if not self.stopping.is_set():
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+
+    # -- DynamoDB side ----------------------------------------------------
+
+    def _buffer(self, topic, body, received_ms, ack=None):
+        routed = self.router.route(topic)
+        payload = None if routed is None else parse_payload(body)
+        if payload is None:
+            self.stats["unrouted" if routed is None else "invalid"] += 1
+            if ack is not None:
+                ack()  # never going to be stored; redelivering it would not help
+            return
+        series = routed[1]
+        ts = max(received_ms, self._last_ts.get(series, 0) + 1)
+        self._last_ts[series] = ts
+        item = {"pk": {"S": series}, "ts": {"N": str(ts)}, "payload": payload}
+        buffer = self._buffers.get(series)
+        if buffer is None:
+            buffer = self._buffers[series] = (time.monotonic(), deque())
+        buffer[1].append((item, ack))
+        self._buffered += 1
+
+    def _requeue(self, entries):
+        """Put ``entries`` back at the front of their series buffers, in order."""
+        for entry in reversed(entries):
+            series = entry[0]["pk"]["S"]
+            buffer = self._buffers.get(series)
+            if buffer is None:
+                buffer = self._buffers[series] = (time.monotonic(), deque())
+            buffer[1].appendleft(entry)
+            self._buffered += 1
+
+    def _due(self, everything=False):
+        """Whether a batch should go out now (see :meth:`_take`)."""
+        if not self._buffers:
+            return False
+        since = next(iter(self._buffers.values()))[0]
+        return (everything or self._buffered >= BATCH_ITEMS
+                or since <= time.monotonic() - self.flush_interval)
+
+    def _take(self, everything=False):
+        """One batch of at most ``BATCH_ITEMS``, round-robin over the series buffers.
+
+        Empty unless ``everything`` is set, a full batch is buffered or the
+        oldest buffer has waited ``flush_interval``.
+        """
+        batch = []
+        if not self._due(everything):
+            return batch
+        while self._buffers and len(batch) < BATCH_ITEMS:
+            series, (since, items) = next(iter(self._buffers.items()))
+            batch.append(items.popleft())
+            self._buffered -= 1
+            del self._buffers[series]
+            if items:
+                self._buffers[series] = (since, items)
+        return batch
+
+    def _write(self, batch):
+        """Write ``batch``; returns ``(unprocessed, rejected)`` entries."""
+        from botocore.exceptions import ClientError
+
+        try:
+            failed = dynamo.batch_write(
+                self.table, [{"PutRequest": {"Item": item}} for item, _ in batch], typed=True
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "ValidationException":
+                raise
+            if len(batch) == 1:
+                logger.error("item rejected: %s", err)
+                return [], batch
+            # One item DynamoDB cannot store fails the whole call: find it.
+            unprocessed, rejected = [], []
+            for entry in batch:
+                more_unprocessed, more_rejected = self._write([entry])
+                unprocessed += more_unprocessed
+                rejected += more_rejected
+            return unprocessed, rejected
+        keys = {_key(request["PutRequest"]["Item"]) for request in failed}
+        return [entry for entry in batch if _key(entry[0]) in keys], []
+
+    async def _flush(self, batch, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            unprocessed, rejected = await loop.run_in_executor(
+                self._executor, self._write, batch
+            )
+        except Exception:
+            logger.exception("BatchWriteItem of %d items failed; retrying", len(batch))
+            unprocessed, rejected = batch, []
+        finally:
+            slots.release()
+        retry = {id(entry) for entry in unprocessed}
+        for entry in batch:
+            if id(entry) not in retry and entry[1] is not None:
+                entry[1]()
+        self.stats["written"] += len(batch) - len(unprocessed) - len(rejected)
+        self.stats["retried"] += len(unprocessed)
+        self.stats["rejected"] += len(rejected)
+        self.stats["batches"] += 1
+        self._requeue(unprocessed)
+
+    def _drain(self, queue):
+        limit = BATCH_ITEMS * (self.max_inflight + 1)
+        while self._buffered < limit and not queue.empty():
+            self._buffer(*queue.get_nowait())
+
+    async def _batcher(self, queue):
+        slots = asyncio.Semaphore(self.max_inflight)
+        tick = min(self.flush_interval, 0.25)
+        stop_rounds = 0
+        while True:
+            if queue.empty():
+                try:
+                    self._buffer(*await asyncio.wait_for(queue.get(), tick))
+                except asyncio.TimeoutError:
+                    pass
+            self._drain(queue)
+            stopping = self.stopping.is_set() and queue.empty()
+            while self._due(stopping):
+                # Waits while every slot is busy; the queue backs up behind it.
+                await slots.acquire()
+                # Whatever arrived meanwhile goes into this batch.
+                self._drain(queue)
+                task = asyncio.ensure_future(self._flush(self._take(stopping), slots))
+                self._flushes.add(task)
+                task.add_done_callback(self._flushes.discard)
+            if stopping:
+                await asyncio.gather(*self._flushes)
+                if not self._buffered:
+                    return
+                stop_rounds += 1
+                if stop_rounds > STOP_RETRIES:
+                    logger.error("%d items not written at shutdown", self._buffered)
+                    return
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(STATS_INTERVAL)
+            print(json.dumps(dict(self.stats, buffered=self._buffered)), flush=True)
+
+    async def run(self, until=None):
+        """Ingest until ``until`` (an awaitable) completes, then flush what is buffered."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=self.max_inflight)
+        self.stopping = asyncio.Event()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        readers = [asyncio.ensure_future(self._connection(index, queue))
+                   for index in range(self.connections)]
+        batcher = asyncio.ensure_future(self._batcher(queue))
+        reporter = asyncio.ensure_future(self._report())
+        try:
+            if until is None:
+                await asyncio.gather(*readers)
+            else:
+                await until
+        finally:
+            self.stopping.set()
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
+            await batcher
+            await asyncio.gather(*(client.close() for client in self._clients))
+            reporter.cancel()
+            self._executor.shutdown()
+        return self.stats
+
+
+def main(argv=None):
+    import argparse
+    import signal
+
+    parser = argparse.ArgumentParser(description="MQTT telemetry ingestion worker")
+    parser.add_argument("--subscriptions", default=SUBSCRIPTIONS_FILE)
+    parser.add_argument("--url", default=MQTT_URL)
+    parser.add_argument("--connections", type=int, default=CONNECTIONS)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        ingestor = Ingestor(load_subscriptions(args.subscriptions), url=args.url,
+                            connections=args.connections)
+        stats = await ingestor.run(until=stop.wait())
+        print(json.dumps(stats), flush=True)
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
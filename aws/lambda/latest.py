@@ -0,0 +1,182 @@
+"""Last few samples of every topic, for dashboards that reconnect or reload.
+
+``MqttProvider.jsx`` keeps the last ``RING_SIZE`` samples per topic in
+``mqttData``; after a reload it has nothing until devices publish again.
+``LATEST_TABLE`` keeps the same window server side, one item per topic::
+
+    userId     partition key
+    topic      "<device_id>/<subtopic>" (sort key)
+    seq        change sequence, epoch ms of the last update (LSI ``BySeq``)
+    deviceId, subtopic
+    time       [epoch ms, ...], oldest first, at most RING_SIZE
+    values     {var: [value or null, ...]} aligned with ``time``
+
+:func:`update` is fed by the telemetry stream from
+``telemetry_rollups.stream_handler``, like ``catalog``. Each batch merges
+its samples into the topics it touched by timestamp, so a retried batch
+leaves the items as they were and does not bump ``seq``.
+
+Route, as wired in ``template.yaml``::
+
+    GET /latest?userId[&since=<seq>]
+
+returns ``{"seq": ..., "topics": {"<device_id>/<subtopic>": {...}}}``:
+every topic without ``since``, otherwise only those whose ``seq`` is
+greater (one Query on the ``BySeq`` index). The client passes the ``seq``
+it got back on its next call. That value trails the clock by
+``SETTLE_MS`` so an update still being written is not skipped; a topic
+may then come back twice, which is harmless since each is a full window.
+"""
+
+import os
+
+import metrics
+
+import dynamo
+import telemetry
+from apigw import HttpError, query_params, response, route_handler
+from catalog import split_series
+
+LATEST_TABLE = os.environ.get("TELEMETRY_LATEST_TABLE", "sait-telemetry-latest")
+SEQ_INDEX = "BySeq"
+RING_SIZE = int(os.environ.get("LATEST_RING_SIZE", "10"))
+SETTLE_MS = 5000
+
+
+def collect(images):
+    """``{(userId, topic): (device_id, subtopic, {ts: payload})}`` of typed telemetry items."""
+    samples = {}
+    for image in images:
+        series = image.get("pk", {}).get("S")
+        ts = image.get("ts", {}).get("N")
+        if not series or not ts:
+            continue
+        user_id, device_id, subtopic = split_series(series)
+        if not user_id or not device_id or not subtopic:
+            continue
+        key = (user_id, f"{device_id}/{subtopic}")
+        entry = samples.setdefault(key, (device_id, subtopic, {}))
+        payload = dynamo.deserialize_item(image.get("payload", {}).get("M", {}))
+        entry[2][int(ts)] = payload
+    return samples
+
+
+def _rows(item):
+    """The ``(ts, {var: value})`` samples stored in one item."""
+    values = item.get("values") or {}
+    return {
+        int(ts): {name: column[i] for name, column in values.items()
+                  if i < len(column) and column[i] is not None}
+        for i, ts in enumerate(item.get("time") or [])
+    }
+
+
+def merge(item, samples, now_ms):
+    """``item`` with ``samples`` folded in, or ``None`` if nothing changes."""
+    rows = _rows(item)
+    merged = dict(rows)
+    merged.update(samples)
+    window = sorted(merged)[-RING_SIZE:]
+    if window == sorted(rows) and all(merged[ts] == rows[ts] for ts in window):
+        return None
+    names = sorted({name for ts in window for name in merged[ts]})
+    updated = dict(item)
+    updated.update({
+        "time": window,
+        "values": {name: [merged[ts].get(name) for ts in window] for name in names},
+        "seq": max(now_ms, int(item.get("seq", 0)) + 1),
+    })
+    return updated
+
+
+def update(images):
+    """Fold ``images`` into the stored windows; returns the number of topics written."""
+    samples = collect(images)
+    if not samples:
+        return 0
+    keys = [{"userId": user_id, "topic": topic} for user_id, topic in samples]
+    stored, failed = dynamo.batch_get(LATEST_TABLE, keys)
+    if failed:
+        raise RuntimeError(f"{len(failed)} latest-value reads were not processed")
+    stored = {(item["userId"], item["topic"]): item for item in stored}
+
+    now_ms = telemetry.now_ms()
+    requests = []
+    for (user_id, topic), (device_id, subtopic, rows) in samples.items():
+        item = stored.get((user_id, topic)) or {
+            "userId": user_id, "topic": topic, "deviceId": device_id, "subtopic": subtopic,
+        }
+        updated = merge(item, rows, now_ms)
+        if updated is not None:
+            requests.append({"PutRequest": {"Item": updated}})
+    failed = dynamo.batch_write(LATEST_TABLE, requests)
+    if failed:
+        raise RuntimeError(f"{len(failed)} latest-value writes were not processed")
+    return len(requests)
+
+
+def update_from_records(records):
+    """:func:`update` for the inserted and modified items of a telemetry stream batch."""
+    images = [
+        record["dynamodb"]["NewImage"]
+        for record in records
+        if record.get("eventName") != "REMOVE" and record.get("dynamodb", {}).get("NewImage")
+    ]
+    return update(images)
+
+
+def changed(user_id, since=None):
+    """Every stored topic of ``user_id``, or those with ``seq`` above ``since``."""
+    from boto3.dynamodb.conditions import Key
+
+    condition = Key("userId").eq(user_id)
+    kwargs = {}
+    if since is not None:
+        condition = condition & Key("seq").gt(since)
+        kwargs["IndexName"] = SEQ_INDEX
+    items = []
+    table = dynamo.table(LATEST_TABLE)
+    while True:
+        page = table.query(KeyConditionExpression=condition, **kwargs)
+        items.extend(page.get("Items", []))
+        if "LastEvaluatedKey" not in page:
+            return items
+        kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def get_latest(event):
+    params = query_params(event)
+    user_id = params.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+    since = params.get("since")
+    if since in (None, ""):
+        since = None
+    else:
+        try:
+            since = int(since)
+        except ValueError:
+            raise HttpError(400, "since must be an integer") from None
+
+    now_ms = telemetry.now_ms()
+    topics = {}
+    for item in changed(user_id, since):
+        topics[item["topic"]] = {
+            "deviceId": item.get("deviceId"),
+            "subtopic": item.get("subtopic"),
+            "seq": item["seq"],
+            "time": item.get("time", []),
+            "values": item.get("values", {}),
+        }
+    return response(200, {"seq": max(since or 0, now_ms - SETTLE_MS), "topics": topics})
+
+
+ROUTES = {
+    ("GET", "/latest"): get_latest,
+}
+
+
+lambda_handler = route_handler("latest", ROUTES)
+
+
+metrics.init_finished()
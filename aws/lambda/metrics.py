@@ -0,0 +1,126 @@
+"""Per-invocation metrics, logged as CloudWatch Embedded Metric Format (EMF).
+
+Each handler wraps its work in :func:`begin` / :meth:`Invocation.finish`,
+which prints one JSON line per invocation. CloudWatch turns the listed
+fields into metrics (dimensioned by service and route) and keeps the line
+itself queryable in Logs Insights; ``aws/bench/report_metrics.py`` turns a
+saved log into per-route percentiles locally.
+
+DynamoDB calls are counted by the botocore hooks in ``dynamo``, so routes do
+not need to do anything to be measured.
+
+Init time is measured from this module's import to :func:`init_finished`,
+so handler modules import it before anything else (boto3 in particular).
+"""
+
+import json
+import os
+import threading
+import time
+
+NAMESPACE = os.environ.get("METRICS_NAMESPACE", "SAIT")
+ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+READ_OPERATIONS = frozenset(
+    ("GetItem", "BatchGetItem", "Query", "Scan", "TransactGetItems")
+)
+
+_IMPORTED_AT = time.perf_counter()
+_init_ms = None
+_cold = True
+_lock = threading.Lock()
+
+
+def init_finished():
+    """Mark the end of module initialization; call once at the bottom of a handler module."""
+    global _init_ms
+    if _init_ms is None:
+        _init_ms = (time.perf_counter() - _IMPORTED_AT) * 1000
+
+
+class Invocation:
+    def __init__(self, service, route):
+        self.service = service
+        self.route = route
+        self.started = time.perf_counter()
+        self.dynamo_calls = 0
+        self.dynamo_ms = 0.0
+        self.read_units = 0.0
+        self.write_units = 0.0
+
+    def record_dynamo_call(self, operation, elapsed_ms, consumed):
+        # Batch and transact operations report one entry per table.
+        entries = consumed if isinstance(consumed, list) else [consumed] if consumed else []
+        units = sum(float(entry.get("CapacityUnits", 0)) for entry in entries)
+        with _lock:
+            self.dynamo_calls += 1
+            self.dynamo_ms += elapsed_ms
+            if operation in READ_OPERATIONS:
+                self.read_units += units
+            else:
+                self.write_units += units
+
+    def finish(self, status, response_bytes, cache_hits=0, cache_misses=0):
+        """Emit this invocation's EMF line and return the record that was logged."""
+        global _cold
+        duration_ms = (time.perf_counter() - self.started) * 1000
+        cold, _cold = _cold, False
+        lookups = cache_hits + cache_misses
+        record = {
+            "Service": self.service,
+            "Route": self.route,
+            "StatusCode": status,
+            "ColdStart": 1 if cold else 0,
+            "HandlerDuration": round(duration_ms, 3),
+            "DynamoDBCalls": self.dynamo_calls,
+            "DynamoDBLatency": round(self.dynamo_ms, 3),
+            "ConsumedRCU": round(self.read_units, 2),
+            "ConsumedWCU": round(self.write_units, 2),
+            "ResponseBytes": response_bytes,
+            "CacheHits": cache_hits,
+            "CacheMisses": cache_misses,
+        }
+        metric_names = [
+            ("ColdStart", "Count"),
+            ("HandlerDuration", "Milliseconds"),
+            ("DynamoDBCalls", "Count"),
+            ("DynamoDBLatency", "Milliseconds"),
+            ("ConsumedRCU", "Count"),
+            ("ConsumedWCU", "Count"),
+            ("ResponseBytes", "Bytes"),
+        ]
+        if lookups:
+            record["CacheHitRate"] = round(100.0 * cache_hits / lookups, 2)
+            metric_names.append(("CacheHitRate", "Percent"))
+        if cold and _init_ms is not None:
+            record["InitDuration"] = round(_init_ms, 3)
+            metric_names.append(("InitDuration", "Milliseconds"))
+        record["_aws"] = {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["Service", "Route"]],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, unit in metric_names],
+                }
+            ],
+        }
+        if ENABLED:
+            print(json.dumps(record, separators=(",", ":")), flush=True)
+        return record
+
+
+current = None
+
+
+def begin(service, route):
+    """Start measuring an invocation; DynamoDB hooks report into it."""
+    global current
+    current = Invocation(service, route)
+    return current
+
+
+def record_dynamo_call(operation, elapsed_ms, consumed):
+    invocation = current
+    if invocation is not None:
+        invocation.record_dynamo_call(operation, elapsed_ms, consumed)
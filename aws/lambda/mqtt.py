@@ -0,0 +1,247 @@
+"""asyncio front end to paho-mqtt for the long-running workers.
+
+paho runs each broker connection (``CONNECT`` with username/password,
+keep-alive, TLS, the QoS 1 handshakes) on its own network thread;
+:class:`MQTTClient` hands its messages to asyncio and turns its callbacks
+into awaitables, over TCP or TLS (``mqtt://host:1883``,
+``mqtts://host:8883``).
+
+Paho's thread only hands each incoming message to the event loop
+(``call_soon_threadsafe``); everything else happens there. At most
+``max_pending`` messages are waiting for the consumer: when it falls
+behind, paho's network thread waits for one to be taken, stops reading the
+socket and TCP pushes back on the broker instead of buffering without
+limit. A QoS 1 message is acknowledged once it is queued or, with
+``manual_ack=True``, only when the consumer calls :meth:`MQTTClient.ack`
+(``ingest`` does once the message is in DynamoDB).
+
+Needs ``paho-mqtt`` (``aws/requirements-workers.txt``).
+"""
+
+import asyncio
+import json
+import ssl as _ssl
+import threading
+from urllib.parse import urlsplit
+
+import paho.mqtt.client as paho
+from paho.mqtt.enums import CallbackAPIVersion
+
+
+class MQTTError(Exception):
+    """The broker refused the connection or a subscription."""
+
+
+def topic_matches(pattern, topic):
+    """MQTT filter matching with ``+`` (one level) and a trailing ``#`` (the rest)."""
+    return paho.topic_matches_sub(pattern, topic)
+
+
+def load_subscriptions(path):
+    """``[(userId, filter), ...]`` from a JSON list of ``{"userId", "topic"}``.
+
+    The broker's topics do not carry the user id, so the workers are told
+    which filters belong to whom.
+    """
+    with open(path, encoding="utf-8") as handle:
+        entries = json.load(handle)
+    return [(entry["userId"], entry["topic"]) for entry in entries]
+
+
+class Message:
+    __slots__ = ("topic", "payload", "qos", "packet_id")
+
+    def __init__(self, topic, payload, qos=0, packet_id=None):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.packet_id = packet_id
+
+
+class MQTTClient:
+    """One broker connection; several filters are multiplexed over it.
+
+    ``url`` is ``mqtt://host[:port]`` or ``mqtts://host[:port]``; pass
+    ``ssl`` for a custom ``SSLContext``. ``clean=False`` keeps the session
+    (subscriptions and unacknowledged QoS 1 messages) on the broker across
+    reconnects. Use as an async context manager or call
+    :meth:`connect`/:meth:`close`.
+    """
+
+    def __init__(self, url, client_id, username=None, password=None, keepalive=60,
+                 max_pending=10_000, ssl=None, manual_ack=False, clean=True):
+        parts = urlsplit(url)
+        secure = parts.scheme in ("mqtts", "ssl", "tls")
+        self.host = parts.hostname or "localhost"
+        self.port = parts.port or (8883 if secure else 1883)
+        self.keepalive = keepalive
+        self.client_id = client_id
+        self._paho = paho.Client(
+            CallbackAPIVersion.VERSION2,
+            client_id=client_id,
+            clean_session=clean,
+            protocol=paho.MQTTv311,
+            reconnect_on_failure=False,
+            manual_ack=manual_ack,
+        )
+        if username:
+            self._paho.username_pw_set(username, password)
+        if ssl is not None or secure:
+            self._paho.tls_set_context(ssl or _ssl.create_default_context())
+        self._paho.on_connect = self._on_connect
+        self._paho.on_disconnect = self._on_disconnect
+        self._paho.on_subscribe = self._on_acked
+        self._paho.on_unsubscribe = self._on_acked
+        self._paho.on_publish = self._on_published
+        self._paho.on_message = self._on_message
+        self._max_pending = max_pending
+        self._incoming = None
+        self._pending = None
+        self._acks = {}
+        self._connected = None
+        self._loop = None
+        self._started = False
+        self.closed = asyncio.Event()
+
+    # -- paho's network thread --------------------------------------------
+
+    def _call(self, callback, *args):
+        try:
+            self._loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            pass  # the event loop is gone; nobody is waiting any more
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties):
+        self._call(self._resolve_connect, reason_code.is_failure, str(reason_code))
+
+    def _on_disconnect(self, client, userdata, flags, reason_code, properties):
+        self._call(self._lost)
+
+    def _on_acked(self, client, userdata, mid, reason_codes, properties):
+        self._call(self._resolve, mid, [code.value for code in reason_codes])
+
+    def _on_published(self, client, userdata, mid, reason_code, properties):
+        self._call(self._resolve, mid, None)
+
+    def _on_message(self, client, userdata, message):
+        # Blocks this thread while max_pending messages wait: that is the backpressure.
+        while not self._pending.acquire(timeout=0.5):
+            if self.closed.is_set():
+                return
+        item = Message(message.topic, message.payload, message.qos, message.mid)
+        self._call(self._incoming.put_nowait, item)
+
+    # -- event loop -------------------------------------------------------
+
+    def _resolve_connect(self, failed, reason):
+        if self._connected is not None and not self._connected.done():
+            if failed:
+                self._connected.set_exception(MQTTError(reason))
+            else:
+                self._connected.set_result(None)
+
+    def _resolve(self, mid, result):
+        future = self._acks.get(mid)
+        if future is not None and not future.done():
+            future.set_result(result)
+
+    def _lost(self):
+        self.closed.set()
+        if self._connected is not None and not self._connected.done():
+            self._connected.set_exception(ConnectionError("MQTT connection closed"))
+        for future in self._acks.values():
+            if not future.done():
+                future.set_exception(ConnectionError("MQTT connection closed"))
+        self._incoming.put_nowait(None)
+
+    async def connect(self, timeout=10):
+        self._loop = asyncio.get_running_loop()
+        # Bounded by ``_pending``, which paho's thread takes before it queues a message.
+        self._incoming = asyncio.Queue()
+        self._pending = threading.Semaphore(self._max_pending)
+        self._connected = self._loop.create_future()
+        self.closed.clear()
+        self._paho.connect_timeout = timeout
+        # The TCP/TLS connect itself blocks, so it runs off the event loop.
+        await asyncio.wait_for(
+            self._loop.run_in_executor(
+                None, self._paho.connect, self.host, self.port, self.keepalive
+            ),
+            timeout,
+        )
+        self._paho.loop_start()
+        self._started = True
+        await asyncio.wait_for(self._connected, timeout)
+        return self
+
+    async def _request(self, call):
+        # Registered before paho can answer: its callback is queued behind this task.
+        result, mid = call()
+        if result != paho.MQTT_ERR_SUCCESS:
+            raise ConnectionError(paho.error_string(result))
+        future = self._acks[mid] = self._loop.create_future()
+        try:
+            return await future
+        finally:
+            self._acks.pop(mid, None)
+
+    async def subscribe(self, filters, qos=0):
+        """Subscribe to ``filters`` (a list of topic filters) in one ``SUBSCRIBE``."""
+        granted = await self._request(
+            lambda: self._paho.subscribe([(topic, qos) for topic in filters])
+        )
+        refused = [topic for topic, code in zip(filters, granted) if code == 0x80]
+        if refused:
+            raise MQTTError(f"subscription refused for {', '.join(refused)}")
+        return list(granted)
+
+    async def unsubscribe(self, filters):
+        await self._request(lambda: self._paho.unsubscribe(list(filters)))
+
+    async def publish(self, topic, payload, qos=0):
+        if not qos:
+            info = self._paho.publish(topic, payload)
+            if info.rc != paho.MQTT_ERR_SUCCESS:
+                raise ConnectionError(paho.error_string(info.rc))
+            return
+
+        def send():
+            info = self._paho.publish(topic, payload, qos)
+            return info.rc, info.mid
+
+        await self._request(send)
+
+    async def messages(self):
+        """Yield incoming :class:`Message` objects until the connection closes."""
+        while True:
+            if self.closed.is_set() and self._incoming.empty():
+                return
+            message = await self._incoming.get()
+            if message is None:
+                return
+            self._pending.release()
+            yield message
+
+    def ack(self, message):
+        """Acknowledge a QoS 1 ``message`` taken with ``manual_ack=True``; no-op otherwise."""
+        if message.qos and not self.closed.is_set():
+            self._paho.ack(message.packet_id, message.qos)
+
+    async def close(self):
+        if not self._started:
+            return
+        self._started = False
+        self.closed.set()
+        # disconnect() and loop_stop() wait for paho's thread, which may be
+        # waiting for this loop: run them in a worker thread.
+        await self._loop.run_in_executor(None, self._stop)
+
+    def _stop(self):
+        self._paho.disconnect()
+        self._paho.loop_stop()
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc):
+        await self.close()
@@ -0,0 +1,498 @@
+"""Server-side XLSX and PDF rendering of report components.
+
+Runs as the worker behind ``POST /reports:render`` (see ``reports.py``) and
+takes the same component list ``reportes.jsx`` builds: title, chart type,
+variables with colors and a date range per component.
+
+* XLSX: one sheet per component with every raw message in its window,
+  written with XlsxWriter's ``constant_memory`` mode straight from the
+  DynamoDB pages, so memory stays at one row however long the report is.
+* PDF: each component is read through ``historical.batch_query`` (rollups
+  and downsampling, at most ``CHART_POINTS`` points), its chart is rendered
+  to PNG in a pool of worker processes, and reportlab lays out the pages
+  with a statistics summary at the end.
+
+Everything that does not depend on the job is built once per container
+and reused by warm invocations: matplotlib and its font cache are loaded
+during init, the report font is registered once, paragraph and table
+styles are cached, and logos are kept for an hour. Logos are ``data:`` URLs or
+https URLs on the ``REPORT_LOGO_HOSTS`` allowlist, at most ``LOGO_MAX_BYTES``.
+
+Needs XlsxWriter, reportlab and matplotlib (the ``RenderLayer`` in
+``template.yaml``); the other functions do not import this module.
+"""
+
+import functools
+import io
+import os
+from datetime import datetime, timezone
+
+import metrics
+
+import numpy as np
+
+import historical
+import reports
+import telemetry
+from apigw import dumps
+from storage import open_store
+from ttlcache import TTLCache
+
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", str(os.cpu_count() or 1)))
+CHART_POINTS = 1000
+CHART_DPI = 120
+PDF_TABLE_ROWS = 50
+FONT_PATH = os.environ.get("REPORT_FONT_PATH")
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+# Excel's hard limit is 1,048,576 rows; longer components continue on another sheet.
+XLSX_MAX_ROWS = 1_000_000
+XLSX_HEADER_ROWS = 5
+# Logos are only fetched over https from these hosts (comma-separated); ``data:`` URLs
+# need no fetch. Anything else would let a report request reach internal addresses.
+LOGO_HOSTS = frozenset(
+    host.strip().lower()
+    for host in os.environ.get("REPORT_LOGO_HOSTS", "").split(",")
+    if host.strip()
+)
+LOGO_MAX_BYTES = int(os.environ.get("REPORT_LOGO_MAX_BYTES", str(512 * 1024)))
+
+CHART_LABELS = {
+    "line": "Gráfico de Líneas",
+    "bar": "Gráfico de Barras",
+    "area": "Gráfico de Área",
+    "table": "Tabla de Datos",
+}
+CONTENT_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "pdf": "application/pdf",
+}
+
+_logos = TTLCache(maxsize=16, ttl=3600)
+
+
+def _period(component):
+    start = telemetry.iso_ms(int(component["start"]))[:10]
+    end = telemetry.iso_ms(int(component["end"]))[:10]
+    return f"Período: {start} - {end}"
+
+
+def _names(component):
+    return [entry["variable"] for entry in component["variables"]]
+
+
+def _utc(ms):
+    # Excel has no time zones; cells hold naive UTC.
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).replace(tzinfo=None)
+
+
+def pool_map(func, items, workers=RENDER_WORKERS):
+    """``[func(item) for item in items]`` across forked worker processes.
+
+    Built on ``Process`` and ``Pipe`` because Lambda has no ``/dev/shm``,
+    which ``multiprocessing.Pool`` and ``ProcessPoolExecutor`` need for their
+    semaphores. Children are forked, so ``func`` and ``items`` are not
+    pickled; only the results travel back through the pipes.
+    """
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return [func(item) for item in items]
+    import multiprocessing
+
+    context = multiprocessing.get_context("fork")
+    running = []
+    for worker in range(workers):
+        indices = list(range(worker, len(items), workers))
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_pool_worker, args=(func, [items[i] for i in indices], sender)
+        )
+        process.start()
+        sender.close()
+        running.append((process, receiver, indices))
+
+    results = [None] * len(items)
+    errors = []
+    for process, receiver, indices in running:
+        # Receive before joining: a child blocks on a full pipe until read.
+        ok, payload = receiver.recv()
+        process.join()
+        if not ok:
+            errors.append(payload)
+            continue
+        for index, value in zip(indices, payload):
+            results[index] = value
+    if errors:
+        raise RuntimeError(f"render worker failed: {errors[0]}")
+    return results
+
+
+def _pool_worker(func, items, sender):
+    try:
+        sender.send((True, [func(item) for item in items]))
+    except Exception as err:  # reported to the parent, which fails the job
+        sender.send((False, repr(err)))
+    finally:
+        sender.close()
+
+
+XLSX_FORMATS = {
+    "title": {"bold": True, "font_size": 14},
+    "meta": {"italic": True, "font_color": "#555555"},
+    "header": {"bold": True, "bg_color": "#1f4e79", "font_color": "#ffffff", "border": 1},
+    "date": {"num_format": "yyyy-mm-dd hh:mm:ss"},
+}
+
+
+def _xlsx_sheet(workbook, formats, index, component, part):
+    name = f"Componente {index + 1}" + (f" ({part})" if part > 1 else "")
+    sheet = workbook.add_worksheet(name[:31])
+    variables = _names(component)
+    sheet.set_column(0, 0, 20)
+    sheet.set_column(1, len(variables), 14)
+    sheet.write(0, 0, component["title"], formats["title"])
+    sheet.write(1, 0, "Tipo: " + CHART_LABELS[component["chartType"]], formats["meta"])
+    sheet.write(2, 0, _period(component), formats["meta"])
+    sheet.write_row(4, 0, ["Fecha"] + variables, formats["header"])
+    sheet.freeze_panes(XLSX_HEADER_ROWS, 1)
+    return sheet
+
+
+def render_xlsx(job, path):
+    """Write every raw message of each component to ``path``; returns rows written."""
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "tmpdir": "/tmp"})
+    formats = {name: workbook.add_format(spec) for name, spec in XLSX_FORMATS.items()}
+    total = 0
+    for index, component in enumerate(job["components"]):
+        variables = _names(component)
+        projection, names = telemetry.payload_projection(variables)
+        part = 1
+        sheet = _xlsx_sheet(workbook, formats, index, component, part)
+        row = XLSX_HEADER_ROWS
+        pages = telemetry.query_pages(
+            job["series"], int(component["start"]), int(component["end"]), projection, names
+        )
+        for items in pages:
+            for item in items:
+                if row >= XLSX_MAX_ROWS:
+                    part += 1
+                    sheet = _xlsx_sheet(workbook, formats, index, component, part)
+                    row = XLSX_HEADER_ROWS
+                payload = item.get("payload", {}).get("M", {})
+                sheet.write_datetime(row, 0, _utc(int(item["ts"]["N"])), formats["date"])
+                for column, name in enumerate(variables, 1):
+                    if name in payload:
+                        sheet.write(row, column, reports.attribute_value(payload[name]))
+                row += 1
+                total += 1
+    workbook.close()
+    return total
+
+
+def _column(series, key):
+    return np.array([np.nan if value is None else value for value in series[key]], dtype=float)
+
+
+@functools.lru_cache(maxsize=None)
+def pyplot():
+    """matplotlib's pyplot on the Agg backend, imported once per container."""
+    # Lambda's home directory is read-only; matplotlib keeps its font cache here.
+    os.environ.setdefault("MPLCONFIGDIR", "/tmp/matplotlib")
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot
+
+    return matplotlib.pyplot
+
+
+def chart_png(task):
+    """PNG bytes of one component's chart; runs in a worker process."""
+    plt = pyplot()
+    component, result = task
+    key = "avg" if result["mode"] == "buckets" else "value"
+    x = np.array(result["timestamps"], dtype="datetime64[ms]")
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=CHART_DPI)
+    try:
+        for entry in component["variables"]:
+            series = result["series"].get(entry["variable"])
+            if not series:
+                continue
+            y = _column(series, key)
+            color = entry.get("color")
+            if component["chartType"] == "bar":
+                width = (result.get("bucketMs") or 60_000) / 86_400_000 * 0.8
+                ax.bar(x, y, width=width, color=color, label=entry["variable"], alpha=0.8)
+            else:
+                ax.plot(x, y, color=color, label=entry["variable"], linewidth=1.2)
+                if component["chartType"] == "area":
+                    ax.fill_between(x, y, color=color, alpha=0.35)
+                elif key == "avg":
+                    # The min/max envelope keeps spikes visible that averaging hides.
+                    low, high = _column(series, "min"), _column(series, "max")
+                    ax.fill_between(x, low, high, color=color, alpha=0.15, linewidth=0)
+        ax.grid(True, alpha=0.3)
+        if ax.get_legend_handles_labels()[0]:
+            ax.legend(loc="upper left", fontsize=8)
+        fig.autofmt_xdate()
+        out = io.BytesIO()
+        fig.savefig(out, format="png", bbox_inches="tight")
+        return out.getvalue()
+    finally:
+        plt.close(fig)
+
+
+def summary(component, result):
+    """``[(variable, min, max, avg), ...]`` over the downsampled result."""
+    rows = []
+    bucketed = result["mode"] == "buckets"
+    for name in _names(component):
+        series = result["series"].get(name)
+        if not series:
+            rows.append((name, None, None, None))
+            continue
+        low = _column(series, "min" if bucketed else "value")
+        high = _column(series, "max" if bucketed else "value")
+        mean = _column(series, "avg" if bucketed else "value")
+        if np.isnan(mean).all():
+            rows.append((name, None, None, None))
+            continue
+        rows.append((name, np.nanmin(low), np.nanmax(high), np.nanmean(mean)))
+    return rows
+
+
+@functools.lru_cache(maxsize=None)
+def report_font():
+    """Registers ``REPORT_FONT_PATH`` once per container; Helvetica otherwise."""
+    if not FONT_PATH:
+        return "Helvetica"
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    pdfmetrics.registerFont(TTFont("ReportFont", FONT_PATH))
+    return "ReportFont"
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_styles():
+    from reportlab.lib import colors
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+    font = report_font()
+    base = getSampleStyleSheet()
+    return {
+        "title": ParagraphStyle("ReportTitle", base["Title"], fontName=font, fontSize=20),
+        "heading": ParagraphStyle("ReportHeading", base["Heading2"], fontName=font),
+        "meta": ParagraphStyle(
+            "ReportMeta", base["Normal"], fontName=font, fontSize=9, textColor=colors.grey
+        ),
+        "table": [
+            ("FONTNAME", (0, 0), (-1, -1), font),
+            ("FONTSIZE", (0, 0), (-1, -1), 8),
+            ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1f4e79")),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.white),
+            ("GRID", (0, 0), (-1, -1), 0.25, colors.HexColor("#bbbbbb")),
+            ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.HexColor("#f2f6fa")]),
+        ],
+    }
+
+
+def _fetch_logo(url):
+    """Bytes of an https logo on an allowed host, at most ``LOGO_MAX_BYTES``; else ``b""``."""
+    from urllib.parse import urlsplit
+    from urllib.request import HTTPRedirectHandler, HTTPSHandler, build_opener
+
+    parts = urlsplit(url)
+    if parts.scheme != "https" or (parts.hostname or "").lower() not in LOGO_HOSTS:
+        return b""
+
+    class NoRedirect(HTTPRedirectHandler):
+        # A redirect could point anywhere; the allowlist only vouches for ``url``.
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    opener = build_opener(NoRedirect, HTTPSHandler)
+    with opener.open(url, timeout=5) as handle:
+        if handle.status != 200:
+            return b""
+        data = handle.read(LOGO_MAX_BYTES + 1)
+    return b"" if len(data) > LOGO_MAX_BYTES else data
+
+
+def logo(url):
+    """Logo image bytes for ``url`` (``data:`` or allowed https), cached; None if unavailable."""
+    if not url:
+        return None
+    data = _logos.get(url)
+    if data is not None:
+        return data or None
+    try:
+        if url.startswith("data:"):
+            import base64
+
+            encoded = url.partition(",")[2]
+            # base64 grows data by 4/3, so longer input cannot decode under the cap.
+            if len(encoded) > LOGO_MAX_BYTES * 4 // 3 + 4:
+                data = b""
+            else:
+                data = base64.b64decode(encoded)
+        else:
+            data = _fetch_logo(url)
+    except Exception:
+        data = b""  # remembered, so a broken logo URL is not retried on every report
+    _logos.set(url, data)
+    return data or None
+
+
+def _number(value):
+    return "-" if value is None else f"{value:,.2f}"
+
+
+def _table(rows, widths=None):
+    from reportlab.platypus import Table, TableStyle
+
+    table = Table(rows, colWidths=widths, repeatRows=1)
+    table.setStyle(TableStyle(pdf_styles()["table"]))
+    return table
+
+
+def _data_table(component, result):
+    names = _names(component)
+    key = "avg" if result["mode"] == "buckets" else "value"
+    columns = [result["series"].get(name, {}).get(key) for name in names]
+    rows = [["Fecha"] + names]
+    for i, ts in enumerate(result["timestamps"]):
+        values = [_number(column[i]) if column else "-" for column in columns]
+        rows.append([telemetry.iso_ms(ts)[:19].replace("T", " ")] + values)
+    return _table(rows)
+
+
+def render_pdf(job, path):
+    """Lay out the components' charts, tables and a statistics page into ``path``."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import (
+        Image,
+        KeepTogether,
+        PageBreak,
+        Paragraph,
+        SimpleDocTemplate,
+        Spacer,
+    )
+
+    components = job["components"]
+    queries = [
+        {
+            "series": job["series"],
+            "variables": _names(component),
+            "start": int(component["start"]),
+            "end": int(component["end"]),
+            "points": PDF_TABLE_ROWS if component["chartType"] == "table" else CHART_POINTS,
+            "mode": "buckets",
+        }
+        for component in components
+    ]
+    results, _ = historical.batch_query(queries)
+    charted = [i for i, component in enumerate(components) if component["chartType"] != "table"]
+    pngs = dict(zip(charted, pool_map(chart_png, [(components[i], results[i]) for i in charted])))
+
+    styles = pdf_styles()
+    story = []
+    logo_bytes = logo(job.get("logoUrl"))
+    if logo_bytes:
+        image = Image(io.BytesIO(logo_bytes), width=4 * cm, height=2 * cm, kind="proportional")
+        story.append(image)
+    story.append(Paragraph(job.get("title") or "Reporte", styles["title"]))
+    generated = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    story.append(Paragraph(f"Generado el: {generated}", styles["meta"]))
+    story.append(Spacer(1, 0.5 * cm))
+
+    stats_rows = [["Componente", "Variable", "Mínimo", "Máximo", "Promedio"]]
+    for index, (component, result) in enumerate(zip(components, results)):
+        meta = f"{CHART_LABELS[component['chartType']]} · {_period(component)}"
+        block = [
+            Paragraph(component["title"], styles["heading"]),
+            Paragraph(meta, styles["meta"]),
+            Spacer(1, 0.2 * cm),
+        ]
+        if index in pngs:
+            block.append(Image(io.BytesIO(pngs[index]), width=17 * cm, height=8.5 * cm))
+        else:
+            block.append(_data_table(component, result))
+        story.append(KeepTogether(block))
+        story.append(Spacer(1, 0.6 * cm))
+        for name, low, high, mean in summary(component, result):
+            stats_rows.append(
+                [component["title"], name, _number(low), _number(high), _number(mean)]
+            )
+
+    story.append(PageBreak())
+    story.append(Paragraph("Análisis Estadístico", styles["heading"]))
+    story.append(_table(stats_rows))
+
+    def footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont(report_font(), 8)
+        canvas.drawRightString(A4[0] - 2 * cm, 1.2 * cm, f"Página {doc.page}")
+        canvas.restoreState()
+
+    document = SimpleDocTemplate(path, pagesize=A4, title=job.get("title") or "Reporte")
+    document.build(story, onFirstPage=footer, onLaterPages=footer)
+    return sum(int(result.get("rawPoints", 0)) for result in results)
+
+
+RENDERERS = {"xlsx": render_xlsx, "pdf": render_pdf}
+
+
+def _upload(path, name, content_type):
+    writer = open_store(reports.REPORTS_TARGET).writer(name, content_type=content_type)
+    try:
+        with open(path, "rb") as handle:
+            for chunk in iter(lambda: handle.read(UPLOAD_CHUNK_BYTES), b""):
+                writer.write(chunk)
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return writer.bytes
+
+
+def render_job(job_id):
+    job = reports.load_job(job_id)
+    if not job or job["status"] == "done" or job.get("kind") not in RENDERERS:
+        return job
+    reports.set_status(job_id, "running")
+    fmt = job["kind"]
+    path = f"/tmp/{job_id}.{fmt}"
+    name = f"{job['userId']}/{job_id}.{fmt}"
+    try:
+        rows = RENDERERS[fmt](job, path)
+        size = _upload(path, name, CONTENT_TYPES[fmt])
+    except Exception as err:
+        reports.set_status(job_id, "failed", error=str(err))
+        # Not re-raised: an async retry would hit the same error again.
+        print(dumps({"jobId": job_id, "error": repr(err)}))
+        return None
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    reports.set_status(job_id, "done", key=name, rows=rows, bytes=size)
+    return job
+
+
+def job_handler(event, context):
+    invocation = metrics.begin("reports", "render")
+    status = 500
+    try:
+        render_job(event["jobId"])
+        status = 200
+    finally:
+        invocation.finish(status, 0)
+
+
+# Importing matplotlib (and building its font cache on a cold container) is
+# the slowest part of a first render; do it during init instead.
+pyplot()
+
+metrics.init_finished()
@@ -0,0 +1,454 @@
+"""Telemetry reports for ``reportes.jsx`` and ``Alarmas.jsx``.
+
+Routes, as wired in ``template.yaml``::
+
+    GET  /report?userId&device_id&subtopic&startDate&endDate   payload rows
+    GET  /report?userId&device_id   the device's subtopics, from ``catalog``
+    POST /mqttreport        {device_id, subtopic, user_id, values, startDate, endDate}
+    POST /reports:render    XLSX/PDF of report components (see post_render)
+    GET  /reports/{jobId}?userId=   state of a report job
+
+Reports are built by a generator pipeline: DynamoDB page -> rows -> NDJSON
+or JSON bytes -> gzip. Only one page (at most 1 MB) is held at a time, so
+memory does not grow with the length of the report.
+
+Synchronous responses are a JSON array, which the screens read today. With
+``format=ndjson`` or ``Accept: application/x-ndjson`` they are NDJSON
+instead, gzipped when the client accepts it. Lambda and API Gateway cap a
+response at 6 MB, so a report whose body passes ``SYNC_MAX_BYTES`` stops
+early with a ``413`` asking for a job instead.
+
+``async=1`` (query) or ``"async": true`` (body) makes the route return
+``202`` with a ``jobId`` right away. ``job_handler`` then streams the report
+as gzip NDJSON into ``REPORTS_TARGET`` through a multipart upload, and
+``GET /reports/{jobId}`` returns a presigned ``url`` once the job is
+``done``. Job items expire after ``JOB_TTL_DAYS``.
+"""
+
+import json
+import os
+import time
+import uuid
+import zlib
+
+import metrics
+
+import dynamo
+import telemetry
+from apigw import (
+    HttpError,
+    accepts_gzip,
+    dumps,
+    header,
+    json_body,
+    path_params,
+    query_params,
+    response,
+    route_handler,
+)
+
+JOBS_TABLE = os.environ.get("REPORT_JOBS_TABLE", "sait-report-jobs")
+REPORTS_TARGET = os.environ.get("REPORTS_TARGET", "/tmp/sait-reports")
+WORKER_FUNCTION = os.environ.get("REPORT_WORKER_FUNCTION")
+RENDER_FUNCTION = os.environ.get("REPORT_RENDER_FUNCTION")
+
+# Leaves room for base64 (4/3) under the 6 MB response limit.
+SYNC_MAX_BYTES = int(os.environ.get("REPORT_SYNC_MAX_BYTES", "4000000"))
+JOB_TTL_DAYS = 7
+URL_EXPIRES = 3600
+NDJSON = "application/x-ndjson"
+
+RENDER_FORMATS = ("xlsx", "pdf")
+CHART_TYPES = ("line", "bar", "area", "table")
+MAX_RENDER_COMPONENTS = 20
+
+_lambda_client = None
+
+
+def attribute_value(attr):
+    if "N" in attr:
+        text = attr["N"]
+        return float(text) if any(c in text for c in ".eE") else int(text)
+    if "BOOL" in attr:
+        return attr["BOOL"]
+    if "S" in attr:
+        return attr["S"]
+    return None
+
+
+def _nested(timestamp, values):
+    return {"timestamp": timestamp, "values": values}
+
+
+def _flat(timestamp, values):
+    return {"timestamp": timestamp, **values}
+
+
+def _payload(timestamp, values):
+    return values
+
+
+# Row shape of streamed and job output per route. The synchronous JSON
+# response of ``/report`` uses ``_payload`` instead, which is what the
+# screens read today.
+SHAPES = {"mqttreport": _nested, "report": _flat}
+
+
+def report_pages(series, start_ms, end_ms, variables=None, shape=_nested):
+    """Yield one list of report rows per DynamoDB page, oldest first."""
+    projection, names = telemetry.payload_projection(variables)
+    for items in telemetry.query_pages(series, start_ms, end_ms, projection, names):
+        rows = []
+        for item in items:
+            payload = item.get("payload", {}).get("M", {})
+            values = {name: attribute_value(attr) for name, attr in payload.items()}
+            rows.append(shape(telemetry.iso_ms(int(item["ts"]["N"])), values))
+        yield rows
+
+
+def counted(pages, counts):
+    for rows in pages:
+        counts["rows"] = counts.get("rows", 0) + len(rows)
+        yield rows
+
+
+def ndjson_chunks(pages):
+    for rows in pages:
+        if rows:
+            yield "".join(dumps(row) + "\n" for row in rows).encode("utf-8")
+
+
+def json_array_chunks(pages):
+    yield b"["
+    first = True
+    for rows in pages:
+        if not rows:
+            continue
+        body = ",".join(dumps(row) for row in rows)
+        yield (body if first else "," + body).encode("utf-8")
+        first = False
+    yield b"]"
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _collect(chunks, limit):
+    parts, size = [], 0
+    for chunk in chunks:
+        size += len(chunk)
+        if size > limit:
+            chunks.close()  # stop reading further pages
+            raise HttpError(
+                413,
+                "Report is too large for a direct response",
+                details={"hint": "Request it with async=1 and download the finished file"},
+            )
+        parts.append(chunk)
+    return b"".join(parts)
+
+
+def _wants_ndjson(event, params):
+    return params.get("format") == "ndjson" or NDJSON in (header(event, "Accept") or "")
+
+
+def _sync_response(event, pages, ndjson):
+    chunks = ndjson_chunks(pages) if ndjson else json_array_chunks(pages)
+    compress = accepts_gzip(event)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    body = _collect(chunks, SYNC_MAX_BYTES)
+    resp = response(200, headers={"Content-Type": NDJSON if ndjson else "application/json"})
+    if compress:
+        import base64
+
+        resp["body"] = base64.b64encode(body).decode("ascii")
+        resp["isBase64Encoded"] = True
+        resp["headers"]["Content-Encoding"] = "gzip"
+        resp["headers"]["Vary"] = "Accept-Encoding"
+    else:
+        resp["body"] = body.decode("utf-8")
+    return resp
+
+
+def _window(start, end, params):
+    """``(start_ms, end_ms)``; naive dates are read in ``params``' ``tz``/``utcOffset``."""
+    try:
+        return telemetry.time_window(start, end, tz=telemetry.time_zone(params))
+    except ValueError as err:
+        raise HttpError(400, f"Invalid startDate/endDate: {err}") from None
+
+
+def _spec(kind, user_id, device_id, subtopic, variables, start, end, params):
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    if not device_id or not subtopic:
+        raise HttpError(400, "device_id and subtopic are required")
+    start_ms, end_ms = _window(start, end, params)
+    return {
+        "kind": kind,
+        "userId": user_id,
+        "series": telemetry.series_id(user_id, device_id, subtopic),
+        "variables": variables or None,
+        "start": start_ms,
+        "end": end_ms,
+    }
+
+
+def _truthy(value):
+    return value is True or str(value).lower() in ("1", "true", "yes")
+
+
+def _lambda():
+    global _lambda_client
+    if _lambda_client is None:
+        import boto3
+
+        _lambda_client = boto3.client("lambda")
+    return _lambda_client
+
+
+def _jobs():
+    return dynamo.table(JOBS_TABLE)
+
+
+def start_job(spec, worker=WORKER_FUNCTION, run=None):
+    """Record a queued job from ``spec`` and hand it to the ``worker`` function.
+
+    Without a worker function (local runs) ``run`` (default :func:`run_job`)
+    processes the job inline before the response is returned.
+    """
+    job_id = uuid.uuid4().hex
+    now = int(time.time())
+    item = {name: value for name, value in spec.items() if value is not None}
+    item.update(
+        {
+            "jobId": job_id,
+            "status": "queued",
+            "createdAt": telemetry.iso_ms(now * 1000),
+            "expiresAt": now + JOB_TTL_DAYS * 86400,
+        }
+    )
+    _jobs().put_item(Item=item)
+    if worker:
+        _lambda().invoke(
+            FunctionName=worker,
+            InvocationType="Event",
+            Payload=json.dumps({"jobId": job_id}).encode(),
+        )
+    else:
+        (run or run_job)(job_id)
+    return response(
+        202, {"jobId": job_id, "status": "queued"}, {"Location": f"/reports/{job_id}"}
+    )
+
+
+def load_job(job_id):
+    return _jobs().get_item(Key={"jobId": job_id}).get("Item")
+
+
+def set_status(job_id, status, **fields):
+    fields.update({"status": status, "updatedAt": telemetry.iso_ms(telemetry.now_ms())})
+    names = {f"#f{i}": name for i, name in enumerate(fields)}
+    values = {f":f{i}": value for i, value in enumerate(fields.values())}
+    _jobs().update_item(
+        Key={"jobId": job_id},
+        UpdateExpression="SET " + ", ".join(f"#f{i} = :f{i}" for i in range(len(fields))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values,
+    )
+
+
+def run_job(job_id):
+    """Stream one job's report into ``REPORTS_TARGET`` as gzip NDJSON."""
+    from storage import open_store
+
+    job = load_job(job_id)
+    if not job or job["status"] == "done":
+        return job
+    set_status(job_id, "running")
+    name = f"{job['userId']}/{job_id}.ndjson.gz"
+    writer = open_store(REPORTS_TARGET).writer(name, content_type="application/gzip")
+    counts = {}
+    pages = report_pages(
+        job["series"],
+        int(job["start"]),
+        int(job["end"]),
+        job.get("variables"),
+        SHAPES.get(job.get("kind"), _nested),
+    )
+    try:
+        for chunk in gzip_chunks(ndjson_chunks(counted(pages, counts))):
+            writer.write(chunk)
+        writer.close()
+    except Exception as err:
+        writer.abort()
+        set_status(job_id, "failed", error=str(err))
+        # Not re-raised: an async retry would hit the same error again.
+        print(json.dumps({"jobId": job_id, "error": repr(err)}))
+        return None
+    set_status(job_id, "done", key=name, rows=counts.get("rows", 0), bytes=writer.bytes)
+    return job
+
+
+def job_handler(event, context):
+    invocation = metrics.begin("reports", "job")
+    status = 500
+    try:
+        run_job(event["jobId"])
+        status = 200
+    finally:
+        invocation.finish(status, 0)
+
+
+def get_report(event):
+    params = query_params(event)
+    if params.get("userId") and params.get("device_id") and not params.get("subtopic"):
+        import catalog
+
+        return response(200, catalog.subtopics(params["userId"], params["device_id"]))
+    variables = [name for name in (params.get("variables") or "").split(",") if name]
+    spec = _spec(
+        "report",
+        params.get("userId"),
+        params.get("device_id"),
+        params.get("subtopic"),
+        variables,
+        params.get("startDate"),
+        params.get("endDate"),
+        params,
+    )
+    if _truthy(params.get("async")):
+        return start_job(spec)
+    ndjson = _wants_ndjson(event, params)
+    shape = _flat if ndjson else _payload
+    pages = report_pages(spec["series"], spec["start"], spec["end"], spec["variables"], shape)
+    return _sync_response(event, pages, ndjson)
+
+
+def post_mqttreport(event):
+    body = json_body(event)
+    params = query_params(event)
+    values = body.get("values") or []
+    if not isinstance(values, list):
+        raise HttpError(400, "values must be a list of variable names")
+    spec = _spec(
+        "mqttreport",
+        body.get("user_id") or body.get("userId"),
+        body.get("device_id"),
+        body.get("subtopic"),
+        [str(name) for name in values],
+        body.get("startDate"),
+        body.get("endDate"),
+        body,
+    )
+    if _truthy(params.get("async")) or _truthy(body.get("async")):
+        return start_job(spec)
+    pages = report_pages(spec["series"], spec["start"], spec["end"], spec["variables"])
+    return _sync_response(event, pages, _wants_ndjson(event, params))
+
+
+def _render_inline(job_id):
+    from report_render import render_job
+
+    render_job(job_id)
+
+
+def _component(index, raw, body):
+    if not isinstance(raw, dict):
+        raise HttpError(400, f"components[{index}] must be a JSON object")
+    variables = []
+    for entry in raw.get("variables") or []:
+        if isinstance(entry, dict):
+            name, color = entry.get("variable"), entry.get("color")
+        else:
+            name, color = entry, None
+        if name:
+            variables.append({"variable": str(name), **({"color": color} if color else {})})
+    if not variables:
+        raise HttpError(400, f"components[{index}] needs at least one variable")
+    chart_type = raw.get("chartType") or "line"
+    if chart_type not in CHART_TYPES:
+        choices = ", ".join(CHART_TYPES)
+        raise HttpError(400, f"components[{index}].chartType must be one of {choices}")
+    # A component's own tz/utcOffset wins over the report's.
+    start_ms, end_ms = _window(raw.get("startDate"), raw.get("endDate"), {**body, **raw})
+    return {
+        "title": str(raw.get("title") or f"Componente {index + 1}"),
+        "chartType": chart_type,
+        "variables": variables,
+        "start": start_ms,
+        "end": end_ms,
+    }
+
+
+def post_render(event):
+    """Queue an XLSX or PDF rendering of the report screen's components.
+
+    The body mirrors ``reportes.jsx``: ``{"format": "xlsx"|"pdf", "userId",
+    "device_id", "subtopic", "title", "logoUrl", "components": [{"title",
+    "chartType", "variables": [{"variable", "color"}], "startDate",
+    "endDate"}]}``. Always a job (``202``); ``report_render`` does the work.
+    """
+    body = json_body(event)
+    fmt = body.get("format")
+    if fmt not in RENDER_FORMATS:
+        raise HttpError(400, f"format must be one of {', '.join(RENDER_FORMATS)}")
+    user_id = body.get("userId") or body.get("user_id")
+    if not user_id:
+        raise HttpError(400, "userId is required")
+    if not body.get("device_id") or not body.get("subtopic"):
+        raise HttpError(400, "device_id and subtopic are required")
+    raw_components = body.get("components")
+    if not isinstance(raw_components, list) or not raw_components:
+        raise HttpError(400, "components must be a non-empty list")
+    if len(raw_components) > MAX_RENDER_COMPONENTS:
+        raise HttpError(400, f"At most {MAX_RENDER_COMPONENTS} components per report")
+    spec = {
+        "kind": fmt,
+        "userId": user_id,
+        "series": telemetry.series_id(user_id, body["device_id"], body["subtopic"]),
+        "title": str(body.get("title") or "Reporte"),
+        "logoUrl": body.get("logoUrl") or None,
+        "components": [_component(i, raw, body) for i, raw in enumerate(raw_components)],
+    }
+    return start_job(spec, RENDER_FUNCTION, _render_inline)
+
+
+def get_job(event):
+    job_id = path_params(event).get("jobId")
+    user_id = query_params(event).get("userId")
+    job = load_job(job_id) if job_id else None
+    if not job or job.get("userId") != user_id:
+        raise HttpError(404, "Report job not found")
+    body = {
+        name: job[name]
+        for name in ("jobId", "status", "kind", "createdAt", "updatedAt", "rows", "bytes", "error")
+        if name in job
+    }
+    if job["status"] == "done":
+        from storage import open_store
+
+        body["url"] = open_store(REPORTS_TARGET).url(job["key"], expires=URL_EXPIRES)
+        body["expiresIn"] = URL_EXPIRES
+    return response(200, body)
+
+
+ROUTES = {
+    ("GET", "/report"): get_report,
+    ("POST", "/mqttreport"): post_mqttreport,
+    ("POST", "/reports:render"): post_render,
+    ("GET", "/reports/{jobId}"): get_job,
+}
+
+
+lambda_handler = route_handler("reports", ROUTES, gzip=False)
+
+
+metrics.init_finished()
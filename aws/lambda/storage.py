@@ -0,0 +1,178 @@
+"""Whole-object storage on a local directory or an S3-compatible bucket.
+
+``open_store("s3://bucket/prefix")`` and ``open_store("/tmp/out")`` return
+objects with the same small interface (``put``, ``get``, ``url``, ``writer``),
+so export and report code can write to either. ``S3_ENDPOINT`` (or
+``endpoint_url``) selects an S3-compatible server such as MinIO for local runs.
+
+``writer(name)`` streams an object of unknown size: bytes go to a temporary
+file or to a multipart upload as they are written, so memory stays at one
+part however large the object gets.
+"""
+
+import os
+
+S3_PART_BYTES = 8 * 1024 * 1024
+
+
+class _FileWriter:
+    def __init__(self, path):
+        self.path = path
+        self.bytes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._handle = open(f"{path}.tmp", "wb")
+
+    def write(self, data):
+        self._handle.write(data)
+        self.bytes += len(data)
+
+    def close(self):
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self._handle.close()
+        os.replace(f"{self.path}.tmp", self.path)
+
+    def abort(self):
+        self._handle.close()
+        os.remove(f"{self.path}.tmp")
+
+
+class LocalStore:
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def put(self, name, data, content_type=None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as handle:
+            handle.write(data)
+            handle.flush()
+            os.fsync(handle.fileno())
+        # Readers (and resumed exports) never see a half-written object.
+        os.replace(tmp, path)
+
+    def get(self, name):
+        try:
+            with open(self._path(name), "rb") as handle:
+                return handle.read()
+        except FileNotFoundError:
+            return None
+
+    def url(self, name, expires=None):
+        return "file://" + self._path(name)
+
+    def writer(self, name, content_type=None):
+        return _FileWriter(self._path(name))
+
+
+class _MultipartWriter:
+    """Buffers one part at a time and uploads it; small objects become one ``PutObject``."""
+
+    def __init__(self, client, bucket, key, content_type=None, part_bytes=S3_PART_BYTES):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type
+        self.part_bytes = part_bytes
+        self.bytes = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def _upload_part(self):
+        if self._upload_id is None:
+            extra = {"ContentType": self.content_type} if self.content_type else {}
+            self._upload_id = self.client.create_multipart_upload(
+                Bucket=self.bucket, Key=self.key, **extra
+            )["UploadId"]
+        number = len(self._parts) + 1
+        etag = self.client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            PartNumber=number,
+            Body=bytes(self._buffer),
+        )["ETag"]
+        self._parts.append({"ETag": etag, "PartNumber": number})
+        self._buffer.clear()
+
+    def write(self, data):
+        self._buffer += data
+        self.bytes += len(data)
+        if len(self._buffer) >= self.part_bytes:
+            self._upload_part()
+
+    def close(self):
+        if self._upload_id is None:
+            extra = {"ContentType": self.content_type} if self.content_type else {}
+            self.client.put_object(
+                Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer), **extra
+            )
+            return
+        if self._buffer:
+            self._upload_part()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    def abort(self):
+        if self._upload_id is not None:
+            self.client.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id
+            )
+
+
+class S3Store:
+    def __init__(self, bucket, prefix="", endpoint_url=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url or os.environ.get("S3_ENDPOINT") or None
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("s3", endpoint_url=self.endpoint_url)
+        return self._client
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}" if self.prefix else name
+
+    def put(self, name, data, content_type=None):
+        extra = {"ContentType": content_type} if content_type else {}
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data, **extra)
+
+    def get(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name))["Body"].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def url(self, name, expires=None):
+        """``s3://`` URL, or a presigned HTTPS URL when ``expires`` (seconds) is given."""
+        if expires:
+            return self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": self._key(name)},
+                ExpiresIn=expires,
+            )
+        return f"s3://{self.bucket}/{self._key(name)}"
+
+    def writer(self, name, content_type=None):
+        return _MultipartWriter(self.client, self.bucket, self._key(name), content_type)
+
+
+def open_store(target, endpoint_url=None):
+    if target.startswith("s3://"):
+        bucket, _, prefix = target[len("s3://"):].partition("/")
+        return S3Store(bucket, prefix, endpoint_url)
+    return LocalStore(target)
@@ -0,0 +1,219 @@
+"""Storage layout for MQTT telemetry and readers for it.
+
+Raw messages live in ``TELEMETRY_TABLE`` with one partition per series::
+
+    pk       "<userId>#<device_id>#<subtopic>"   (see :func:`series_id`)
+    ts       epoch milliseconds (number, sort key)
+    payload  map of variable name -> value, as published by the device
+
+so any time window of one series is a single-partition range Query.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+
+import dynamo
+
+TELEMETRY_TABLE = os.environ.get("TELEMETRY_TABLE", "sait-telemetry")
+MAX_RAW_ROWS = int(os.environ.get("TELEMETRY_MAX_RAW_ROWS", "500000"))
+# IANA zone for naive times from clients that send neither tz nor utcOffset.
+DEFAULT_TIME_ZONE = os.environ.get("TELEMETRY_DEFAULT_TZ") or None
+
+# Preset windows used by the *Historico widgets' ``filter`` parameter.
+FILTER_WINDOWS_MS = {
+    "5m": 5 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "3h": 3 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "24h": 86_400_000,
+    "1d": 86_400_000,
+    "7d": 7 * 86_400_000,
+    "30d": 30 * 86_400_000,
+}
+
+
+def series_id(user_id, device_id, subtopic):
+    return f"{user_id}#{device_id}#{subtopic}"
+
+
+def split_topic(topic):
+    """``"sait/.../device/subtopic"`` -> ``("device", "subtopic")``.
+
+    The last two levels of a topic are the device id and the subtopic, as
+    ``ingest`` stores them and ``MqttProvider.jsx`` reads them. A topic with
+    fewer than two levels gives ``(None, None)``.
+    """
+    parts = topic.split("/")
+    if len(parts) < 2:
+        return None, None
+    return parts[-2], parts[-1]
+
+
+def now_ms():
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+
+def time_zone(params):
+    """The zone naive times in ``params`` are in.
+
+    ``tz`` is an IANA name (``America/Bogota``); ``utcOffset`` is minutes
+    east of UTC (``-300``), i.e. minus JavaScript's ``getTimezoneOffset()``.
+    With neither it is ``TELEMETRY_DEFAULT_TZ``, or ``None`` if that is not
+    set. Raises ``ValueError`` for an unknown name or an out-of-range offset.
+    """
+    name = params.get("tz")
+    if not name and params.get("utcOffset") in (None, ""):
+        name = DEFAULT_TIME_ZONE
+    if name:
+        from zoneinfo import ZoneInfo
+
+        try:
+            return ZoneInfo(str(name))
+        except (KeyError, ValueError):
+            raise ValueError(f"unknown tz {name!r}") from None
+    offset = params.get("utcOffset")
+    if offset in (None, ""):
+        return None
+    try:
+        minutes = int(offset)
+    except (TypeError, ValueError):
+        raise ValueError("utcOffset must be whole minutes east of UTC") from None
+    if not -14 * 60 <= minutes <= 14 * 60:
+        raise ValueError("utcOffset must be between -840 and 840 minutes")
+    return timezone(timedelta(minutes=minutes))
+
+
+def parse_time(value, tz=None):
+    """Epoch milliseconds from an ISO-8601 string or an epoch number.
+
+    An ISO string without a UTC offset is read in ``tz``; with no ``tz`` it
+    is rejected rather than guessed at, since the widgets build those from
+    the browser's local clock (:func:`time_zone` falls back to
+    ``TELEMETRY_DEFAULT_TZ`` for clients that do not say). Raises ``ValueError`` for anything else.
+    """
+    text = str(value).strip()
+    if text.lstrip("-").isdigit():
+        number = int(text)
+        # Treat 10-digit values as seconds.
+        return number * 1000 if abs(number) < 10**11 else number
+    if text.endswith("Z"):
+        text = text[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(text)
+    if parsed.tzinfo is None:
+        if tz is None:
+            raise ValueError(
+                f"{text!r} has no UTC offset; add one (2024-05-01T08:00:00-05:00) "
+                "or send tz or utcOffset"
+            )
+        parsed = parsed.replace(tzinfo=tz)
+    return int(parsed.timestamp() * 1000)
+
+
+def iso_ms(ms):
+    text = datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")
+    return text[:-3] + "Z"
+
+
+def time_window(start=None, end=None, filter_name=None, tz=None):
+    """Resolve ``(start_ms, end_ms)`` from explicit bounds and/or a preset filter.
+
+    Bounds without a UTC offset are read in ``tz`` (see :func:`parse_time`).
+    """
+    end_ms = parse_time(end, tz) if end else now_ms()
+    if start:
+        start_ms = parse_time(start, tz)
+    elif filter_name in FILTER_WINDOWS_MS:
+        start_ms = end_ms - FILTER_WINDOWS_MS[filter_name]
+    else:
+        start_ms = end_ms - FILTER_WINDOWS_MS["1d"]
+    if start_ms >= end_ms:
+        raise ValueError("start must be before end")
+    return start_ms, end_ms
+
+
+def attr_number(attr):
+    """A typed payload attribute as a float, or None if it is not numeric."""
+    if "N" in attr:
+        return float(attr["N"])
+    if "BOOL" in attr:
+        return 1.0 if attr["BOOL"] else 0.0
+    return None
+
+
+def query_pages(series, start_ms, end_ms, projection=None, names=None, table=TELEMETRY_TABLE,
+                descending=False, limit=None):
+    """Yield raw (typed) item pages of one series between two timestamps, inclusive."""
+    request = {
+        "TableName": table,
+        "KeyConditionExpression": "pk = :pk AND ts BETWEEN :start AND :end",
+        "ExpressionAttributeValues": {
+            ":pk": {"S": series},
+            ":start": {"N": str(int(start_ms))},
+            ":end": {"N": str(int(end_ms))},
+        },
+        "ScanIndexForward": not descending,
+    }
+    if projection:
+        request["ProjectionExpression"] = projection
+    if names:
+        request["ExpressionAttributeNames"] = names
+    if limit:
+        request["Limit"] = limit
+    while True:
+        page = dynamo.client.query(**request)
+        yield page.get("Items", [])
+        if "LastEvaluatedKey" not in page:
+            return
+        request["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def payload_projection(variables=None):
+    """``(ProjectionExpression, ExpressionAttributeNames)`` for ``ts`` and some payload fields."""
+    if not variables:
+        return None, None
+    names = {"#p": "payload"}
+    names.update({f"#v{i}": name for i, name in enumerate(variables)})
+    return "ts, " + ", ".join(f"#p.#v{i}" for i in range(len(variables))), names
+
+
+def read_raw(series, start_ms, end_ms, variables=None, max_rows=MAX_RAW_ROWS):
+    """Read raw samples into NumPy arrays.
+
+    Returns ``(ts, columns, truncated)``: ``ts`` is a sorted ``int64`` array,
+    ``columns`` maps each variable to a ``float64`` array aligned with it
+    (``NaN`` where a message lacked the variable), and ``truncated`` says
+    whether ``max_rows`` cut the window short. With ``variables=None`` every
+    numeric payload field found is returned.
+    """
+    import numpy as np
+
+    projection, names = payload_projection(variables)
+    timestamps, values = [], {name: [] for name in variables or ()}
+    truncated = False
+    for items in query_pages(series, start_ms, end_ms, projection, names):
+        for item in items:
+            row = len(timestamps)
+            timestamps.append(int(item["ts"]["N"]))
+            for name, attr in item.get("payload", {}).get("M", {}).items():
+                number = attr_number(attr)
+                if number is None:
+                    continue
+                column = values.get(name)
+                if column is None:
+                    if variables:
+                        continue
+                    column = values[name] = []
+                column.extend([np.nan] * (row - len(column)))
+                column.append(number)
+        if len(timestamps) >= max_rows:
+            truncated = True
+            break
+
+    size = len(timestamps)
+    ts = np.array(timestamps, dtype=np.int64)
+    columns = {}
+    for name, column in values.items():
+        column.extend([np.nan] * (size - len(column)))
+        columns[name] = np.array(column, dtype=np.float64)
+    return ts, columns, truncated
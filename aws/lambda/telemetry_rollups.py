@@ -0,0 +1,305 @@
+"""1-minute, 1-hour and 1-day rollups of MQTT telemetry.
+
+``ROLLUPS_TABLE`` holds one item per series, resolution and bucket::
+
+    pk            "<userId>#<device_id>#<subtopic>#<resolution>"   e.g. ...#1h
+    ts            bucket start, epoch ms
+    n             messages in the bucket
+    count:<var>   samples of <var>
+    sum:<var>, min:<var>, max:<var>, last:<var>
+
+``stream_handler`` runs on the telemetry table's stream. For every minute a
+batch touched it recomputes that minute's row from the raw messages, then the
+enclosing hour from its 1m rows and the day from its 1h rows. Each row is
+rewritten whole from the level below, so retried batches, duplicate and
+late messages all leave the same result. Raw rows removed by TTL are
+ignored, so rollups outlive the raw data. The same handler keeps the topic
+and variable catalog (see ``catalog``) and the latest values of every topic
+(see ``latest``) current.
+
+:func:`query` serves long windows from the coarsest resolution that still
+gives the chart enough points (see :func:`pick_resolution`), so a 30-day
+chart reads about 720 hourly rows from a single partition.
+
+Rows for a window can be recomputed from the raw table with::
+
+    python telemetry_rollups.py backfill "<userId>#<device_id>#<subtopic>" \\
+        --start 2025-01-01T00:00:00Z --end 2025-02-01T00:00:00Z
+"""
+
+import os
+from decimal import Decimal
+
+import metrics
+
+import numpy as np
+
+import catalog
+import downsample
+import dynamo
+import latest
+import telemetry
+
+ROLLUPS_TABLE = os.environ.get("TELEMETRY_ROLLUPS_TABLE", "sait-telemetry-rollups")
+
+# Coarsest first.
+RESOLUTIONS = (("1d", 86_400_000), ("1h", 3_600_000), ("1m", 60_000))
+WIDTHS = dict(RESOLUTIONS)
+PARENTS = {"1m": "1h", "1h": "1d"}
+FIELDS = ("count", "sum", "min", "max", "last")
+
+# A resolution is used only if the window spans at least this fraction of
+# the requested points at that resolution; otherwise a finer one (or the raw
+# table) is read.
+MIN_FILL = float(os.environ.get("ROLLUP_MIN_FILL", "0.5"))
+
+
+def rollup_key(series, resolution):
+    return f"{series}#{resolution}"
+
+
+def _floor(ms, width):
+    return ms - ms % width
+
+
+def pick_resolution(start_ms, end_ms, points):
+    """Coarsest resolution giving at least ``points * MIN_FILL`` rows, or None for raw."""
+    span = end_ms - start_ms
+    for name, width in RESOLUTIONS:
+        if span / width >= points * MIN_FILL:
+            return name
+    return None
+
+
+def empty_parts(size):
+    parts = {agg: np.full(size, np.nan) for agg in FIELDS}
+    parts["count"] = np.zeros(size, dtype=np.int64)
+    return parts
+
+
+def read_rollups(series, resolution, start_ms, end_ms, variables=None):
+    """Rollup rows of one series whose buckets overlap ``[start_ms, end_ms]``.
+
+    Returns ``(ts, messages, partials)`` where ``partials[var]`` maps each of
+    ``FIELDS`` to an array aligned with ``ts``, the input
+    :func:`downsample.merge` expects.
+    """
+    projection, names = None, None
+    if variables:
+        names = {"#n": "n"}
+        attrs = []
+        for i, name in enumerate(variables):
+            for j, agg in enumerate(FIELDS):
+                names[f"#a{i}_{j}"] = f"{agg}:{name}"
+                attrs.append(f"#a{i}_{j}")
+        projection = "ts, #n, " + ", ".join(attrs)
+
+    rows = []
+    key = rollup_key(series, resolution)
+    first = _floor(start_ms, WIDTHS[resolution])
+    for items in telemetry.query_pages(key, first, end_ms, projection, names, ROLLUPS_TABLE):
+        rows.extend(items)
+
+    ts = np.array([int(row["ts"]["N"]) for row in rows], dtype=np.int64)
+    messages = np.array([int(row.get("n", {}).get("N", 0)) for row in rows], dtype=np.int64)
+    partials = {name: empty_parts(len(rows)) for name in variables or ()}
+    for i, row in enumerate(rows):
+        for attr, value in row.items():
+            agg, sep, name = attr.partition(":")
+            if not sep or agg not in FIELDS or "N" not in value:
+                continue
+            parts = partials.get(name)
+            if parts is None:
+                if variables:
+                    continue
+                parts = partials[name] = empty_parts(len(rows))
+            parts[agg][i] = float(value["N"])
+    return ts, messages, partials
+
+
+def rebucket(ts, messages, partials, start_ms, end_ms, points, resolution):
+    """Merge rows read by :func:`read_rollups` into at most ``points`` buckets.
+
+    Buckets are a whole multiple of the resolution and aligned to it.
+    Returns ``(starts, width, stats, messages)`` with ``stats`` shaped like
+    :func:`downsample.bucketize`.
+    """
+    step = WIDTHS[resolution]
+    first = _floor(start_ms, step)
+    factor = max(1, -(-(end_ms - first) // (points * step)))
+    while True:
+        width = factor * step
+        origin = _floor(first, width)
+        n_buckets = max(1, -(-(end_ms - origin) // width))
+        if n_buckets <= points:
+            break
+        factor += 1
+    # Rows of a wider read (see historical.batch_query) stay out of this window.
+    keep = (ts >= first) & (ts <= end_ms)
+    ts, messages = ts[keep], messages[keep]
+    partials = {
+        name: {agg: values[keep] for agg, values in parts.items()}
+        for name, parts in partials.items()
+    }
+    starts, stats = downsample.merge(ts, partials, origin, width, n_buckets)
+    return starts, width, stats, int(messages.sum())
+
+
+def query(series, start_ms, end_ms, points, variables=None, resolution=None):
+    """Bucketed stats for a window, read from rollups instead of raw telemetry.
+
+    Returns ``(starts, width, stats, messages, resolution)``; see
+    :func:`rebucket`.
+    """
+    resolution = resolution or pick_resolution(start_ms, end_ms, points)
+    ts, messages, partials = read_rollups(series, resolution, start_ms, end_ms, variables)
+    return rebucket(ts, messages, partials, start_ms, end_ms, points, resolution) + (resolution,)
+
+
+def _number(value):
+    return Decimal(repr(float(value)))
+
+
+def _item(series, resolution, start, messages, stats, bucket=0):
+    item = {"pk": rollup_key(series, resolution), "ts": int(start), "n": int(messages)}
+    for name, series_stats in stats.items():
+        count = int(series_stats["count"][bucket])
+        if not count:
+            continue
+        item[f"count:{name}"] = count
+        for agg in ("sum", "min", "max", "last"):
+            item[f"{agg}:{name}"] = _number(series_stats[agg][bucket])
+    return item
+
+
+def _write(requests):
+    failed = dynamo.batch_write(ROLLUPS_TABLE, requests)
+    if failed:
+        # Rows are recomputed whole, so letting the stream retry is safe.
+        raise RuntimeError(f"{len(failed)} rollup writes were not processed")
+
+
+def refresh_minutes(series, minutes):
+    """Recompute the 1m rows for ``minutes`` (bucket starts) from raw telemetry."""
+    width = WIDTHS["1m"]
+    by_hour = {}
+    for minute in minutes:
+        by_hour.setdefault(_floor(minute, WIDTHS["1h"]), []).append(minute)
+
+    key = rollup_key(series, "1m")
+    requests = []
+    for hour_minutes in by_hour.values():
+        first, last = min(hour_minutes), max(hour_minutes) + width
+        ts, columns, _ = telemetry.read_raw(series, first, last - 1)
+        n_buckets = (last - first) // width
+        _, _, stats = downsample.bucketize(ts, columns, first, last, n_buckets)
+        messages = np.bincount((ts - first) // width, minlength=n_buckets)
+        for minute in set(hour_minutes):
+            bucket = (minute - first) // width
+            if messages[bucket]:
+                item = _item(series, "1m", minute, messages[bucket], stats, bucket)
+                requests.append({"PutRequest": {"Item": item}})
+            else:
+                requests.append({"DeleteRequest": {"Key": {"pk": key, "ts": minute}}})
+    _write(requests)
+    return {_floor(minute, WIDTHS["1h"]) for minute in minutes}
+
+
+def refresh_parents(series, resolution, starts):
+    """Recompute the parent rows of ``resolution`` buckets ``starts`` from their children."""
+    parent = PARENTS[resolution]
+    width = WIDTHS[parent]
+    parent_starts = {_floor(start, width) for start in starts}
+    requests = []
+    for start in parent_starts:
+        ts, messages, partials = read_rollups(series, resolution, start, start + width - 1)
+        if not len(ts):
+            key = {"pk": rollup_key(series, parent), "ts": start}
+            requests.append({"DeleteRequest": {"Key": key}})
+            continue
+        _, stats = downsample.merge(ts, partials, start, width, 1)
+        requests.append(
+            {"PutRequest": {"Item": _item(series, parent, start, messages.sum(), stats)}}
+        )
+    _write(requests)
+    return parent_starts
+
+
+def refresh(series, minutes):
+    hours = refresh_minutes(series, minutes)
+    days = refresh_parents(series, "1m", hours)
+    refresh_parents(series, "1h", days)
+
+
+def touched_minutes(records):
+    """``{series: {minute start, ...}}`` for the messages inserted or changed in a batch."""
+    touched = {}
+    for record in records:
+        # TTL expiry of raw messages must not erase their rollups.
+        if record.get("eventName") == "REMOVE":
+            continue
+        image = record.get("dynamodb", {}).get("NewImage") or {}
+        series = image.get("pk", {}).get("S")
+        ts = image.get("ts", {}).get("N")
+        if series and ts:
+            touched.setdefault(series, set()).add(_floor(int(ts), WIDTHS["1m"]))
+    return touched
+
+
+def stream_handler(event, context):
+    records = event.get("Records", [])
+    invocation = metrics.begin("telemetry-rollups", "stream")
+    status = 500
+    try:
+        touched = touched_minutes(records)
+        for series, minutes in touched.items():
+            refresh(series, minutes)
+        catalog_writes = catalog.update_from_records(records)
+        latest_writes = latest.update_from_records(records)
+        status = 200
+        return {
+            "series": len(touched),
+            "minutes": sum(len(minutes) for minutes in touched.values()),
+            "records": len(records),
+            "catalogWrites": catalog_writes,
+            "latestWrites": latest_writes,
+        }
+    finally:
+        invocation.finish(status, 0)
+
+
+def backfill(series, start_ms, end_ms):
+    """Recompute every rollup row of ``series`` that has raw messages in the window."""
+    minutes = set()
+    for items in telemetry.query_pages(series, start_ms, end_ms, projection="ts"):
+        minutes.update(_floor(int(item["ts"]["N"]), WIDTHS["1m"]) for item in items)
+    if minutes:
+        refresh(series, minutes)
+    return {"series": series, "minutes": len(minutes)}
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Telemetry rollup maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    backfill_cmd = commands.add_parser("backfill", help="recompute rollups from raw telemetry")
+    backfill_cmd.add_argument("series", help='"<userId>#<device_id>#<subtopic>"')
+    backfill_cmd.add_argument(
+        "--start", required=True, help="ISO-8601, read as UTC unless it has an offset"
+    )
+    backfill_cmd.add_argument("--end", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "backfill":
+        from datetime import timezone
+
+        start_ms, end_ms = telemetry.time_window(args.start, args.end, tz=timezone.utc)
+        print(json.dumps(backfill(args.series, start_ms, end_ms)))
+
+
+metrics.init_finished()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""Bulk export of ``sait-tickets`` as gzip NDJSON or CSV.
+
+The table is read with a parallel Scan (``Segment``/``TotalSegments``), one
+thread per segment, so throughput is limited by the table's read capacity
+rather than by one thread's round-trip latency. ``--max-rcu`` keeps the
+export under a read budget shared by all threads.
+
+Each segment writes numbered chunk objects::
+
+    <target>/part-<segment>-<chunk>.ndjson.gz   (or .csv.gz)
+    <target>/_checkpoints/segment-<segment>.json
+    <target>/manifest.json                        written when every segment is done
+
+A chunk is written first and its segment checkpoint (the Scan position after
+that chunk) second. Chunk names are deterministic, so ``--resume`` after a
+crash rewrites at most the one chunk that had no checkpoint yet and never
+duplicates rows. ``<target>`` is a local directory or ``s3://bucket/prefix``.
+
+Usage::
+
+    python ticket_export.py /tmp/tickets-export --format csv --segments 8 --max-rcu 50
+    python ticket_export.py s3://sait-reports/exports/2025-04 --resume
+"""
+
+import gzip
+import io
+import json
+import os
+
+import dynamo
+from apigw import dumps
+from storage import open_store
+
+TICKETS_TABLE = os.environ.get("TICKETS_TABLE", "sait-tickets")
+
+CSV_COLUMNS = (
+    "ticketId",
+    "userId",
+    "userType",
+    "asunto",
+    "tipo",
+    "prioridad",
+    "status",
+    "descripcion",
+    "createdAt",
+    "updatedAt",
+    "version",
+)
+FORMATS = ("ndjson", "csv")
+DEFAULT_CHUNK_BYTES = 8 * 1024 * 1024
+
+
+class _ChunkWriter:
+    """Accumulates one gzip chunk in memory and hands it to the store when full."""
+
+    def __init__(self, fmt):
+        self.fmt = fmt
+        self.rows = 0
+        self._buffer = io.BytesIO()
+        self._gzip = gzip.GzipFile(fileobj=self._buffer, mode="wb", compresslevel=6)
+        self._text = io.TextIOWrapper(self._gzip, encoding="utf-8", newline="")
+        if fmt == "csv":
+            import csv
+
+            self._csv = csv.DictWriter(self._text, CSV_COLUMNS, extrasaction="ignore")
+            self._csv.writeheader()
+
+    def write(self, item):
+        if self.fmt == "csv":
+            self._csv.writerow(item)
+        else:
+            self._text.write(dumps(item))
+            self._text.write("\n")
+        self.rows += 1
+
+    def size(self):
+        return self._buffer.tell()
+
+    def close(self):
+        self._text.flush()
+        self._text.detach()
+        self._gzip.close()
+        return self._buffer.getvalue()
+
+
+class Export:
+    def __init__(
+        self,
+        store,
+        fmt="ndjson",
+        total_segments=8,
+        chunk_bytes=DEFAULT_CHUNK_BYTES,
+        max_rcu=None,
+        table_name=TICKETS_TABLE,
+    ):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {FORMATS}")
+        self.store = store
+        self.fmt = fmt
+        self.total_segments = total_segments
+        self.chunk_bytes = chunk_bytes
+        self.table_name = table_name
+        self.limiter = None
+        if max_rcu:
+            from ratelimit import TokenBucket
+
+            self.limiter = TokenBucket(max_rcu, capacity=max_rcu)
+
+    def _checkpoint_name(self, segment):
+        return f"_checkpoints/segment-{segment:05d}.json"
+
+    def _chunk_name(self, segment, chunk):
+        return f"part-{segment:05d}-{chunk:05d}.{self.fmt}.gz"
+
+    def load_checkpoint(self, segment):
+        raw = self.store.get(self._checkpoint_name(segment))
+        if raw is None:
+            return None
+        state = json.loads(raw)
+        if state["totalSegments"] != self.total_segments or state["format"] != self.fmt:
+            raise ValueError(
+                f"checkpoint for segment {segment} was written with "
+                f"{state['totalSegments']} segments/{state['format']}; "
+                "resume with the same --segments and --format"
+            )
+        return state
+
+    def _save_checkpoint(self, state):
+        self.store.put(
+            self._checkpoint_name(state["segment"]),
+            json.dumps(state).encode(),
+            content_type="application/json",
+        )
+
+    def _flush(self, writer, state, last_key, done=False):
+        if writer is not None and writer.rows:
+            self.store.put(
+                self._chunk_name(state["segment"], state["chunk"]),
+                writer.close(),
+                content_type="application/gzip",
+            )
+            state["parts"].append(self._chunk_name(state["segment"], state["chunk"]))
+            state["chunk"] += 1
+            state["items"] += writer.rows
+        state["lastEvaluatedKey"] = last_key
+        state["done"] = done
+        self._save_checkpoint(state)
+
+    def export_segment(self, segment, resume=False):
+        state = self.load_checkpoint(segment) if resume else None
+        if state and state["done"]:
+            return state
+        state = state or {
+            "segment": segment,
+            "totalSegments": self.total_segments,
+            "format": self.fmt,
+            "chunk": 0,
+            "items": 0,
+            "parts": [],
+            "lastEvaluatedKey": None,
+            "done": False,
+        }
+
+        request = {
+            "TableName": self.table_name,
+            "Segment": segment,
+            "TotalSegments": self.total_segments,
+            "ReturnConsumedCapacity": "TOTAL",
+        }
+        if state["lastEvaluatedKey"]:
+            request["ExclusiveStartKey"] = state["lastEvaluatedKey"]
+
+        writer = None
+        while True:
+            page = dynamo.client.scan(**request)
+            if self.limiter:
+                self.limiter.acquire(page.get("ConsumedCapacity", {}).get("CapacityUnits", 1))
+            for raw in page.get("Items", []):
+                if writer is None:
+                    writer = _ChunkWriter(self.fmt)
+                writer.write(dynamo.deserialize_item(raw))
+            last_key = page.get("LastEvaluatedKey")
+            if not last_key:
+                self._flush(writer, state, None, done=True)
+                return state
+            request["ExclusiveStartKey"] = last_key
+            # Chunks end on page boundaries so the checkpoint can resume the Scan exactly.
+            if writer is not None and writer.size() >= self.chunk_bytes:
+                self._flush(writer, state, last_key)
+                writer = None
+
+    def run(self, resume=False, max_workers=None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        segments = range(self.total_segments)
+        with ThreadPoolExecutor(max_workers=max_workers or self.total_segments) as pool:
+            states = list(pool.map(lambda segment: self.export_segment(segment, resume), segments))
+        manifest = {
+            "table": self.table_name,
+            "format": self.fmt,
+            "compression": "gzip",
+            "totalSegments": self.total_segments,
+            "items": sum(state["items"] for state in states),
+            "parts": [part for state in states for part in state["parts"]],
+        }
+        if self.fmt == "csv":
+            manifest["columns"] = list(CSV_COLUMNS)
+        self.store.put(
+            "manifest.json", json.dumps(manifest, indent=2).encode(), content_type="application/json"
+        )
+        return manifest
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export sait-tickets as gzip NDJSON/CSV")
+    parser.add_argument("target", help="local directory or s3://bucket/prefix")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--segments", type=int, default=8)
+    parser.add_argument("--chunk-mb", type=float, default=DEFAULT_CHUNK_BYTES / 2**20)
+    parser.add_argument(
+        "--max-rcu", type=float, default=None, help="read capacity units per second to stay under"
+    )
+    parser.add_argument("--resume", action="store_true", help="continue from checkpoints")
+    parser.add_argument("--s3-endpoint", default=None)
+    args = parser.parse_args(argv)
+
+    export = Export(
+        open_store(args.target, args.s3_endpoint),
+        fmt=args.format,
+        total_segments=args.segments,
+        chunk_bytes=int(args.chunk_mb * 2**20),
+        max_rcu=args.max_rcu,
+    )
+    manifest = export.run(resume=args.resume)
+    print(json.dumps({"items": manifest["items"], "parts": len(manifest["parts"])}))
+
+
+if __name__ == "__main__":
+    main()
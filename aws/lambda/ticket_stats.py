@@ -0,0 +1,215 @@
+"""Per-user ticket rollups kept up to date from the ``sait-tickets`` stream.
+
+One item per user in ``TICKET_STATS_TABLE`` holds counters with flat
+attribute names so they can be bumped with ``ADD`` without first creating
+nested maps::
+
+    total                       all tickets
+    status:<status>             e.g. status:abierto
+    prioridad:<prioridad>       e.g. prioridad:alta
+    tipo:<tipo>                 e.g. tipo:soporte
+    status|prioridad:<s>|<p>    e.g. status|prioridad:abierto|alta
+
+``stream_handler`` folds a batch of stream records into per-user deltas and
+applies them in ``TransactWriteItems`` calls whose ``ClientRequestToken`` is
+derived from the batch, so a retried batch is not counted twice. Reading a
+user's stats (``GET /tickets/stats``) is then a single ``GetItem`` however
+many tickets they have.
+
+If the counters ever drift (for example after a stream outage longer than
+its 24 h retention), recompute them from the table with::
+
+    python ticket_stats.py rebuild --segments 8
+"""
+
+import os
+from collections import Counter
+
+import metrics
+
+import dynamo
+
+TICKETS_TABLE = os.environ.get("TICKETS_TABLE", "sait-tickets")
+STATS_TABLE = os.environ.get("TICKET_STATS_TABLE", "sait-ticket-stats")
+
+DIMENSIONS = ("status", "prioridad", "tipo")
+TRANSACT_LIMIT = 100
+
+
+def buckets(ticket):
+    """Counter names a ticket contributes 1 to."""
+    names = ["total"]
+    for dimension in DIMENSIONS:
+        value = ticket.get(dimension)
+        if value:
+            names.append(f"{dimension}:{value}")
+    if ticket.get("status") and ticket.get("prioridad"):
+        names.append(f"status|prioridad:{ticket['status']}|{ticket['prioridad']}")
+    return names
+
+
+def _image(record, key):
+    raw = record.get("dynamodb", {}).get(key)
+    if not raw:
+        return None
+    # Only the string attributes matter for bucketing.
+    return {name: value["S"] for name, value in raw.items() if "S" in value}
+
+
+def fold_records(records):
+    """Net counter deltas per userId for a batch of stream records."""
+    deltas = {}
+    for record in records:
+        old, new = _image(record, "OldImage"), _image(record, "NewImage")
+        for image, sign in ((old, -1), (new, 1)):
+            if image and image.get("userId"):
+                counts = deltas.setdefault(image["userId"], Counter())
+                for name in buckets(image):
+                    counts[name] += sign
+    return {
+        user_id: {name: delta for name, delta in counts.items() if delta}
+        for user_id, counts in deltas.items()
+        if any(counts.values())
+    }
+
+
+def _update_action(user_id, counts):
+    names, values, parts = {}, {}, []
+    for i, (name, delta) in enumerate(sorted(counts.items())):
+        names[f"#c{i}"] = name
+        values[f":c{i}"] = {"N": str(delta)}
+        parts.append(f"#c{i} :c{i}")
+    return {
+        "Update": {
+            "TableName": STATS_TABLE,
+            "Key": {"userId": {"S": user_id}},
+            "UpdateExpression": "ADD " + ", ".join(parts),
+            "ExpressionAttributeNames": names,
+            "ExpressionAttributeValues": values,
+        }
+    }
+
+
+def _batch_token(records, chunk):
+    import hashlib
+
+    first = records[0].get("dynamodb", {}).get("SequenceNumber", "")
+    last = records[-1].get("dynamodb", {}).get("SequenceNumber", "")
+    raw = f"{records[0].get('eventSourceARN', '')}:{first}:{last}:{chunk}"
+    return hashlib.sha256(raw.encode()).hexdigest()[:36]
+
+
+def apply_deltas(deltas, records):
+    """Write ``deltas`` in transactions of up to 100 users each.
+
+    Each transaction is all-or-nothing and carries a token derived from the
+    batch, and DynamoDB treats a repeated token (within 10 minutes) as
+    already applied. When the stream retries a batch after a partial
+    failure, chunks that already went through are not counted again.
+    """
+    users = sorted(deltas)
+    for chunk, start in enumerate(range(0, len(users), TRANSACT_LIMIT)):
+        chunk_users = users[start:start + TRANSACT_LIMIT]
+        actions = [_update_action(user, deltas[user]) for user in chunk_users]
+        dynamo.client.transact_write_items(
+            TransactItems=actions,
+            ClientRequestToken=_batch_token(records, chunk),
+        )
+
+
+def stream_handler(event, context):
+    records = event.get("Records", [])
+    invocation = metrics.begin("ticket-stats", "stream")
+    status = 500
+    try:
+        deltas = fold_records(records)
+        if deltas:
+            apply_deltas(deltas, records)
+        status = 200
+        return {"users": len(deltas), "records": len(records)}
+    finally:
+        invocation.finish(status, 0)
+
+
+def read_stats(user_id):
+    """Shape a user's rollup item for ``GET /tickets/stats``."""
+    item = dynamo.table(STATS_TABLE).get_item(Key={"userId": user_id}).get("Item") or {}
+    stats = {"userId": user_id, "total": int(item.get("total", 0))}
+    for dimension in DIMENSIONS:
+        stats["by" + dimension.capitalize()] = {}
+    stats["byStatusPrioridad"] = {}
+    for name, value in item.items():
+        count = int(value) if not isinstance(value, str) else 0
+        if ":" not in name or count <= 0:
+            continue
+        kind, _, label = name.partition(":")
+        if kind == "status|prioridad":
+            status, _, prioridad = label.partition("|")
+            stats["byStatusPrioridad"].setdefault(status, {})[prioridad] = count
+        elif kind in DIMENSIONS:
+            stats["by" + kind.capitalize()][label] = count
+    return stats
+
+
+def rebuild(total_segments=8):
+    """Recompute every user's rollup from a parallel Scan of the tickets table.
+
+    Counts are gathered per segment on a thread pool, merged, and written
+    back as whole items; rollups of users who no longer have tickets are
+    deleted. Tickets written while the rebuild runs may be counted twice or
+    missed, so run it during a quiet period.
+    """
+
+    def count_segment(segment, pages):
+        counts = {}
+        for items, _ in pages:
+            for ticket in items:
+                if ticket.get("userId"):
+                    counts.setdefault(ticket["userId"], Counter()).update(buckets(ticket))
+        return counts
+
+    totals = {}
+    partials = dynamo.parallel_scan(
+        TICKETS_TABLE,
+        total_segments,
+        count_segment,
+        ProjectionExpression="userId, #s, prioridad, tipo",
+        ExpressionAttributeNames={"#s": "status"},
+    )
+    for partial in partials:
+        for user_id, counts in partial.items():
+            totals.setdefault(user_id, Counter()).update(counts)
+
+    stale = [
+        item["userId"]
+        for items, _ in dynamo.scan_segment(STATS_TABLE, 0, 1, ProjectionExpression="userId")
+        for item in items
+        if item["userId"] not in totals
+    ]
+
+    requests = [
+        {"PutRequest": {"Item": {"userId": user_id, **counts}}} for user_id, counts in totals.items()
+    ]
+    requests += [{"DeleteRequest": {"Key": {"userId": user_id}}} for user_id in stale]
+    failed = dynamo.batch_write(STATS_TABLE, requests)
+    return {"users": len(totals), "removed": len(stale), "failed": len(failed)}
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Ticket rollup maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = commands.add_parser("rebuild", help="recompute all rollups from the tickets table")
+    rebuild_cmd.add_argument("--segments", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    if args.command == "rebuild":
+        print(json.dumps(rebuild(args.segments)))
+
+
+metrics.init_finished()
+
+if __name__ == "__main__":
+    main()
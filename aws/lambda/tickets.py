@@ -1,1018 +1,516 @@
-import React, { useState, useEffect, useContext } from "react";
-import { Button, Grid, Typography, IconButton, Card, CardContent, Snackbar } from "@mui/material";
-import { Edit, Delete, Add, Save, DashboardCustomize } from "@mui/icons-material";
-import ChartConfigModal from "./ChartConfigModal";
-import LineChartComponent from "./LineChartComponent";
-import BarChartComponent from "./BarChartComponent";
-import PieChartComponent from "./PieChartComponent";
-import DoughnutChartComponent from "./DoughnutChartComponent";
-import GaugeChartComponent from "./GaugeChartComponent";
-import ValueCardComponent from "./ValueCardComponent";
-import AreaChartComponent from "./AreaChartComponent";
-import AddSubdashboardModal from "./AddSubdashboardModal";
-import Sidebar from "./Navbar";
-import { MqttContext } from "./MqttContext";
-import MixedChartComponent from "./MixedChartComponent"; // Importación del nuevo componente
- import BubbleChartComponent from "./BubbleChartComponent";
-import RadarChartComponent from "./RadarChartComponent";
-import ScatterChartComponent from "./ScatterChartComponent";
-import StackedBarChartComponent from "./StackedBarChartComponent";
-import BarHistorico from "./BarHistorico";
-import LineHistorico from "./LineHistorico";
- import "chartjs-adapter-date-fns";
-const DashboardConfig = () => {
-  const { mqttData, subscribeToTopic, userId } = useContext(MqttContext);
-
-   const [components, setComponents] = useState([]);
-  const [subdashboards, setSubdashboards] = useState([]);
-  const [activeSubdashboard, setActiveSubdashboard] = useState(null);
-  const [modalOpen, setModalOpen] = useState(false);
-  const [subdashboardModalOpen, setSubdashboardModalOpen] = useState(false);
-  const [editingIndex, setEditingIndex] = useState(null);
-  const [editingSubdashboardIndex, setEditingSubdashboardIndex] = useState(null);
-  const [deletionQueue, setDeletionQueue] = useState([]);
-  const [snackbarOpen, setSnackbarOpen] = useState(false);
-  const [snackbarMessage, setSnackbarMessage] = useState("");
-  console.log("User ID from MqttContext:", userId);
-
-  const columnSizeMap = {
-    col2: 2,
-    col3: 3,
-    col4: 4,
-    col6: 6,
-    col12: 12,
-  };
-
-  useEffect(() => {
-    console.log("Datos MQTT recibidos:", mqttData);
-  }, [mqttData]);
-
-  useEffect(() => {
-    components.forEach((component) => {
-      component.variables.forEach((variable) => {
-        const topicParts = variable.variable.split("/");
-        const generalTopic = topicParts.slice(0, topicParts.length - 1).join("/") + "/#";
-        subscribeToTopic(generalTopic);
-      });
-    });
-  }, [components, subscribeToTopic]);
- 
-  useEffect(() => {
-    if (!userId) {
-      console.warn("[DashConfig] userId no disponible => no suscribimos nada");
-      return;
-    }
-    components.forEach((component) => {
-      component.variables.forEach((variable) => {
-        const topicParts = variable.variable.split("/");
-        const generalTopic = topicParts.slice(0, -1).join("/") + "/#";
-        subscribeToTopic(generalTopic);
-      });
-    });
-  }, [components, userId, subscribeToTopic]);
-  useEffect(() => {
-    const fetchDashboardData = async () => {
-      if (!userId) {
-        //alert("El usuario no está logueado.");
-        return;
-      }
-
-      try {
-        const response = await fetch(
-          `https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}`
-        );
-
-        if (!response.ok) {
-          const errorData = await response.json();
-          console.error("Error al cargar los datos:", errorData);
-          alert(`Error: ${errorData.error || "No se pudieron cargar los datos."}`);
-          return;
-        }
-
-        const data = await response.json();
-       /* console.log("Payload recibido:", JSON.stringify(data, null, 2));
-        console.log("Payload Details:", {
-          totalDashboards: data.dashboards.length,
-          dashboardInfo: data.dashboards.map(d => ({
-            id: d.subdashboardId,
-            name: d.subdashboardName,
-            color: d.subdashboardColor,
-            totalComponents: d.components.length,
-            componentTypes: [...new Set(d.components.map(c => c.chartType))],
-            componentNames: d.components.map(c => c.componentName),
-            variableTypes: [...new Set(d.components.flatMap(c => c.variables.map(v => v.value)))],
-          }))
-        });*/
-
-        const { dashboards } = data;
-        const subdashboardsFromDB = dashboards.map((d) => ({
-          id: d.subdashboardId,
-          name: d.subdashboardName,
-          color: d.subdashboardColor,
-        }));
-        const componentsFromDB = dashboards.flatMap((d) =>
-          d.components.map((comp) => ({
-            ...comp,
-            subdashboardId: d.subdashboardId,
-          }))
-        );
-
-        setSubdashboards(subdashboardsFromDB);
-        setComponents(componentsFromDB);
-
-        if (subdashboardsFromDB.length > 0) {
-          setActiveSubdashboard(subdashboardsFromDB[0]);
-        }
-      } catch (error) {
-        console.error("Error en la solicitud:", error);
-        alert("Hubo un error al conectar con el servidor.");
-      }
-    };
-
-    fetchDashboardData();
-  }, [userId]);
-
-  const handleAddComponent = (newComponent) => {
-    if (!activeSubdashboard) {
-      alert("Por favor, selecciona un subdashboard antes de agregar un componente.");
-      return;
-    }
-
-    newComponent.subdashboardId = activeSubdashboard.id;
-
-    if (editingIndex !== null) {
-      const updatedComponents = [...components];
-      updatedComponents[editingIndex] = newComponent;
-      setComponents(updatedComponents);
-    } else {
-      setComponents([...components, newComponent]);
-    }
-
-    setModalOpen(false);
-    setEditingIndex(null); // Resetear el índice de edición
-  };
-
-  const handleEditComponent = (index) => {
-    if (!activeSubdashboard) {
-      alert("Por favor, selecciona un subdashboard antes de editar un componente.");
-      return;
-    }
-
-    // Filtrar los componentes del subdashboard activo
-    const filteredComponents = components.filter(
-      (component) => component.subdashboardId === activeSubdashboard.id
-    );
+"""Tickets API behind the support screen (``Ticket.jsx``).
 
-    if (index < 0 || index >= filteredComponents.length) {
-      console.error("Índice de edición inválido:", index);
-      return;
+Routes, as wired in ``template.yaml``::
+
+    POST /tickets               create a ticket
+    GET  /tickets?userId=...    list a user's tickets (cursor-paginated)
+    GET  /tickets?ids=a,b,c     look up several tickets at once
+    POST /tickets:batchCreate   create up to 100 tickets
+    PUT  /tickets:batchUpdate   update up to 100 tickets
+    GET  /tickets/stats?userId= counts by status, prioridad and tipo
+    GET  /tickets/{ticketId}    fetch one ticket
+    PUT  /tickets/{ticketId}    update a ticket
+
+The function runs with 128 MB, so cold starts are kept short: the DynamoDB
+resource comes from ``dynamo`` (created once at import, during init) and
+modules only some routes need are imported inside those routes.
+
+Every ticket carries a ``version`` that starts at 1 and is bumped by each
+update. Single-ticket responses expose it as an ``ETag``; sending it back in
+``If-Match`` on ``PUT`` makes the update conditional, and a ``409`` means
+someone else changed the ticket first.
+
+Single-ticket and list reads are cached per container for
+``TICKETS_CACHE_TTL`` seconds (an ``X-Cache`` header says whether a response
+was a hit). Writes handled by the same container invalidate the affected
+entries; writes handled by other containers become visible once the TTL
+runs out.
+"""
+
+import os
+import time
+
+import metrics
+
+import dynamo
+from ttlcache import TTLCache
+from apigw import (
+    HttpError,
+    header,
+    json_body,
+    path_params,
+    query_params,
+    response,
+    route_handler,
+)
+
+TABLE_NAME = os.environ.get("TICKETS_TABLE", "sait-tickets")
+
+CREATE_FIELDS = ("asunto", "tipo", "descripcion", "prioridad")
+UPDATABLE_FIELDS = ("asunto", "tipo", "descripcion", "prioridad", "status")
+DEFAULT_STATUS = "abierto"
+
+# What the list screen shows; ``descripcion`` is only sent by the detail route.
+LIST_FIELDS = ("ticketId", "asunto", "tipo", "prioridad", "status", "createdAt")
+SELECTABLE_FIELDS = frozenset(
+    LIST_FIELDS + ("userId", "userType", "descripcion", "updatedAt", "version")
+)
+
+USER_INDEX = "UserIdIndex"
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 100
+
+MAX_IDEMPOTENCY_KEY = 255
+# Fixed namespace so the same (userId, Idempotency-Key) always yields the same ticketId.
+IDEMPOTENCY_NAMESPACE = "6f1c3e52-2b7e-4d1a-9a57-3c2f0d8e4b91"
+
+MAX_BATCH_ITEMS = 100
+BATCH_UPDATE_WORKERS = 4
+
+table = dynamo.table(TABLE_NAME)
+
+cache = TTLCache(
+    maxsize=int(os.environ.get("TICKETS_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("TICKETS_CACHE_TTL", "5")),
+)
+
+
+def _now():
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+def _new_ticket_id():
+    import uuid
+
+    return uuid.uuid4().hex
+
+
+def _text(field, value):
+    """A ticket field as stored: a non-empty string; numbers are accepted and converted."""
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise HttpError(400, f"{field} must be a string")
+    text = str(value)
+    if not text.strip():
+        raise HttpError(400, f"{field} must not be empty")
+    return text
+
+
+def _build_ticket(body, ticket_id=None):
+    """Validate a create payload and return the new item."""
+    if not body.get("userId"):
+        raise HttpError(400, "userId is required")
+    missing = [field for field in CREATE_FIELDS if not body.get(field)]
+    if missing:
+        raise HttpError(400, f"Missing fields: {', '.join(missing)}")
+
+    now = _now()
+    item = {
+        "ticketId": ticket_id or _new_ticket_id(),
+        "userId": str(body["userId"]),
+        "userType": str(body.get("userType") or "normal"),
+        "status": DEFAULT_STATUS,
+        "createdAt": now,
+        "updatedAt": now,
+        "version": 1,
     }
+    for field in CREATE_FIELDS:
+        item[field] = _text(field, body[field])
+    return item
 
-    // Obtener el componente correcto del estado global usando el índice filtrado
-    const componentToEdit = filteredComponents[index];
-    const globalIndex = components.findIndex(
-      (comp) => comp.subdashboardId === activeSubdashboard.id && comp === componentToEdit
-    );
 
-    if (globalIndex === -1) {
-      console.error("No se encontró el componente en el estado global.");
-      return;
+def _cache_headers(hit):
+    return {
+        "X-Cache": "HIT" if hit else "MISS",
+        "X-Cache-Hits": str(cache.hits),
+        "X-Cache-Misses": str(cache.misses),
     }
 
-    setEditingIndex(globalIndex); // Usar el índice global para editar
-    setModalOpen(true);
-  };
-
-  const handleDeleteComponent = (index) => {
-    // Filtrar los componentes del subdashboard activo
-    const filteredComponents = components.filter(
-      (component) => component.subdashboardId === activeSubdashboard?.id
-    );
-  
-    // Verificar si el índice está dentro del rango de los componentes filtrados
-    if (index < 0 || index >= filteredComponents.length) {
-      console.error("Índice de eliminación inválido:", index);
-      return;
-    }
-  
-    // Obtener el componente a eliminar del subdashboard activo
-    const componentToDelete = filteredComponents[index];
-  
-    // Encontrar el índice global del componente en la lista completa de componentes
-    const globalIndex = components.findIndex(
-      (comp) => comp.subdashboardId === activeSubdashboard?.id && comp === componentToDelete
-    );
-  
-    if (globalIndex === -1) {
-      console.error("No se encontró el componente en el estado global.");
-      return;
-    }
-  
-    // Eliminar el componente usando el índice global
-    const deletedComponent = components[globalIndex];
-  
-    if (!deletedComponent?.subdashboardId) {
-      console.error("El componente no tiene un ID válido para eliminar:", deletedComponent);
-      alert("Error: Este componente no puede eliminarse porque no tiene un identificador válido.");
-      return;
-    }
-  
-    // Agregar a la cola de eliminación
-    setDeletionQueue((prev) => [
-      ...prev,
-      { type: "component", id: deletedComponent.subdashboardId },
-    ]);
-  
-    // Eliminar el componente del estado
-    setComponents((prev) => prev.filter((_, i) => i !== globalIndex));
-  };
-
-  const handleDeleteSubdashboard = (index) => {
-    const deletedSubdashboard = subdashboards[index];
-
-    if (!deletedSubdashboard?.id) {
-      console.error("El subdashboard no tiene un ID válido para eliminar:", deletedSubdashboard);
-      alert("Error: Este subdashboard no puede eliminarse porque no tiene un identificador válido.");
-      return;
-    }
-
-    setDeletionQueue((prev) => [
-      ...prev,
-      { type: "subdashboard", id: deletedSubdashboard.id },
-    ]);
 
-    setSubdashboards((prev) => prev.filter((_, i) => i !== index));
-    setComponents((prev) =>
-      prev.filter((comp) => comp.subdashboardId !== deletedSubdashboard.id)
-    );
-
-    // Si el subdashboard eliminado era el activo, selecciona otro
-    if (activeSubdashboard?.id === deletedSubdashboard.id) {
-      setActiveSubdashboard(subdashboards[0] || null);
-    }
-  };
-
-  const handleAddSubdashboard = (subdashboard) => {
-    if (editingSubdashboardIndex !== null) {
-      const updatedSubdashboards = [...subdashboards];
-      updatedSubdashboards[editingSubdashboardIndex] = {
-        ...updatedSubdashboards[editingSubdashboardIndex],
-        ...subdashboard,
-      };
-      setSubdashboards(updatedSubdashboards);
-      setEditingSubdashboardIndex(null);
-    } else {
-      const newSubdashboard = { id: Date.now(), ...subdashboard };
-      setSubdashboards((prev) => [...prev, newSubdashboard]);
-      setActiveSubdashboard(newSubdashboard);
-    }
-    setSubdashboardModalOpen(false);
-  };
-
-  const handleEditSubdashboard = (index) => {
-    setEditingSubdashboardIndex(index);
-    setSubdashboardModalOpen(true);
-  };
-  const fetchHistoricalData = async (userId, filter, startDate, endDate) => {
-    try {
-      const url = `https://refiss445e.execute-api.us-east-1.amazonaws.com/filtromqtt?userId=${userId}&filter=${filter}${
-        startDate ? `&startDate=${startDate}` : ""
-      }${endDate ? `&endDate=${endDate}` : ""}`;
-  
-      const response = await fetch(url);
-  
-      if (!response.ok) {
-        throw new Error("Error al obtener los datos históricos.");
-      }
-  
-      const data = await response.json();
-      return data;
-    } catch (error) {
-      console.error("Error en la solicitud:", error);
-      return [];
-    }
-  };
-  const handleSaveDashboard = async () => {
-    if (!userId) {
-      alert("El usuario no está logueado.");
-      return;
-    }
-
-    if (!subdashboards.length && !deletionQueue.length) {
-      alert("No hay subdashboards creados ni eliminaciones pendientes para guardar.");
-      return;
-    }
-
-    try {
-      for (const item of deletionQueue) {
-        const deleteResponse = await fetch(
-          `https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}&type=${item.type}&id=${item.id}`,
-          {
-            method: "DELETE",
-            headers: {
-              Authorization: `Bearer ${localStorage.getItem("token")}`,
-            },
-          }
-        );
-
-        if (!deleteResponse.ok) {
-          const errorData = await deleteResponse.json();
-          console.error("Error al eliminar:", errorData);
-          alert(`Error al eliminar: ${errorData.error || "No se pudo eliminar el elemento."}`);
-          return;
-        }
-      }
-
-      setDeletionQueue([]);
-
-      const payload = {
-        userId,
-        subdashboards: subdashboards.map((sub) => ({
-          id: sub.id?.toString(),
-          name: sub.name?.trim() || "Subdashboard sin nombre",
-          color: sub.color || "#FFFFFF",
-        })),
-        components: components.map((comp) => ({
-          subdashboardId: comp.subdashboardId?.toString(),
-          chartType: comp.chartType || "Sin tipo de gráfico",
-          componentName: comp.componentName?.trim() || "Componente sin nombre",
-          variables: (comp.variables || []).map((variable) => {
-            const segments = variable.variable.split("/");
-            const topic = segments.slice(0, segments.length - 1).join("/");
-            const subtopic = segments[segments.length - 1];
-
-            return {
-              variable: variable.variable?.trim() || "Variable sin nombre",
-              topic: topic || "Sin topic",
-              subtopic: subtopic || "Sin subtopic",
-              value: variable.value || "Sin value",
-              color: variable.color || "#000000",
-            };
-          }),
-          colSize: comp.colSize || "col6",
-          height: typeof comp.height === "number" ? comp.height : 400,
-        })),
-      };
-
-      console.log("Payload enviado:", JSON.stringify(payload, null, 2));
-
-      const response = await fetch(
-        "https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboards",
-        {
-          method: "POST",
-          headers: {
-            "Content-Type": "application/json",
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
-          },
-          body: JSON.stringify(payload),
-        }
-      );
-
-      if (!response.ok) {
-        const errorData = await response.json();
-        console.error("Error al guardar el panel de control:", errorData);
-        alert(`Error: ${errorData.error || "No se pudo guardar el panel de control."}`);
-        return;
-      }
-
-      setSnackbarMessage("Panel de control guardado exitosamente.");
-      setSnackbarOpen(true);
-    } catch (error) {
-      console.error("Error en la solicitud:", error);
-      alert("Hubo un error al conectar con el servidor.");
-    }
-  };
-
-  const prepareChart = (component) => {
-    // Si no hay variables, retornar datos vacíos
-    if (!component.variables || component.variables.length === 0) {
-      return { labels: [], datasets: [] };
-    }
-  
-    // Preparar datos para PieChart
-    if (component.chartType === "PieChart") {
-      const labels = [];
-      const values = [];
-      const colors = [];
-      const borderColors = [];
-  
-      component.variables.forEach((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic];
-  
-        if (topicData?.values && topicData.values[valueKey] !== undefined) {
-          // Obtener el último valor
-          const lastValue = Array.isArray(topicData.values[valueKey])
-            ? topicData.values[valueKey][topicData.values[valueKey].length - 1]
-            : topicData.values[valueKey];
-  
-          if (lastValue !== undefined) {
-            labels.push(valueKey);
-            values.push(parseFloat(lastValue));
-            colors.push(variable.backgroundColor || variable.color || '#fff');
-            borderColors.push(variable.borderColor || variable.color || '#fff');
-          }
-        }
-      });
-  
-      return {
-        labels: labels,
-        datasets: [
-          {
-            data: values,
-            backgroundColor: colors,
-            borderColor: borderColors,
-            borderWidth: 2,
-          },
-        ],
-      };
-    }
-  
-    // Preparar datos para DoughnutChart
-    if (component.chartType === "DoughnutChart") {
-      const labels = [];
-      const values = [];
-      const colors = [];
-      const borderColors = [];
-  
-      component.variables.forEach((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic];
-  
-        if (topicData?.values && topicData.values[valueKey] !== undefined) {
-          // Obtener el último valor
-          const lastValue = Array.isArray(topicData.values[valueKey])
-            ? topicData.values[valueKey][topicData.values[valueKey].length - 1]
-            : topicData.values[valueKey];
-  
-          if (lastValue !== undefined) {
-            labels.push(valueKey);
-            values.push(parseFloat(lastValue));
-            colors.push(variable.backgroundColor || variable.color || '#fff');
-            borderColors.push(variable.borderColor || variable.color || '#fff');
-          }
-        }
-      });
-  
-      return {
-        labels: labels,
-        datasets: [
-          {
-            data: values,
-            backgroundColor: colors,
-            borderColor: borderColors,
-            borderWidth: 2,
-          },
-        ],
-      };
-    }
-  
-    // Preparar datos para gráficos de líneas, barras, área, etc.
-    if (
-      component.chartType === "LineChart" ||
-      component.chartType === "BarChart" ||
-      component.chartType === "AreaChart"
-    ) {
-      let labels = [];
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-  
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-  
-        const alignedTimes = timesArray.slice(-10);
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-  
-        if (labels.length === 0) {
-          labels = alignedTimes;
-        }
-  
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues,
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-          borderWidth: 2,
-          fill: component.chartType === "AreaChart", // Solo llenar para gráficos de área
-        };
-      });
-  
-      return { labels, datasets };
-    }
-  
-    // Preparar datos para GaugeChart
-    if (component.chartType === "GaugeChart") {
-      const labels = [];
-      const values = [];
-      const colors = [];
-      const borderColors = [];
-  
-      component.variables.forEach((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic];
-  
-        if (topicData?.values && topicData.values[valueKey] !== undefined) {
-          // Obtener el último valor
-          const lastValue = Array.isArray(topicData.values[valueKey])
-            ? topicData.values[valueKey][topicData.values[valueKey].length - 1]
-            : topicData.values[valueKey];
-  
-          if (lastValue !== undefined) {
-            labels.push(valueKey);
-            values.push(parseFloat(lastValue));
-            colors.push(variable.backgroundColor || variable.color || '#fff');
-            borderColors.push(variable.borderColor || variable.color || '#fff');
-          }
-        }
-      });
-  
-      return {
-        labels: labels,
-        datasets: [
-          {
-            data: values,
-            backgroundColor: colors,
-            borderColor: borderColors,
-            borderWidth: 2,
-          },
-        ],
-      };
-    }
-  
- 
-    if (component.chartType === "ValueCard") {
-      const variablesData = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic];
-  
-        if (topicData?.values && topicData.values[valueKey] !== undefined) {
-          // Obtener los valores de la variable
-          const values = Array.isArray(topicData.values[valueKey])
-            ? topicData.values[valueKey]
-            : [topicData.values[valueKey]];
-  
-          return {
-            value: valueKey, // Nombre de la variable (por ejemplo, "potencia")
-            data: values, // Valores de la variable
-            backgroundColor: variable.backgroundColor || variable.color || "#fff",
-          };
-        }
-  
-        return null; // Si no hay datos para la variable
-      }).filter(Boolean); // Filtrar variables sin datos
-  
-      return variablesData; // Retornar todas las variables con datos
-    }
-    if (component.chartType === "MixedChart") {
-      let labels = []; // Cambiar `const` por `let`
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedTimes = timesArray.slice(-10);
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        if (labels.length === 0) {
-          labels = alignedTimes; // Ahora esto es válido
-        }
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues,
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-          borderWidth: 2,
-          type: variable.type || "bar",
-        };
-      });
-    
-      return { labels, datasets };
-    }
-    if (component.chartType === "StackedBarChart") {
-      let labels = [];
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedTimes = timesArray.slice(-10);
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        if (labels.length === 0) {
-          labels = alignedTimes;
-        }
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues,
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-          borderWidth: 1,
-        };
-      });
-    
-      // Ordenar los datasets de menor a mayor según la suma de sus valores
-      datasets.sort((a, b) => {
-        const sumA = a.data.reduce((acc, val) => acc + val, 0);
-        const sumB = b.data.reduce((acc, val) => acc + val, 0);
-        return sumA - sumB; // Orden ascendente (menor a mayor)
-      });
-    
-      return { labels, datasets };
-    }
-    if (component.chartType === "BubbleChart") {
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues.map((value, index) => ({
-            x: index, // Eje X: índice del dato
-            y: value, // Eje Y: valor del dato
-            r: Math.abs(value) / 10, // Tamaño de la burbuja
-          })),
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-        };
-      });
-    
-      return { datasets };
-    }
-    if (component.chartType === "RadarChart") {
-      const labels = [];
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        if (labels.length === 0) {
-          labels.push(...timesArray.slice(-10).map((time) => time.toString()));
-        }
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues,
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-          borderWidth: 1,
-        };
-      });
-     
-      return { labels, datasets };
-    }
-    if (component.chartType === "ScatterChart") {
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues.map((value, index) => ({
-            x: index, // Eje X: índice del dato
-            y: value, // Eje Y: valor del dato
-          })),
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-        };
-      });
-    
-      return { datasets };
-    }
-    if (component.chartType === "BarHistorico") {
-      let labels = [];
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedTimes = timesArray.slice(-10); // Últimos 10 tiempos
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        if (labels.length === 0) {
-          labels = alignedTimes;
-        }
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues,
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-          borderWidth: 2,
-        };
-      });
-    
-      return { labels, datasets };
+def _etag(item):
+    # Tickets written before versioning count as version 0.
+    return f'"{int(item.get("version", 0))}"'
+
+
+def _expected_version(raw):
+    """Parse an ``If-Match`` value (or a body ``version``); ``None`` means unconditional."""
+    if raw is None or raw == "*":
+        return None
+    text = str(raw).strip()
+    if text.startswith("W/"):
+        text = text[2:]
+    try:
+        return int(text.strip('"'))
+    except ValueError:
+        raise HttpError(400, "If-Match must be a ticket ETag such as \"3\"") from None
+
+
+def _invalidate(ticket):
+    """Forget cached copies of ``ticket`` and of its owner's list pages."""
+    cache.pop(("ticket", ticket["ticketId"]))
+    user_id = ticket.get("userId")
+    cache.invalidate_where(lambda key: key[0] == "list" and key[1] == user_id)
+
+
+def _idempotent_ticket_id(user_id, key):
+    """Derive the ticketId a given ``Idempotency-Key`` will always map to."""
+    import uuid
+
+    if not 1 <= len(key) <= MAX_IDEMPOTENCY_KEY or not key.isprintable():
+        raise HttpError(
+            400, f"Idempotency-Key must be 1-{MAX_IDEMPOTENCY_KEY} printable characters"
+        )
+    return uuid.uuid5(uuid.UUID(IDEMPOTENCY_NAMESPACE), f"{user_id}:{key}").hex
+
+
+def create_ticket(event):
+    """Create a ticket, optionally made idempotent with an ``Idempotency-Key`` header.
+
+    With a key, the ticketId is derived from ``(userId, key)`` and the put is
+    conditional on that id being unused, so retries and concurrent duplicates
+    can only ever create one item and need no companion table. A replay gets
+    the original ticket back (from the failed condition check, without a
+    second read) and an ``Idempotent-Replayed: true`` header; reusing a key
+    for a different ticket is a 422.
+    """
+    body = json_body(event)
+    key = header(event, "Idempotency-Key")
+    ticket_id = _idempotent_ticket_id(str(body.get("userId")), key) if key else None
+    item = _build_ticket(body, ticket_id)
+    if key:
+        item["idempotencyKey"] = key
+
+    from botocore.exceptions import ClientError
+
+    try:
+        table.put_item(
+            Item=item,
+            ConditionExpression="attribute_not_exists(ticketId)",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+    except ClientError as exc:
+        if not key or exc.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        original = dynamo.deserialize_item(exc.response.get("Item") or {})
+        if any(original.get(field) != item[field] for field in ("userId",) + CREATE_FIELDS):
+            raise HttpError(
+                422, "Idempotency-Key was already used for a different ticket"
+            ) from None
+        return response(201, original, {"ETag": _etag(original), "Idempotent-Replayed": "true"})
+    _invalidate(item)
+    return response(201, item, {"ETag": _etag(item)})
+
+
+def _batch_items(body, key):
+    items = body.get(key)
+    if not isinstance(items, list) or not items:
+        raise HttpError(400, f"{key} must be a non-empty list")
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HttpError(400, f"At most {MAX_BATCH_ITEMS} {key} per request")
+    return items
+
+
+def batch_create_tickets(event):
+    """Create up to ``MAX_BATCH_ITEMS`` tickets with ``BatchWriteItem``.
+
+    The response lists every input position as either ``created`` (with the
+    new item) or ``failed`` (with the reason), so one bad or throttled ticket
+    does not fail the whole batch.
+    """
+    results, valid = [], []
+    for index, body in enumerate(_batch_items(json_body(event), "tickets")):
+        try:
+            if not isinstance(body, dict):
+                raise HttpError(400, "ticket must be a JSON object")
+            item = _build_ticket(body)
+        except HttpError as err:
+            results.append({"index": index, "status": "failed", "error": err.message})
+            continue
+        valid.append((index, item))
+
+    unprocessed = dynamo.batch_write(
+        TABLE_NAME, [{"PutRequest": {"Item": item}} for _, item in valid]
+    )
+    unprocessed_ids = {req["PutRequest"]["Item"]["ticketId"] for req in unprocessed}
+    for index, item in valid:
+        if item["ticketId"] in unprocessed_ids:
+            results.append({"index": index, "status": "failed", "error": "Throttled, retry later"})
+        else:
+            results.append({"index": index, "status": "created", "ticket": item})
+            _invalidate(item)
+
+    results.sort(key=lambda result: result["index"])
+    failed = any(result["status"] == "failed" for result in results)
+    return response(207 if failed else 200, {"results": results})
+
+
+def _page_limit(params):
+    raw = params.get("limit")
+    if raw is None:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise HttpError(400, "limit must be an integer") from None
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HttpError(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    return limit
+
+
+def _created_at_condition(params):
+    from boto3.dynamodb.conditions import Key
+
+    created = Key("createdAt")
+    since, until = params.get("since"), params.get("until")
+    if since and until:
+        if since > until:
+            raise HttpError(400, "since must not be after until")
+        return created.between(since, until)
+    if since:
+        return created.gte(since)
+    if until:
+        return created.lte(until)
+    return None
+
+
+def _projection(params, required=()):
+    raw = params.get("fields")
+    if raw:
+        fields = list(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+        unknown = sorted(set(fields) - SELECTABLE_FIELDS)
+        if unknown:
+            raise HttpError(400, f"Unknown fields: {', '.join(unknown)}")
+    else:
+        fields = list(LIST_FIELDS)
+    fields += [field for field in required if field not in fields]
+    names = {f"#p{i}": field for i, field in enumerate(fields)}
+    return ", ".join(names), names
+
+
+def get_tickets_by_id(event):
+    """``GET /tickets?ids=a,b,c``: ``BatchGetItem`` lookup, in request order."""
+    params = query_params(event)
+    ids = list(dict.fromkeys(i.strip() for i in params["ids"].split(",") if i.strip()))
+    if not ids:
+        raise HttpError(400, "ids must list at least one ticketId")
+    if len(ids) > MAX_BATCH_ITEMS:
+        raise HttpError(400, f"At most {MAX_BATCH_ITEMS} ids per request")
+
+    projection, names = _projection(params, required=("ticketId",))
+    found, unprocessed = dynamo.batch_get(
+        TABLE_NAME, [{"ticketId": ticket_id} for ticket_id in ids], projection, names
+    )
+    by_id = {item["ticketId"]: item for item in found}
+    body = {
+        "tickets": [by_id[ticket_id] for ticket_id in ids if ticket_id in by_id],
+        "missing": [ticket_id for ticket_id in ids if ticket_id not in by_id],
     }
-    if (component.chartType === "LineHistorico") {
-      let labels = [];
-      const datasets = component.variables.map((variable) => {
-        const topic = variable.variable;
-        const valueKey = variable.value;
-        const topicData = mqttData[topic] || { time: [], values: {} };
-    
-        const timesArray = topicData.time || [];
-        const valuesArray = topicData.values?.[valueKey] || [];
-    
-        const alignedTimes = timesArray.slice(-10); // Últimos 10 tiempos
-        const alignedValues = Array.isArray(valuesArray) ? valuesArray.slice(-10) : [];
-    
-        if (labels.length === 0) {
-          labels = alignedTimes;
-        }
-    
-        return {
-          label: valueKey || "Sin Nombre",
-          data: alignedValues,
-          backgroundColor: variable.backgroundColor || variable.color || "rgba(75,192,192,0.4)",
-          borderColor: variable.borderColor || variable.color || "rgba(75,192,192,1)",
-          borderWidth: 2,
-          fill: false, // No rellenar el área bajo la línea
-        };
-      });
-    
-      // Si no hay datos, devolver un objeto vacío
-      if (labels.length === 0 || datasets.length === 0) {
-        return { labels: [], datasets: [] };
-      }
-    
-      return { labels, datasets };
+    if unprocessed:
+        retry = {key["ticketId"] for key in unprocessed}
+        body["missing"] = [ticket_id for ticket_id in body["missing"] if ticket_id not in retry]
+        body["unprocessed"] = [ticket_id for ticket_id in ids if ticket_id in retry]
+    return response(200, body)
+
+
+def list_tickets(event):
+    """Newest-first page of one user's tickets, read from ``UserIdIndex``.
+
+    Each call is a single key-condition Query bounded by ``limit``, so its
+    cost follows the page size rather than the size of the table. Optional
+    ``since``/``until`` bound ``createdAt``; ``nextCursor`` is absent on the
+    last page. Items carry ``LIST_FIELDS`` unless ``fields=a,b,c`` asks for
+    others.
+    """
+    from boto3.dynamodb.conditions import Key
+
+    params = query_params(event)
+    if params.get("ids"):
+        return get_tickets_by_id(event)
+    user_id = params.get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+
+    cache_key = ("list", user_id) + tuple(
+        params.get(name) for name in ("cursor", "limit", "since", "until", "fields")
+    )
+    body = cache.get(cache_key)
+    if body is not None:
+        return response(200, body, _cache_headers(hit=True))
+
+    condition = Key("userId").eq(user_id)
+    created = _created_at_condition(params)
+    if created is not None:
+        condition = condition & created
+
+    projection, names = _projection(params)
+    kwargs = {
+        "IndexName": USER_INDEX,
+        "KeyConditionExpression": condition,
+        "ProjectionExpression": projection,
+        "ExpressionAttributeNames": names,
+        "ScanIndexForward": False,
+        "Limit": _page_limit(params),
     }
-    // Si no coincide con ningún tipo de gráfico, retornar datos vacíos
-    return { labels: [], datasets: [] };
-  };
-  const renderComponent = (component, index) => {
-    const colSize = columnSizeMap[component.colSize] || 12;
-    const height = component.height || "300px";
-    const chartData = prepareChart(component);
-  
-    return (
-      <Grid item xs={12} sm={colSize} md={colSize} lg={colSize} key={index}>
-        <Card
-          style={{
-            padding: "20px",
-            height: `${parseInt(height, 10) + 50}px`,
-            boxShadow: "0 4px 8px rgba(0, 0, 0, 0.1)",
-            width: "100%",
-            overflow: "hidden",
-            position: "relative",
-          }}
-        >
-          <div
-            style={{
-              position: "absolute",
-              top: "0",
-              left: "0",
-              right: "0",
-              padding: "8px",
-              background: "rgba(255, 255, 255, 0.9)",
-              display: "flex",
-              justifyContent: "space-between",
-              alignItems: "center",
-              borderBottom: "1px solid rgba(0, 0, 0, 0.1)",
-              zIndex: 1,
-            }}
-          >
-            <Typography variant="h6">
-              {component.componentName || "Componente sin nombre"}
-            </Typography>
-            <div style={{ display: "flex", gap: "5px" }}>
-              <IconButton
-                color="primary"
-                size="small"
-                style={{ padding: "4px" }}
-                onClick={() => handleEditComponent(index)}
-              >
-                <Edit fontSize="small" />
-              </IconButton>
-              <IconButton
-  color="error"
-  size="small"
-  style={{ padding: "4px" }}
-  onClick={() => handleDeleteComponent(index)} // Pasar el índice correcto
->
-  <Delete fontSize="small" />
-</IconButton>
-            </div>
-          </div>
-          <CardContent style={{ marginTop: "40px" }}>
-            <div style={{ width: "100%", height: height, overflow: "hidden" }}>
-              {component.chartType === "LineChart" && (
-                <LineChartComponent data={chartData} title={component.componentName} />
-              )}
-              {component.chartType === "BarChart" && (
-                <BarChartComponent data={chartData} title={component.componentName} />
-              )}
-              {component.chartType === "PieChart" && ( // Nuevo caso para PieChart
-                <PieChartComponent data={chartData} title={component.componentName} />
-              )}
-              {component.chartType === "DoughnutChart" && (
-                <DoughnutChartComponent data={chartData} title={component.componentName} />
-              )}
-              {component.chartType === "GaugeChart" && (
-                <GaugeChartComponent data={chartData} title={component.componentName} />
-              )}
-                {component.chartType === "ValueCard" && (
-              <ValueCardComponent
-                variables={chartData} // Pasar todas las variables
-                title={component.componentName}
-              />
-            )}
-              {component.chartType === "AreaChart" && (
-                <AreaChartComponent data={chartData} title={component.componentName} />
-              )}
-                 {component.chartType === "MixedChart" && (
-              <MixedChartComponent data={chartData} title={component.componentName} />
-            )}
-            {component.chartType === "StackedBarChart" && (
-  <StackedBarChartComponent data={chartData} title={component.componentName} />
-)}
-{component.chartType === "BubbleChart" && (
-  <BubbleChartComponent data={chartData} title={component.componentName} />
-)} 
-{component.chartType === "RadarChart" && (
-  <RadarChartComponent data={chartData} title={component.componentName} />
-)}
- 
-{component.chartType === "ScatterChart" && (
-  <ScatterChartComponent data={chartData} title={component.componentName} />
-)}
- {component.chartType === "BarHistorico" && (
-  <BarHistorico
-    userId={userId}
-    title={component.componentName}
-    fetchHistoricalData={fetchHistoricalData}
-    variables={component.variables} // Pasar el arreglo de variables
-  />
-)}
-{component.chartType === "LineHistorico" && (
-  <LineHistorico
-    userId={userId}
-    title={component.componentName}
-    fetchHistoricalData={fetchHistoricalData}
-    variables={component.variables || []} // Pasar el arreglo de variables (o un array vacío si no está definido)
-  />
-)}
-             </div>
-          </CardContent>
-        </Card>
-      </Grid>
-    );
-  };
-
-  const handleCloseModal = () => {
-    setModalOpen(false);
-    setEditingIndex(null); // Resetear el índice de edición
-  };
-
-  const filteredComponents = components.filter(
-    (component) => component.subdashboardId === activeSubdashboard?.id
-  );
-
-  return (
-    <div style={{ display: "flex", flexWrap: "wrap" }}>
-      <Sidebar />
-      <div style={{ flex: 1, padding: "20px", marginLeft: "250px", maxWidth: "calc(100% - 250px)", overflow: "hidden" }}>
-        <Typography
-          variant="h4"
-          style={{ marginBottom: "20px", textAlign: "center", fontWeight: "bold" }}
-        >
-          Configurar el panel de control
-        </Typography>
-        <div style={{ display: "flex", flexWrap: "wrap", gap: "10px", marginBottom: "20px", justifyContent: "center" }}>
-          <Button
-            variant="contained"
-            color="primary"
-            onClick={() => {
-              if (!activeSubdashboard) {
-                alert("Por favor, selecciona un subdashboard antes de agregar un componente.");
-                return;
-              }
-              setModalOpen(true);
-              setEditingIndex(null);
-            }}
-            startIcon={<Add />}
-            disabled={!activeSubdashboard}
-            style={{ boxShadow: "0 4px 8px rgba(0, 0, 0, 0.2)" }}
-          >
-            Agregar Componente
-          </Button>
-          <Button
-            variant="contained"
-            style={{ backgroundColor: "#9C27B0", color: "white", boxShadow: "0 4px 8px rgba(0, 0, 0, 0.2)" }}
-            onClick={() => setSubdashboardModalOpen(true)}
-            startIcon={<DashboardCustomize />}
-          >
-            Añadir Navegación
-          </Button>
-          <Button
-            variant="contained"
-            style={{ backgroundColor: "#4CAF50", color: "white", boxShadow: "0 4px 8px rgba(0, 0, 0, 0.2)" }}
-            onClick={handleSaveDashboard}
-            startIcon={<Save />}
-          >
-            Guardar Panel de Control
-          </Button>
-        </div>
-        <div style={{ textAlign: "center", marginBottom: "20px" }}>
-          {activeSubdashboard ? (
-            <Typography variant="h6" style={{ color: activeSubdashboard.color, fontWeight: "bold" }}>
-              Subdashboard activo: {activeSubdashboard.name}
-            </Typography>
-          ) : (
-            <Typography variant="h6" style={{ color: "#888" }}>
-              Selecciona un subdashboard para comenzar
-            </Typography>
-          )}
-        </div>
-        <div style={{ marginBottom: "20px", display: "flex", flexWrap: "wrap", gap: "10px" }}>
-          {subdashboards.map((subdashboard, index) => (
-            <div key={subdashboard.id} style={{ display: "flex", alignItems: "center", gap: "10px" }}>
-              <Button
-                variant="contained"
-                style={{
-                  backgroundColor: subdashboard.color,
-                  color: "white",
-                  boxShadow: "0 4px 8px rgba(0, 0, 0, 0.2)",
-                }}
-                onClick={() => setActiveSubdashboard(subdashboard)}
-              >
-                {subdashboard.name}
-              </Button>
-              <IconButton
-                color="primary"
-                size="small"
-                onClick={() => handleEditSubdashboard(index)}
-              >
-                <Edit />
-              </IconButton>
-              <IconButton
-                color="secondary"
-                size="small"
-                onClick={() => handleDeleteSubdashboard(index)}
-              >
-                <Delete />
-              </IconButton>
-            </div>
-          ))}
-        </div>
-        <Grid container spacing={4}> 
-          {filteredComponents.map((component, index) => renderComponent(component, index))}
-        </Grid>
-        <ChartConfigModal
-          open={modalOpen}
-          onClose={handleCloseModal}
-          onSave={handleAddComponent}
-          initialData={editingIndex !== null ? components[editingIndex] : null}
-        />
-        <AddSubdashboardModal
-          open={subdashboardModalOpen}
-          onClose={() => setSubdashboardModalOpen(false)}
-          onSave={handleAddSubdashboard}
-          initialData={editingSubdashboardIndex !== null ? subdashboards[editingSubdashboardIndex] : null}
-        />
-        <Snackbar
-          open={snackbarOpen}
-          autoHideDuration={3000}
-          onClose={() => setSnackbarOpen(false)}
-          message={snackbarMessage}
-        />
-      </div>
-    </div>
-  );
-};
-
-export default DashboardConfig;
\ No newline at end of file
+    cursor = params.get("cursor")
+    if cursor:
+        try:
+            start_key = dynamo.decode_cursor(cursor)
+        except ValueError:
+            raise HttpError(400, "Invalid cursor") from None
+        if start_key.get("userId") != user_id:
+            raise HttpError(400, "Cursor does not belong to this userId")
+        kwargs["ExclusiveStartKey"] = start_key
+
+    page = table.query(**kwargs)
+    body = {"tickets": page.get("Items", [])}
+    next_cursor = dynamo.encode_cursor(page.get("LastEvaluatedKey"))
+    if next_cursor:
+        body["nextCursor"] = next_cursor
+    cache.set(cache_key, body)
+    return response(200, body, _cache_headers(hit=False))
+
+
+def get_ticket_stats(event):
+    """One ``GetItem`` on the rollup kept by ``ticket_stats.stream_handler``."""
+    from ticket_stats import read_stats
+
+    user_id = query_params(event).get("userId")
+    if not user_id:
+        raise HttpError(400, "userId query parameter is required")
+    return response(200, read_stats(user_id))
+
+
+def get_ticket(event):
+    ticket_id = path_params(event).get("ticketId")
+    item = cache.get(("ticket", ticket_id))
+    if item is not None:
+        return response(200, item, {"ETag": _etag(item), **_cache_headers(hit=True)})
+    item = table.get_item(Key={"ticketId": ticket_id}).get("Item")
+    if item is None:
+        raise HttpError(404, "Ticket not found")
+    cache.set(("ticket", ticket_id), item)
+    return response(200, item, {"ETag": _etag(item), **_cache_headers(hit=False)})
+
+
+def _apply_update(ticket_id, body, expected_version=None):
+    """Apply the updatable fields in ``body`` to one ticket; returns the new item.
+
+    This is a single ``UpdateItem``: only the fields present in ``body`` are
+    set, ``version`` is incremented, and when ``expected_version`` is given
+    the write only happens if the stored version still matches. On a
+    mismatch DynamoDB hands back the current item, so telling a missing
+    ticket (404) from a stale one (409) needs no extra read. It goes through
+    the thread-safe ``dynamo.client``: ``batch_update_tickets`` calls it
+    from worker threads.
+    """
+    changes = {field: _text(field, body[field]) for field in UPDATABLE_FIELDS if field in body}
+    if not changes:
+        raise HttpError(400, f"Nothing to update; allowed fields: {', '.join(UPDATABLE_FIELDS)}")
+    changes["updatedAt"] = _now()
+
+    names = {f"#{field}": field for field in changes}
+    values = {f":{field}": value for field, value in changes.items()}
+    names["#version"] = "version"
+    values[":one"] = 1
+    expression = "SET " + ", ".join(f"#{field} = :{field}" for field in changes)
+    expression += " ADD #version :one"
+
+    condition = "attribute_exists(ticketId)"
+    if expected_version == 0:
+        condition += " AND attribute_not_exists(#version)"
+    elif expected_version is not None:
+        condition += " AND #version = :expected"
+        values[":expected"] = expected_version
+
+    from botocore.exceptions import ClientError
+
+    try:
+        result = dynamo.client.update_item(
+            TableName=TABLE_NAME,
+            Key=dynamo.serialize_item({"ticketId": ticket_id}),
+            UpdateExpression=expression,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=dynamo.serialize_item(values),
+            ReturnValues="ALL_NEW",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+    except ClientError as exc:
+        if exc.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+        current = exc.response.get("Item")
+        if not current:
+            raise HttpError(404, "Ticket not found") from None
+        current = dynamo.deserialize_item(current)
+        raise HttpError(
+            409,
+            "Ticket was modified by someone else; refetch and retry",
+            details={"current": current},
+            headers={"ETag": _etag(current)},
+        ) from None
+    return dynamo.deserialize_item(result["Attributes"])
+
+
+def update_ticket(event):
+    ticket_id = path_params(event).get("ticketId")
+    body = json_body(event)
+    expected = _expected_version(header(event, "If-Match") or body.get("version"))
+    item = _apply_update(ticket_id, body, expected)
+    _invalidate(item)
+    return response(200, item, {"ETag": _etag(item)})
+
+
+def batch_update_tickets(event):
+    """Apply per-ticket changes (typically a status) to up to ``MAX_BATCH_ITEMS`` tickets.
+
+    ``BatchWriteItem`` can only replace whole items, which would clobber
+    concurrent edits, so each ticket gets its own conditional ``UpdateItem``.
+    They run on a small thread pool so a triage batch is one invocation
+    without bursting far past the table's provisioned write capacity. An
+    entry's ``version`` makes its update conditional, like ``If-Match``.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    updates = _batch_items(json_body(event), "updates")
+
+    def apply(indexed):
+        index, body = indexed
+        ticket_id = body.get("ticketId") if isinstance(body, dict) else None
+        if not ticket_id:
+            return {"index": index, "status": "failed", "error": "ticketId is required"}
+        try:
+            expected = _expected_version(body.get("version"))
+            item = _apply_update(str(ticket_id), body, expected)
+        except HttpError as err:
+            return {"index": index, "ticketId": ticket_id, "status": "failed", "error": err.message}
+        except Exception as exc:  # throttling after retries, network errors
+            return {"index": index, "ticketId": ticket_id, "status": "failed", "error": str(exc)}
+        return {"index": index, "ticketId": ticket_id, "status": "updated", "ticket": item}
+
+    with ThreadPoolExecutor(max_workers=BATCH_UPDATE_WORKERS) as pool:
+        results = list(pool.map(apply, enumerate(updates)))
+    # The cache is not thread-safe, so invalidate back on the handler thread.
+    for result in results:
+        if result["status"] == "updated":
+            _invalidate(result["ticket"])
+    failed = any(result["status"] == "failed" for result in results)
+    return response(207 if failed else 200, {"results": results})
+
+
+ROUTES = {
+    ("POST", "/tickets"): create_ticket,
+    ("POST", "/tickets:batchCreate"): batch_create_tickets,
+    ("PUT", "/tickets:batchUpdate"): batch_update_tickets,
+    ("GET", "/tickets"): list_tickets,
+    ("GET", "/tickets/stats"): get_ticket_stats,
+    ("GET", "/tickets/{ticketId}"): get_ticket,
+    ("PUT", "/tickets/{ticketId}"): update_ticket,
+}
+
+
+lambda_handler = route_handler(
+    "tickets", ROUTES,
+    counters=lambda: {"cache_hits": cache.hits, "cache_misses": cache.misses},
+)
+
+
+metrics.init_finished()
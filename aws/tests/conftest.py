@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The handlers are flat modules in aws/lambda, imported by name as in Lambda.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "lambda"))
+
+# ``dynamo`` builds its boto3 resource on import; no call reaches AWS.
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("METRICS_ENABLED", "0")
@@ -0,0 +1,82 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import alarm_engine  # noqa: E402
+import telemetry  # noqa: E402
+
+
+TOPIC = "sait/user-1/boiler-3/temperature"
+
+
+def _rule(**fields):
+    rule = {"userId": "user-1", "topic": TOPIC, "variable": "temp",
+            "condition": ">", "value": 50, "waitTime": 0, "hysteresis": 0}
+    rule.update(fields)
+    return rule
+
+
+def test_split_topic_takes_the_last_two_levels():
+    assert telemetry.split_topic(TOPIC) == ("boiler-3", "temperature")
+    assert telemetry.split_topic("boiler-3/temperature") == ("boiler-3", "temperature")
+    assert telemetry.split_topic("temperature") == (None, None)
+
+
+def test_rule_fires_on_the_series_ingest_writes():
+    pytest.importorskip("paho.mqtt", reason="ingest needs paho-mqtt")
+    import ingest
+
+    router = ingest.TopicRouter([("user-1", "sait/user-1/#")])
+    user, series = router.route(TOPIC)
+    assert user == "user-1"
+
+    index = alarm_engine.RuleIndex([_rule()])
+    assert index.skipped == 0
+    assert list(index.variables(series)) == ["temp"]
+
+    group = index.group(series, "temp")
+    ts = np.array([1_000, 2_000, 3_000], dtype=np.int64)
+    _, fired, _ = alarm_engine.evaluate(
+        group, ts, np.array([20.0, 60.0, 70.0]), alarm_engine.initial_state(len(group))
+    )
+    assert fired == [(0, 1)]
+
+
+def _run(rule, batches):
+    group = alarm_engine.RuleIndex([rule]).groups[(alarm_engine.rule_series(rule), "temp")]
+    state = alarm_engine.initial_state(1)
+    out = []
+    for ts, values in batches:
+        state, fired, cleared = alarm_engine.evaluate(
+            group, np.array(ts, dtype=np.int64), np.array(values, dtype=float), state
+        )
+        out.append(([sample for _, sample in fired], list(cleared)))
+    return out
+
+
+def test_wait_time_debounces_the_condition():
+    rule = _rule(waitTime=2)
+    assert _run(rule, [([0, 1_000, 2_000, 3_000], [60, 60, 60, 60])]) == [([2], [])]
+
+
+def test_debounce_restarts_when_the_condition_drops_and_carries_across_batches():
+    rule = _rule(waitTime=2)
+    assert _run(rule, [
+        ([0, 1_000, 2_000, 3_000], [60, 20, 60, 60]),
+        ([4_000], [60]),
+    ]) == [([], []), ([0], [])]
+
+
+def test_hysteresis_holds_the_alarm_until_the_value_moves_back_far_enough():
+    rule = _rule(hysteresis=5)
+    assert _run(rule, [
+        ([0, 1_000], [60, 47]),
+        ([2_000], [46]),
+        ([3_000], [44]),
+        ([4_000], [51]),
+    ]) == [([0], []), ([], []), ([], [0]), ([0], [])]
+
+
+def test_replayed_batch_fires_nothing_new():
+    batch = ([1_000, 2_000], [20, 60])
+    assert _run(_rule(), [batch, batch]) == [([1], []), ([], [])]
@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("boto3")
+import alarm_mail  # noqa: E402
+from ratelimit import TokenBucket  # noqa: E402
+
+RECIPIENT = "ops@example.com"
+ROWS = [{"recipient": RECIPIENT, "eventId": "e1"}]
+
+
+@pytest.fixture
+def outbox(monkeypatch):
+    results, deleted = [], []
+    monkeypatch.setattr(alarm_mail, "due_digests", lambda now_ms: {f"{RECIPIENT}#0": ROWS})
+    monkeypatch.setattr(alarm_mail, "quarantined", lambda recipient: None)
+    monkeypatch.setattr(alarm_mail, "send_digest", lambda recipient, rows: results.pop(0))
+    monkeypatch.setattr(alarm_mail, "_delete", lambda pk, rows: deleted.append(pk))
+    monkeypatch.setattr(alarm_mail.pool, "close", lambda: None)
+    alarm_mail._recipient_buckets.clear()
+    return results, deleted
+
+
+def _fail_with(error):
+    def send(recipient, rows):
+        raise error
+    return send
+
+
+def test_failed_send_gives_the_recipient_token_back(outbox):
+    results, deleted = outbox
+    results += [(False, None), (True, None)]
+
+    assert alarm_mail.dispatch(0)["failed"] == 1
+    # The retry goes out on the next run instead of waiting out the hourly budget.
+    assert alarm_mail.dispatch(0)["sent"] == 1
+    assert deleted == [f"{RECIPIENT}#0"]
+    assert alarm_mail.dispatch(0)["deferred"] == 1
+
+
+def test_unreachable_server_gives_the_recipient_token_back(outbox, monkeypatch):
+    monkeypatch.setattr(alarm_mail, "send_digest", _fail_with(ConnectionError("down")))
+    assert alarm_mail.dispatch(0)["failed"] == 1
+    assert alarm_mail.recipient_bucket(RECIPIENT).try_acquire()
+
+
+def test_release_never_fills_past_capacity():
+    now = [0.0]
+    bucket = TokenBucket(1, capacity=2, clock=lambda: now[0])
+    assert bucket.try_acquire(2)
+    bucket.release()
+    bucket.release(5)
+    assert bucket.try_acquire(2)
+    assert not bucket.try_acquire()
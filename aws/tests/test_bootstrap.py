@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+pytest.importorskip("boto3")
+import bootstrap  # noqa: E402
+
+DEVICES = [
+    {"deviceId": "d2", "name": "Caldera", "username": "u2"},
+    {"deviceId": "d1", "name": "Bomba", "username": "u1", "credentialsRef": "secret/d1"},
+]
+TOPICS = [
+    {"deviceId": "d1", "subtopic": "temp", "topic": "sait/user-1/d1/temp",
+     "lastSeen": 1_700_000_123_456},
+    {"deviceId": "d1", "subtopic": "hum", "topic": "sait/user-1/d1/hum",
+     "lastSeen": 1_700_000_000_000},
+]
+
+
+@pytest.fixture
+def fleet(monkeypatch):
+    state = {"topics": TOPICS}
+    monkeypatch.setattr(bootstrap, "devices", lambda user_id: DEVICES)
+    monkeypatch.setattr(bootstrap, "topics", lambda user_id: state["topics"])
+    return state
+
+
+def _get(if_none_match=None):
+    headers = {"If-None-Match": if_none_match} if if_none_match else {}
+    event = {"httpMethod": "GET", "resource": "/bootstrap", "headers": headers,
+             "queryStringParameters": {"userId": "user-1"}}
+    return bootstrap.lambda_handler(event, None)
+
+
+def test_fleet_joins_devices_and_topics():
+    devices = bootstrap.fleet(DEVICES, TOPICS)
+    assert [device["deviceId"] for device in devices] == ["d1", "d2"]
+    pump = devices[0]
+    assert [entry["subtopic"] for entry in pump["subtopics"]] == ["hum", "temp"]
+    assert pump["credentials"] == {"username": "u1", "ref": "secret/d1"}
+    assert pump["lastSeen"] == bootstrap._rounded(1_700_000_123_456)
+    assert devices[1]["credentials"]["ref"] == "d2"
+    assert devices[1]["lastSeen"] is None
+
+
+def test_matching_if_none_match_is_a_304_without_body(fleet):
+    first = _get()
+    etag = first["headers"]["ETag"]
+    assert first["statusCode"] == 200
+    assert json.loads(first["body"])["devices"]
+
+    for if_none_match in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        again = _get(if_none_match)
+        assert again["statusCode"] == 304
+        assert not again["body"]
+        assert again["headers"]["ETag"] == etag
+
+
+def test_etag_ignores_last_seen_jitter_but_not_new_data(fleet):
+    etag = _get()["headers"]["ETag"]
+
+    fleet["topics"] = [dict(TOPICS[0], lastSeen=TOPICS[0]["lastSeen"] + 1), TOPICS[1]]
+    assert _get(etag)["statusCode"] == 304
+
+    fleet["topics"] = TOPICS[:1]
+    changed = _get(etag)
+    assert changed["statusCode"] == 200
+    assert changed["headers"]["ETag"] != etag
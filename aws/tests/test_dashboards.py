@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+pytest.importorskip("boto3")
+import dashboards  # noqa: E402
+
+NOW = "2025-01-01T00:00:00Z"
+
+
+def _components(count, subdashboard_id="s1", **fields):
+    return dashboards.parse_changes({"adds": [
+        dict({"type": "component", "id": f"c{i}", "subdashboardId": subdashboard_id}, **fields)
+        for i in range(count)
+    ]})
+
+
+def _writes(transaction):
+    return [action for _, action in transaction]
+
+
+def test_transactions_stay_within_the_write_limit_counting_children_updates():
+    changes = _components(250)
+    groups = dashboards.transactions("user-1", changes, NOW)
+
+    # Each group holds its components plus one ``children`` update of s1.
+    assert [len(group) for group in groups] == [100, 100, 53]
+    assert sum(len(group) - 1 for group in groups) == 250
+    for group in groups:
+        parent = group[-1][1]["Update"]
+        assert parent["UpdateExpression"] == "ADD #children :delta"
+        assert parent["ExpressionAttributeValues"][":delta"] == {"N": str(len(group) - 1)}
+
+
+def test_transactions_stay_within_the_byte_limit(monkeypatch):
+    monkeypatch.setattr(dashboards, "TRANSACT_MAX_BYTES", 20_000)
+    changes = _components(40, formula="x" * 1_000)
+    groups = dashboards.transactions("user-1", changes, NOW)
+
+    assert len(groups) > 1
+    assert sum(len(group) - 1 for group in groups) == 40
+    for group in groups:
+        assert len(json.dumps(_writes(group))) <= dashboards.TRANSACT_MAX_BYTES
+
+
+def test_chunks_split_on_count_and_size(monkeypatch):
+    actions = [{"Put": {"Item": {"n": i}}} for i in range(250)]
+    assert [len(chunk) for chunk in dashboards.chunks(actions)] == [100, 100, 50]
+
+    monkeypatch.setattr(dashboards, "TRANSACT_MAX_BYTES", 100)
+    sizes = [len(json.dumps(chunk)) for chunk in dashboards.chunks(actions[:20])]
+    assert len(sizes) > 1 and all(size <= 100 for size in sizes)
+
+
+def test_change_sets_are_validated_up_front():
+    with pytest.raises(dashboards.HttpError):
+        dashboards.parse_changes({})
+    with pytest.raises(dashboards.HttpError):
+        dashboards.parse_changes({"adds": [{"type": "component", "id": "c1"}]})
+    with pytest.raises(dashboards.HttpError):
+        dashboards.parse_changes({
+            "adds": [{"type": "component", "id": "c1", "subdashboardId": "s1"}],
+            "deletes": [{"type": "subdashboard", "id": "s1"}],
+        })
+    updates = dashboards.parse_changes({"updates": [{"type": "subdashboard", "id": "s1"}]})
+    with pytest.raises(dashboards.HttpError):
+        dashboards.transactions("user-1", updates, NOW)
+
+
+def test_legacy_items_turn_the_old_document_into_rows():
+    document = {"dashboards": [
+        {"subdashboardId": 7, "subdashboardName": "Planta", "subdashboardColor": "#fff",
+         "components": [
+             {"id": "a", "chartType": "line", "variables": ["temp"], "colSize": 0.5},
+             {"id": "a", "chartType": "bar"},
+             {"chartType": "gauge"},
+             "garbage",
+         ]},
+        {"subdashboardName": "no id"},
+        "garbage",
+    ]}
+    items = dashboards.legacy_items("user-1", document, NOW)
+
+    subdashboard, *components = items
+    assert subdashboard["sk"] == "sub#7"
+    assert subdashboard["name"] == "Planta"
+    assert subdashboard["children"] == 3
+    assert [item["componentId"] for item in components] == ["a", "a-1", "2"]
+    assert [item["sk"] for item in components] == [
+        "sub#7#comp#a", "sub#7#comp#a-1", "sub#7#comp#2",
+    ]
+    assert components[0]["variables"] == ["temp"]
+    assert str(components[0]["colSize"]) == "0.5"
+    assert all(item["version"] == 1 and item["userId"] == "user-1" for item in items)
+    assert dashboards.legacy_items("user-1", None, NOW) == []
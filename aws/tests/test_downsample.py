@@ -0,0 +1,63 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import downsample  # noqa: E402
+
+
+def test_bucketize_aggregates_each_bucket_and_skips_nan():
+    ts = np.array([0, 10, 20, 35, 90], dtype=np.int64)
+    temp = np.array([1.0, 3.0, np.nan, 5.0, 7.0])
+    starts, width, stats = downsample.bucketize(ts, {"temp": temp}, 0, 100, 4)
+
+    assert width == 25
+    assert starts.tolist() == [0, 25, 50, 75]
+    temp = stats["temp"]
+    assert temp["count"].tolist() == [2, 1, 0, 1]
+    assert temp["sum"].tolist() == [4.0, 5.0, 0.0, 7.0]
+    assert downsample.to_list(temp["min"]) == [1.0, 5.0, None, 7.0]
+    assert downsample.to_list(temp["max"]) == [3.0, 5.0, None, 7.0]
+    assert downsample.to_list(temp["avg"]) == [2.0, 5.0, None, 7.0]
+    assert downsample.to_list(temp["last"]) == [3.0, 5.0, None, 7.0]
+
+
+def test_bucketize_ignores_samples_outside_the_window():
+    ts = np.array([-5, 0, 99, 100], dtype=np.int64)
+    _, _, stats = downsample.bucketize(ts, {"v": np.ones(4)}, 0, 100, 2)
+    assert stats["v"]["count"].tolist() == [1, 1]
+
+
+def test_merge_of_bucketized_rows_matches_bucketizing_the_raw_samples():
+    rng = np.random.default_rng(7)
+    ts = np.sort(rng.integers(0, 3_600_000, 500)).astype(np.int64)
+    values = rng.normal(20, 3, 500)
+    values[::7] = np.nan
+
+    minute_starts, width, minutes = downsample.bucketize(ts, {"v": values}, 0, 3_600_000, 60)
+    parts = {agg: minutes["v"][agg] for agg in ("count", "sum", "min", "max", "last")}
+    _, merged = downsample.merge(minute_starts, {"v": parts}, 0, 15 * width, 4)
+    _, _, direct = downsample.bucketize(ts, {"v": values}, 0, 3_600_000, 4)
+
+    for agg in ("count", "min", "max", "last"):
+        assert merged["v"][agg].tolist() == direct["v"][agg].tolist()
+    assert np.allclose(merged["v"]["avg"], direct["v"]["avg"])
+
+
+def test_lttb_keeps_the_ends_and_the_peaks():
+    ts = np.arange(1_000, dtype=np.int64) * 1_000
+    values = np.zeros(1_000)
+    values[333], values[666] = 50.0, -50.0
+
+    picked = downsample.lttb(ts, values, 20)
+
+    assert len(picked) == 20
+    assert picked[0] == 0 and picked[-1] == 999
+    assert np.all(np.diff(picked) > 0)
+    assert {333, 666} <= set(picked.tolist())
+
+
+def test_lttb_skips_nan_and_returns_short_series_whole():
+    ts = np.arange(5, dtype=np.int64)
+    values = np.array([1.0, np.nan, 2.0, 3.0, np.nan])
+    assert downsample.lttb(ts, values, 10).tolist() == [0, 2, 3]
+    assert downsample.lttb(ts, values, 2).tolist() == [0, 2, 3]
@@ -0,0 +1,94 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import formulas  # noqa: E402
+from formulas import FormulaError, compile_formula  # noqa: E402
+
+
+@pytest.mark.parametrize("text", [
+    "var1.real",
+    "var1[0]",
+    "'a' + var1",
+    "(lambda: 1)()",
+    "__import__('os')",
+    "[var1]",
+    "var1 if var2 else 0",
+    "var1 and var2",
+    "True + var1",
+    "foo + var1",
+    "np.sqrt(var1)",
+    "sqrt",
+    "sqrt + var1",
+    "max(var1, key=var2)",
+])
+def test_rejects_nodes_outside_the_whitelist(text):
+    with pytest.raises(FormulaError):
+        compile_formula(text)
+
+
+@pytest.mark.parametrize("text", [
+    "min()",
+    "max()",
+    "sqrt()",
+    "sqrt(var1, var2)",
+    "log(var1, 1, 2)",
+    "pow(var1)",
+    "atan2(var1)",
+    "round(var1, 2, 3)",
+])
+def test_rejects_wrong_argument_counts(text):
+    with pytest.raises(FormulaError, match="takes"):
+        compile_formula(text)
+
+
+def test_accepts_widget_syntax():
+    formula = compile_formula("max(var1, var2, 0) + log(var3, 10) + sqrt(var1^2) * pi")
+    assert formula.variables == ["var1", "var2", "var3"]
+
+
+def test_evaluates_over_arrays():
+    formula = compile_formula("(var1 - var2) / var3 * 100")
+    result = formula.evaluate({
+        "var1": np.array([10.0, 20.0, 30.0]),
+        "var2": np.array([0.0, 10.0, 30.0]),
+        "var3": np.array([10.0, 0.0, 0.0]),
+    })
+    assert result.dtype == np.float64
+    assert result[0] == 100.0
+    assert np.isinf(result[1])
+    assert np.isnan(result[2])
+
+
+def test_functions_and_comparisons_are_elementwise():
+    values = {"var1": np.array([1.0, 4.0, 9.0]), "var2": np.array([2.0, 2.0, 2.0])}
+    assert compile_formula("sqrt(var1)").evaluate(values).tolist() == [1.0, 2.0, 3.0]
+    assert compile_formula("min(var1, var2)").evaluate(values).tolist() == [1.0, 2.0, 2.0]
+    assert compile_formula("1 < var1 < 9").evaluate(values).tolist() == [0.0, 1.0, 0.0]
+    assert compile_formula("round(var1 / 3, 1)").evaluate(values).tolist() == [0.3, 1.3, 3.0]
+
+
+def test_result_is_broadcast_to_the_inputs():
+    values = {"var1": np.array([1.0, 2.0, 3.0])}
+    assert compile_formula("var1 * 0 + pi").evaluate(values).shape == (3,)
+    assert compile_formula("pow(var1, 2)").evaluate(values).tolist() == [1.0, 4.0, 9.0]
+
+
+def test_evaluation_errors_raise_formula_error():
+    values = {"var1": np.array([1.0, 2.0]), "var2": np.array([1.0, 2.0])}
+    with pytest.raises(FormulaError):
+        compile_formula("round(var1, var2)").evaluate(values)
+    with pytest.raises(FormulaError):
+        compile_formula("var1 + var2").evaluate({"var1": np.ones(2), "var2": np.ones(3)})
+    with pytest.raises(FormulaError, match="no values"):
+        compile_formula("var1 + var2").evaluate({"var1": np.ones(2)})
+
+
+def test_align_carries_values_forward():
+    axis, (first, second) = formulas.align([
+        ([1, 3], [10.0, 30.0]),
+        ([2], [np.nan]),
+    ])
+    assert axis.tolist() == [1, 2, 3]
+    assert first.tolist() == [10.0, 10.0, 30.0]
+    assert np.isnan(second).all()
@@ -0,0 +1,81 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import telemetry  # noqa: E402
+import telemetry_rollups as rollups  # noqa: E402
+
+SERIES = "user-1#boiler-3#temperature"
+MINUTE = 60_000
+HOUR = 3_600_000
+DAY = 86_400_000
+
+
+@pytest.mark.parametrize("span, points, expected", [
+    (120 * DAY, 100, "1d"),
+    (30 * DAY, 500, "1h"),
+    (2 * DAY, 500, "1m"),
+    (2 * HOUR, 500, None),
+])
+def test_pick_resolution_takes_the_coarsest_that_fills_the_chart(span, points, expected):
+    assert rollups.pick_resolution(0, span, points) == expected
+
+
+@pytest.fixture
+def raw(monkeypatch):
+    """Raw samples served to ``refresh_minutes``; the rollup writes it makes are recorded."""
+    samples = {"ts": [], "temp": []}
+    writes = []
+
+    def read_raw(series, start_ms, end_ms):
+        ts = np.array(samples["ts"], dtype=np.int64)
+        keep = (ts >= start_ms) & (ts <= end_ms)
+        return ts[keep], {"temp": np.array(samples["temp"], dtype=float)[keep]}, None
+
+    monkeypatch.setattr(telemetry, "read_raw", read_raw)
+    monkeypatch.setattr(rollups, "_write", writes.append)
+    return samples, writes
+
+
+def test_refresh_minutes_rewrites_each_minute_whole(raw):
+    samples, writes = raw
+    samples["ts"] += [HOUR + 1_000, HOUR + 30_000, HOUR + MINUTE + 5_000]
+    samples["temp"] += [20.0, 22.0, 30.0]
+
+    hours = rollups.refresh_minutes(SERIES, [HOUR, HOUR + MINUTE, HOUR + 2 * MINUTE])
+    # A replayed or late batch recomputes the same rows.
+    rollups.refresh_minutes(SERIES, [HOUR, HOUR + MINUTE, HOUR + 2 * MINUTE])
+
+    assert hours == {HOUR}
+    first, again = writes
+    assert first == again
+    puts = {r["PutRequest"]["Item"]["ts"]: r["PutRequest"]["Item"]
+            for r in first if "PutRequest" in r}
+    assert puts[HOUR]["n"] == 2
+    assert puts[HOUR]["count:temp"] == 2
+    assert float(puts[HOUR]["sum:temp"]) == 42.0
+    assert float(puts[HOUR]["min:temp"]) == 20.0
+    assert float(puts[HOUR]["last:temp"]) == 22.0
+    assert puts[HOUR + MINUTE]["n"] == 1
+    # A minute whose raw rows are gone loses its rollup row.
+    deletes = [r["DeleteRequest"]["Key"] for r in first if "DeleteRequest" in r]
+    assert deletes == [{"pk": rollups.rollup_key(SERIES, "1m"), "ts": HOUR + 2 * MINUTE}]
+
+
+def test_rebucket_aligns_buckets_to_the_resolution():
+    ts = np.arange(0, 6 * HOUR, HOUR, dtype=np.int64)
+    parts = rollups.empty_parts(len(ts))
+    parts["count"][:] = 1
+    for agg in ("sum", "min", "max", "last"):
+        parts[agg][:] = np.arange(len(ts), dtype=float)
+    messages = np.ones(len(ts), dtype=np.int64)
+
+    starts, width, stats, total = rollups.rebucket(
+        ts, messages, {"temp": parts}, HOUR // 2, 6 * HOUR - 1, 3, "1h"
+    )
+
+    assert width == 2 * HOUR
+    assert starts.tolist() == [0, 2 * HOUR, 4 * HOUR]
+    assert stats["temp"]["count"].tolist() == [2, 2, 2]
+    assert stats["temp"]["max"].tolist() == [1.0, 3.0, 5.0]
+    assert total == 6
@@ -0,0 +1,173 @@
+import json
+from decimal import Decimal
+
+import pytest
+
+pytest.importorskip("boto3")
+from botocore.exceptions import ClientError  # noqa: E402
+
+import dynamo  # noqa: E402
+import tickets  # noqa: E402
+
+BODY = {"userId": "user-1", "asunto": "Sin datos", "tipo": "soporte",
+        "descripcion": "El equipo no reporta", "prioridad": "alta"}
+
+
+def _event(method, resource, body=None, query=None, headers=None, path_params=None):
+    return {
+        "httpMethod": method,
+        "resource": resource,
+        "queryStringParameters": query,
+        "pathParameters": path_params,
+        "headers": headers or {},
+        "body": None if body is None else json.dumps(body),
+        "isBase64Encoded": False,
+    }
+
+
+def _call(event):
+    out = tickets.lambda_handler(event, None)
+    return out["statusCode"], out["headers"], json.loads(out["body"]) if out["body"] else None
+
+
+def _condition_failed(operation, item=None):
+    error = {"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}
+    if item is not None:
+        error["Item"] = dynamo.serialize_item(item)
+    return ClientError(error, operation)
+
+
+class FakeTable:
+    """The ``UserIdIndex`` query and conditional put of the tickets table, in memory."""
+
+    def __init__(self, items=()):
+        self.items = {item["ticketId"]: item for item in items}
+        self.queries = []
+
+    def put_item(self, Item, ConditionExpression, **kwargs):
+        if Item["ticketId"] in self.items:
+            raise _condition_failed("PutItem", self.items[Item["ticketId"]])
+        self.items[Item["ticketId"]] = Item
+
+    def query(self, Limit, ExclusiveStartKey=None, **kwargs):
+        self.queries.append(ExclusiveStartKey)
+        ordered = sorted(self.items.values(), key=lambda item: item["createdAt"], reverse=True)
+        if ExclusiveStartKey:
+            after = [item["ticketId"] for item in ordered].index(ExclusiveStartKey["ticketId"])
+            ordered = ordered[after + 1:]
+        page = {"Items": ordered[:Limit]}
+        if len(ordered) > Limit:
+            last = ordered[Limit - 1]
+            page["LastEvaluatedKey"] = {
+                key: last[key] for key in ("ticketId", "userId", "createdAt")
+            }
+        return page
+
+
+@pytest.fixture
+def table(monkeypatch):
+    fake = FakeTable()
+    monkeypatch.setattr(tickets, "table", fake)
+    tickets.cache.clear()
+    return fake
+
+
+def test_cursor_round_trips_and_rejects_garbage():
+    key = {"ticketId": "abc", "userId": "user-1", "n": Decimal("3")}
+    cursor = dynamo.encode_cursor(key)
+    assert "=" not in cursor
+    assert dynamo.decode_cursor(cursor) == key
+    assert dynamo.encode_cursor(None) is None
+    for bad in ("%%%", dynamo.encode_cursor({"a": ["list"]})[:-2], "W10"):
+        with pytest.raises(ValueError):
+            dynamo.decode_cursor(bad)
+
+
+def test_list_walks_every_page_once(table):
+    for i in range(5):
+        created = f"2025-01-0{i + 1}T00:00:00Z"
+        table.items[f"t{i}"] = dict(BODY, ticketId=f"t{i}", createdAt=created)
+
+    seen, cursor = [], None
+    while True:
+        query = {"userId": "user-1", "limit": "2"}
+        if cursor:
+            query["cursor"] = cursor
+        status, _, body = _call(_event("GET", "/tickets", query=query))
+        assert status == 200
+        seen += [ticket["ticketId"] for ticket in body["tickets"]]
+        cursor = body.get("nextCursor")
+        if not cursor:
+            break
+
+    assert seen == ["t4", "t3", "t2", "t1", "t0"]
+    assert len(table.queries) == 3
+
+
+def test_list_rejects_a_cursor_of_another_user(table):
+    cursor = dynamo.encode_cursor({"ticketId": "t0", "userId": "user-2"})
+    status, _, body = _call(
+        _event("GET", "/tickets", query={"userId": "user-1", "cursor": cursor})
+    )
+    assert status == 400
+    assert "userId" in body["error"]
+
+
+def test_idempotency_key_replays_the_original_ticket(table):
+    headers = {"Idempotency-Key": "retry-1"}
+    status, first_headers, first = _call(_event("POST", "/tickets", BODY, headers=headers))
+    assert status == 201
+    assert "Idempotent-Replayed" not in first_headers
+
+    status, replay_headers, replay = _call(_event("POST", "/tickets", BODY, headers=headers))
+    assert status == 201
+    assert replay_headers["Idempotent-Replayed"] == "true"
+    assert replay["ticketId"] == first["ticketId"]
+    assert len(table.items) == 1
+
+    other = dict(BODY, asunto="Otro asunto")
+    status, _, _ = _call(_event("POST", "/tickets", other, headers=headers))
+    assert status == 422
+
+
+def test_idempotent_ticket_id_is_per_user_and_key():
+    first = tickets._idempotent_ticket_id("user-1", "k")
+    assert first == tickets._idempotent_ticket_id("user-1", "k")
+    assert first != tickets._idempotent_ticket_id("user-2", "k")
+    assert first != tickets._idempotent_ticket_id("user-1", "k2")
+    with pytest.raises(tickets.HttpError):
+        tickets._idempotent_ticket_id("user-1", "x" * (tickets.MAX_IDEMPOTENCY_KEY + 1))
+
+
+class StaleClient:
+    """``update_item`` that always fails its condition, with ``current`` as the stored item."""
+
+    def __init__(self, current):
+        self.current = current
+
+    def update_item(self, **kwargs):
+        self.kwargs = kwargs
+        raise _condition_failed("UpdateItem", self.current)
+
+
+def _update(monkeypatch, current, if_match):
+    client = StaleClient(current)
+    monkeypatch.setattr(dynamo, "client", client, raising=False)
+    event = _event("PUT", "/tickets/{ticketId}", {"status": "cerrado"},
+                   headers={"If-Match": if_match}, path_params={"ticketId": "t1"})
+    return client, _call(event)
+
+
+def test_stale_if_match_is_a_409_with_the_current_ticket(monkeypatch):
+    current = dict(BODY, ticketId="t1", status="en proceso", version=4)
+    client, (status, headers, body) = _update(monkeypatch, current, '"3"')
+
+    assert status == 409
+    assert headers["ETag"] == '"4"'
+    assert body["current"]["status"] == "en proceso"
+    assert client.kwargs["ConditionExpression"].endswith("#version = :expected")
+
+
+def test_update_of_a_missing_ticket_is_a_404(monkeypatch):
+    _, (status, _, _) = _update(monkeypatch, None, '"3"')
+    assert status == 404
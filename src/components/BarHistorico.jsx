@@ -34,11 +34,15 @@ import PropTypes from "prop-types";
 // Registrar componentes de Chart.js
 ChartJS.register(CategoryScale, LinearScale, BarElement, Title, ChartTooltip, Legend, ChartDataLabels);
 
-// Función para convertir fechas a formato ISO local
+// Función para convertir fechas a formato ISO local, con el desfase UTC del
+// navegador (p. ej. -05:00) para que el servidor no las lea como UTC
 const toLocalISOString = (date) => {
   const pad = (num) => num.toString().padStart(2, "0");
+  const offset = -date.getTimezoneOffset();
+  const sign = offset >= 0 ? "+" : "-";
+  const offsetText = `${sign}${pad(Math.floor(Math.abs(offset) / 60))}:${pad(Math.abs(offset) % 60)}`;
 
-  return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}T${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}`;
+  return `${date.getFullYear()}-${pad(date.getMonth() + 1)}-${pad(date.getDate())}T${pad(date.getHours())}:${pad(date.getMinutes())}:${pad(date.getSeconds())}${offsetText}`;
 };
 
 const BarHistorico = ({ userId, title, variables = [], fetchHistoricalData, height }) => {
@@ -36,6 +36,7 @@ import FormulaComponent from "./FormulaComponent";
 import "chartjs-adapter-date-fns";
 import Edit from '@mui/icons-material/Edit';
 import Delete from '@mui/icons-material/Delete';
+import { SAIT_API_URL } from "../config";
 
 // Paleta de colores profesional y sobria (tomada de DashboardConfig)
 const themeColors = {
@@ -237,9 +238,9 @@ const Dashboard = () => {
         const allowedSubdashboards = JSON.parse(localStorage.getItem("subdashboards")) || [];
         let apiUrl;
         if (userType === "root") {
-          apiUrl = `https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}&userType=${userType}`;
+          apiUrl = `${SAIT_API_URL}/dashboards?userId=${userId}&userType=${userType}`;
         } else {
-          apiUrl = `https://7yk7p0l3d9.execute-api.us-east-1.amazonaws.com/getsubdashboarid?userId=${userId}&allowedSubdashboards=${allowedSubdashboards.join(
+          apiUrl = `${SAIT_API_URL}/dashboards?userId=${userId}&allowedSubdashboards=${allowedSubdashboards.join(
             ","
           )}&userType=${userType}`;
         }
@@ -15,6 +15,7 @@ import StackedBarChartComponent from "./StackedBarChartComponent";
 import Sidebar from "./Navbar";
 import { MqttContext } from "./MqttContext";
 import { motion } from "framer-motion";
+import { SAIT_API_URL } from "../config";
 
 const Dashboard1 = () => {
   const { mqttData, subscribeToTopic } = useContext(MqttContext);
@@ -55,7 +56,7 @@ const Dashboard1 = () => {
 
       try {
         const response = await fetch(
-          `https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}`
+          `${SAIT_API_URL}/dashboards?userId=${userId}`
         );
 
         if (!response.ok) {
@@ -57,6 +57,7 @@ import AreaHistorico from "./AreaHistorico";
 import StackedBarHistorico from "./StackedBarHistorico";
 import FormulaComponent from "./FormulaComponent";
 import "chartjs-adapter-date-fns";
+import { SAIT_API_URL } from "../config";
 
 // Paleta de colores profesional y sobria
 const themeColors = {
@@ -201,7 +202,7 @@ const DashboardConfig = () => {
       setIsLoading(true);
       try {
         const response = await fetch(
-          `https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}`
+          `${SAIT_API_URL}/dashboards?userId=${userId}`
         );
         if (!response.ok) {
           const errorData = await response.json();
@@ -215,6 +216,7 @@ const DashboardConfig = () => {
           id: d.subdashboardId,
           name: d.subdashboardName,
           color: d.subdashboardColor,
+          version: d.version,
         }));
         const componentsFromDB = dashboards.flatMap((d) =>
           d.components.map((comp) => ({
@@ -327,11 +329,16 @@ const DashboardConfig = () => {
     newComponent.subdashboardId = activeSubdashboard.id;
     if (editingIndex !== null) {
       const updatedComponents = [...components];
-      updatedComponents[editingIndex] = newComponent;
+      // Conserva el id y la versión con los que se guarda el cambio
+      updatedComponents[editingIndex] = {
+        ...newComponent,
+        id: components[editingIndex].id ?? newItemId(),
+        version: components[editingIndex].version,
+      };
       setComponents(updatedComponents);
       showSnackbar("Componente actualizado correctamente", "success");
     } else {
-      setComponents([...components, newComponent]);
+      setComponents([...components, { ...newComponent, id: newItemId() }]);
       showSnackbar("Nuevo componente añadido", "success");
     }
     setModalOpen(false);
@@ -384,10 +391,18 @@ const DashboardConfig = () => {
       showSnackbar("Este componente no puede eliminarse.", "error");
       return;
     }
-    setDeletionQueue((prev) => [
-      ...prev,
-      { type: "component", id: deletedComponent.subdashboardId }
-    ]);
+    // Solo los componentes ya guardados tienen algo que borrar en el servidor
+    if (deletedComponent.version) {
+      setDeletionQueue((prev) => [
+        ...prev,
+        {
+          type: "component",
+          id: String(deletedComponent.id),
+          subdashboardId: String(deletedComponent.subdashboardId),
+          version: deletedComponent.version,
+        },
+      ]);
+    }
     setComponents((prev) => prev.filter((_, i) => i !== globalIndex));
     showSnackbar("Componente eliminado", "success");
   };
@@ -399,10 +414,19 @@ const DashboardConfig = () => {
       showSnackbar("Este subdashboard no puede eliminarse.", "error");
       return;
     }
-    setDeletionQueue((prev) => [
-      ...prev,
-      { type: "subdashboard", id: deletedSubdashboard.id }
-    ]);
+    // El servidor borra también sus componentes
+    if (deletedSubdashboard.version) {
+      setDeletionQueue((prev) => [
+        ...prev.filter(
+          (item) => String(item.subdashboardId) !== String(deletedSubdashboard.id)
+        ),
+        {
+          type: "subdashboard",
+          id: String(deletedSubdashboard.id),
+          version: deletedSubdashboard.version,
+        },
+      ]);
+    }
     setSubdashboards((prev) => prev.filter((_, i) => i !== index));
     setComponents((prev) =>
       prev.filter((comp) => comp.subdashboardId !== deletedSubdashboard.id)
@@ -494,94 +518,141 @@ const DashboardConfig = () => {
     }
   };
   
+  const newItemId = () =>
+    window.crypto?.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+
+  const subdashboardFields = (sub) => ({
+    name: sub.name?.trim() || "Subdashboard sin nombre",
+    color: sub.color || "#FFFFFF",
+  });
+
+  const componentFields = (comp) => {
+    const componentData = {
+      chartType: comp.chartType || "Sin tipo de gráfico",
+      componentName: comp.componentName?.trim() || "Componente sin nombre",
+      variables: (comp.variables || []).map((variable) => {
+        const segments = variable.variable.split("/");
+        const topic = segments.slice(0, segments.length - 1).join("/");
+        const subtopic = segments[segments.length - 1];
+        return {
+          variable: variable.variable?.trim() || "Variable sin nombre",
+          topic: topic || "Sin topic",
+          subtopic: subtopic || "Sin subtopic",
+          value: variable.value || "Sin value",
+          color: variable.color || "#000000",
+          type: variable.type || "bar",
+        };
+      }),
+      colSize: comp.colSize || "col6",
+      height: typeof comp.height === "number" ? comp.height : 400,
+    };
+
+    if (comp.chartType === "FormulaComponent") {
+      componentData.formula = comp.formula || "";
+      componentData.formulaDisplayType = comp.formulaDisplayType || "number";
+      componentData.formulaUnit = comp.formulaUnit || "";
+      if (comp.formulaDisplayType === "gauge") {
+        componentData.formulaMin = comp.formulaMin !== undefined ? comp.formulaMin : 0;
+        componentData.formulaMax = comp.formulaMax !== undefined ? comp.formulaMax : 100;
+      }
+    }
+    return componentData;
+  };
+
+  // Solo lo que cambió desde la última carga o guardado
+  const buildChangeSet = () => {
+    const componentKey = (comp) => `${comp.subdashboardId}:${comp.id}`;
+    const savedSubdashboards = new Map(
+      originalSubdashboards.map((sub) => [String(sub.id), sub])
+    );
+    const savedComponents = new Map(
+      originalComponents.map((comp) => [componentKey(comp), comp])
+    );
+    const adds = [];
+    const updates = [];
+    subdashboards.forEach((sub) => {
+      const fields = subdashboardFields(sub);
+      const entry = { type: "subdashboard", id: String(sub.id), ...fields };
+      const saved = savedSubdashboards.get(String(sub.id));
+      if (!sub.version) {
+        adds.push(entry);
+      } else if (saved && JSON.stringify(subdashboardFields(saved)) !== JSON.stringify(fields)) {
+        updates.push({ ...entry, version: sub.version });
+      }
+    });
+    components.forEach((comp) => {
+      const fields = componentFields(comp);
+      const entry = {
+        type: "component",
+        id: String(comp.id),
+        subdashboardId: String(comp.subdashboardId),
+        ...fields,
+      };
+      const saved = savedComponents.get(componentKey(comp));
+      if (!comp.version) {
+        adds.push(entry);
+      } else if (saved && JSON.stringify(componentFields(saved)) !== JSON.stringify(fields)) {
+        updates.push({ ...entry, version: comp.version });
+      }
+    });
+    return { adds, updates, deletes: deletionQueue };
+  };
+
   const handleSaveDashboard = async () => {
     if (!userId) {
       showSnackbar("El usuario no está logueado.", "error");
       return;
     }
-    if (!subdashboards.length && !deletionQueue.length) {
-      showSnackbar("No hay subdashboards o eliminaciones pendientes.", "warning");
+    const changes = buildChangeSet();
+    if (!changes.adds.length && !changes.updates.length && !changes.deletes.length) {
+      showSnackbar("No hay cambios pendientes.", "warning");
       return;
     }
     try {
       setIsLoading(true);
-      for (const item of deletionQueue) {
-        const deleteResponse = await fetch(
-          `https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}&type=${item.type}&id=${item.id}`,
-          {
-            method: "DELETE",
-            headers: {
-              Authorization: `Bearer ${localStorage.getItem("token")}`,
-            },
-          }
-        );
-        if (!deleteResponse.ok) {
-          const errorData = await deleteResponse.json();
-          console.error("Error al eliminar:", errorData);
-          showSnackbar(`Error: ${errorData.error || "No se pudo eliminar."}`, "error");
-          return;
-        }
-      }
-      setDeletionQueue([]);
-      const payload = {
-        userId,
-        subdashboards: subdashboards.map((sub) => ({
-          id: sub.id?.toString(),
-          name: sub.name?.trim() || "Subdashboard sin nombre",
-          color: sub.color || "#FFFFFF",
-        })),
-        components: components.map((comp) => {
-          const componentData = {
-            subdashboardId: comp.subdashboardId?.toString(),
-            chartType: comp.chartType || "Sin tipo de gráfico",
-            componentName: comp.componentName?.trim() || "Componente sin nombre",
-            variables: (comp.variables || []).map((variable) => {
-              const segments = variable.variable.split("/");
-              const topic = segments.slice(0, segments.length - 1).join("/");
-              const subtopic = segments[segments.length - 1];
-              return {
-                variable: variable.variable?.trim() || "Variable sin nombre",
-                topic: topic || "Sin topic",
-                subtopic: subtopic || "Sin subtopic",
-                value: variable.value || "Sin value",
-                color: variable.color || "#000000",
-                type: variable.type || "bar",
-              };
-            }),
-            colSize: comp.colSize || "col6",
-            height: typeof comp.height === "number" ? comp.height : 400,
-          };
-
-          if (comp.chartType === "FormulaComponent") {
-            componentData.formula = comp.formula || "";
-            componentData.formulaDisplayType = comp.formulaDisplayType || "number";
-            componentData.formulaUnit = comp.formulaUnit || "";
-            if (comp.formulaDisplayType === "gauge") {
-              componentData.formulaMin = comp.formulaMin !== undefined ? comp.formulaMin : 0;
-              componentData.formulaMax = comp.formulaMax !== undefined ? comp.formulaMax : 100;
-            }
-          }
-
-          return componentData;
-        }),
-      };
       const response = await fetch(
-        "https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboards",
+        `${SAIT_API_URL}/dashboards`,
         {
-          method: "POST",
+          method: "PATCH",
           headers: {
             "Content-Type": "application/json",
             Authorization: `Bearer ${localStorage.getItem("token")}`,
           },
-          body: JSON.stringify(payload),
+          body: JSON.stringify({ userId, ...changes }),
         }
       );
+      const data = await response.json();
+      if (response.status === 409) {
+        console.error("Conflicto al guardar:", data);
+        showSnackbar(
+          "El panel fue modificado en otra sesión. Recarga la página para ver los cambios.",
+          "error"
+        );
+        return;
+      }
       if (!response.ok) {
-        const errorData = await response.json();
-        console.error("Error al guardar:", errorData);
-        showSnackbar(`Error: ${errorData.error || "No se pudo guardar."}`, "error");
+        console.error("Error al guardar:", data);
+        showSnackbar(`Error: ${data.error || "No se pudo guardar."}`, "error");
         return;
       }
+      const versions = new Map(
+        data.versions.map((v) => [`${v.type}:${v.subdashboardId ?? ""}:${v.id}`, v.version])
+      );
+      const savedSubdashboards = subdashboards.map((sub) => ({
+        ...sub,
+        version: versions.get(`subdashboard::${sub.id}`) ?? sub.version,
+      }));
+      const savedComponents = components.map((comp) => ({
+        ...comp,
+        version: versions.get(`component:${comp.subdashboardId}:${comp.id}`) ?? comp.version,
+      }));
+      setSubdashboards(savedSubdashboards);
+      setOriginalSubdashboards(savedSubdashboards);
+      setComponents(savedComponents);
+      setOriginalComponents(savedComponents);
+      setDeletionQueue([]);
       showSnackbar("Panel guardado exitosamente.", "success");
     } catch (error) {
       console.error("Error en la solicitud:", error);
@@ -12,6 +12,7 @@ import {
 } from '@mui/icons-material';
 import Sidebar from './Navbar';
 import './Subcuenta.css';
+import { SAIT_API_URL } from '../config';
 
 const Subcuenta = () => {
   const theme = useTheme();
@@ -59,7 +60,7 @@ const Subcuenta = () => {
       if (!userId) return setSnackbar({ open: true, message: "El usuario no está logueado.", severity: 'error' });
       setPageLoading(true);
       try {
-        const response = await fetch(`https://5kkoyuzfrf.execute-api.us-east-1.amazonaws.com/dashboard?userId=${userId}`);
+        const response = await fetch(`${SAIT_API_URL}/dashboards?userId=${userId}`);
         if (!response.ok) throw new Error((await response.json()).error || "Error al cargar subdashboards.");
         const data = await response.json();
         setSubdashboards(data.dashboards.map(d => ({ id: d.subdashboardId, name: d.subdashboardName })));
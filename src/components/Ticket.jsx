@@ -1,4 +1,4 @@
-import React, { useState, useContext } from 'react';
+import React, { useState, useContext, useRef } from 'react';
 import {
   Container,
   Paper,
@@ -34,6 +34,18 @@ import {
 } from '@mui/icons-material';
 import Sidebar from './Navbar';
 import { MqttContext } from './MqttContext';
+import { SAIT_API_URL } from '../config';
+
+// crypto.randomUUID solo existe en contextos seguros (HTTPS o localhost) y en
+// navegadores recientes; getRandomValues también funciona sobre HTTP.
+const newIdempotencyKey = () => {
+  if (window.crypto?.randomUUID) return window.crypto.randomUUID();
+  if (window.crypto?.getRandomValues) {
+    const bytes = window.crypto.getRandomValues(new Uint8Array(16));
+    return Array.from(bytes, (b) => b.toString(16).padStart(2, '0')).join('');
+  }
+  return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+};
 
 const Ticket = () => {
   const context = useContext(MqttContext);
@@ -57,9 +69,12 @@ const Ticket = () => {
   const [snackbarMessage, setSnackbarMessage] = useState('');
   const [snackbarSeverity, setSnackbarSeverity] = useState('success');
   const [loading, setLoading] = useState(false);
+  // Misma clave para los reintentos de un mismo envío: el backend no duplica el ticket
+  const idempotencyKeyRef = useRef(null);
 
   const handleChange = (e) => {
     const { name, value } = e.target;
+    idempotencyKeyRef.current = null;
     setTicketData(prevState => ({
       ...prevState,
       [name]: value
@@ -85,12 +100,17 @@ const Ticket = () => {
       return;
     }
   
+    if (!idempotencyKeyRef.current) {
+      idempotencyKeyRef.current = newIdempotencyKey();
+    }
+
     try {
       setLoading(true);
-      const response = await fetch('https://l11lxg6l12.execute-api.us-east-1.amazonaws.com/tickets', {
+      const response = await fetch(`${SAIT_API_URL}/tickets`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          'Idempotency-Key': idempotencyKeyRef.current,
         },
         body: JSON.stringify({
           ...ticketData,
@@ -106,6 +126,7 @@ const Ticket = () => {
       const data = await response.json();
       console.log('Ticket enviado:', data);
   
+      idempotencyKeyRef.current = null;
       setSnackbarMessage('Ticket enviado exitosamente');
       setSnackbarSeverity('success');
       setOpenSnackbar(true);
@@ -0,0 +1,4 @@
+// Base URL of the API deployed from aws/template.yaml (tickets, dashboards, ...).
+// Set VITE_SAIT_API_URL to point a build at another stage.
+export const SAIT_API_URL =
+  import.meta.env.VITE_SAIT_API_URL || "https://l11lxg6l12.execute-api.us-east-1.amazonaws.com";